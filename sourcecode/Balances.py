@@ -0,0 +1,157 @@
+from typing import Any
+
+import numpy as np
+
+from BlockTree import BlockTree
+
+
+def transfers(transactions: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    balance changes of the transactions in order: account indices, signed
+    amounts and which of them are debits (the coinbase has no sender)
+    '''
+    count = len(transactions)
+    senders = np.fromiter((transaction.from_id.index if transaction.from_id else -1
+                           for transaction in transactions), dtype=np.int64, count=count)
+    receivers = np.fromiter((transaction.to_id.index for transaction in transactions),
+                            dtype=np.int64, count=count)
+    amounts = np.fromiter((transaction.amount for transaction in transactions),
+                          dtype=np.float64, count=count)
+    # debit of the sender then credit of the receiver, for every transaction
+    accounts = np.column_stack((senders, receivers)).ravel()
+    signed_amounts = np.column_stack((-amounts, amounts)).ravel()
+    debits = np.zeros(2*count, dtype=bool)
+    debits[0::2] = True
+    kept = accounts >= 0
+    return accounts[kept], signed_amounts[kept], debits[kept]
+
+
+class BranchBalances:
+    '''
+    Balances of every account at every block of a block tree, in arrays
+    indexed by the dense index of the accounts (peer.index).
+
+    A block only stores the accounts its transactions touch, with their
+    balances before and after the block. The full balances are kept at a
+    single block (the view, normally the tip of the longest chain) and are
+    moved to another block by restoring the "before" balances up to the
+    common ancestor and setting the "after" balances down to the block.
+    The amounts of a block are added with np.add.at, one after the other
+    in the order of the transactions, so the balances are exactly those
+    of adding them one by one.
+    '''
+    NO_CHANGES = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+
+    def __init__(self, tree: BlockTree, root: Any, initial_balances: dict[Any, float]):
+        self.__tree = tree
+        size = max(account.index for account in initial_balances) + 1
+        self.__accounts: list = [None] * size  # index -> account
+        self.__view = np.zeros(size)
+        for account, balance in initial_balances.items():
+            self.__accounts[account.index] = account
+            self.__view[account.index] = balance
+        # block -> (account indices, balances before, balances after) of the accounts it touches
+        self.__changes: dict[Any, tuple[np.ndarray, np.ndarray, np.ndarray]] = {
+            root: self.NO_CHANGES}
+        self.__view_block = root
+        # (block, number of transactions, transfers) of the last block seen
+        self.__last_transfers: tuple = (None, 0, None)
+
+    def __contains__(self, block) -> bool:
+        return block in self.__changes
+
+    def __transfers(self, block: Any) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        transfers of the block, computed once when it is validated and added
+        '''
+        last_block, num_transactions, last_transfers = self.__last_transfers
+        if last_block is block and num_transactions == len(block.transactions):
+            return last_transfers
+        block_transfers = transfers(block.transactions)
+        self.__last_transfers = (
+            block, len(block.transactions), block_transfers)
+        return block_transfers
+
+    def can_pay(self, block: Any) -> bool:
+        '''
+        the sender of every transaction of the block has at least its amount
+        after the parent of the block, every transaction on its own
+        '''
+        accounts, amounts, debits = self.__transfers(block)
+        balances = self.at(block.prev_block)
+        return bool(np.all(balances[accounts[debits]] >= -amounts[debits]))
+
+    def add_block(self, block: Any):
+        '''
+        record the balances changed by the transactions of the block,
+        its parent must have been added (and the block to the tree)
+        '''
+        accounts, amounts, _ = self.__transfers(block)
+        balances = self.at(block.prev_block)
+        touched, positions = np.unique(accounts, return_inverse=True)
+        before = balances[touched]
+        after = before.copy()
+        np.add.at(after, positions, amounts)
+        self.__changes[block] = (touched, before, after)
+
+    def at(self, block: Any) -> np.ndarray:
+        '''
+        balances of every account after the block, by account index
+        (do not modify)
+        '''
+        if block is not self.__view_block:
+            self.__move_view(block)
+        return self.__view
+
+    def __path(self, source: Any, target: Any) -> tuple[list, list]:
+        '''
+        blocks from source up to the common ancestor (excluded) and from
+        the common ancestor (excluded) down to target
+        '''
+        height = self.__tree.height
+        up, down = [], []
+        while height(target) > height(source):
+            down.append(target)
+            target = target.prev_block
+        while height(source) > height(target):
+            up.append(source)
+            source = source.prev_block
+        while source is not target:
+            up.append(source)
+            source = source.prev_block
+            down.append(target)
+            target = target.prev_block
+        down.reverse()
+        return up, down
+
+    def __move_view(self, block: Any):
+        up, down = self.__path(self.__view_block, block)
+        view, changes = self.__view, self.__changes
+        for changed_block in up:
+            touched, before, _ = changes[changed_block]
+            view[touched] = before
+        for changed_block in down:
+            touched, _, after = changes[changed_block]
+            view[touched] = after
+        self.__view_block = block
+
+    def finalize(self, block: Any, pruned: list):
+        '''
+        drop the changes of the pruned blocks, block becomes the lowest one
+        the balances can be computed at (with its descendants)
+        '''
+        if not self.__tree.is_ancestor(block, self.__view_block):
+            self.__move_view(block)
+        for pruned_block in pruned:
+            del self.__changes[pruned_block]
+        self.__changes[block] = self.NO_CHANGES
+
+    def changed_accounts(self, source: Any, target: Any) -> dict[Any, None]:
+        '''
+        accounts whose balance may differ between the two blocks (ordered set)
+        '''
+        accounts = {}
+        for block in sum(self.__path(source, target), []):
+            accounts.update(dict.fromkeys(
+                map(self.__accounts.__getitem__, self.__changes[block][0].tolist())))
+        return accounts
@@ -1,52 +1,113 @@
 from typing import Any
 import random
 from copy import deepcopy
-from functools import reduce
 from Transaction import Transaction, CoinBaseTransaction
+from Mempool import Mempool
+from OrphanPool import OrphanPool
 import logging
 import hashlib
+import heapq
 
-from config import CONFIG
-from DiscreteEventSim import simulation, Event, EventType
-from utils import expon_distribution, generate_random_id
+from DiscreteEventSim import Simulation, Event, EventType
+from utils import generate_random_id, set_state
+from logger import LazyDescription
 
 logger = logging.getLogger(__name__)
 
 
+def sha256(data: str) -> str:
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class MerkleTree:
+    '''
+    Merkle tree of the transaction ids of a block, an odd node is paired
+    with itself (as in bitcoin). Appending a transaction only updates the
+    last node of every level.
+    '''
+
+    def __init__(self, transaction_ids: list[str]):
+        level = [sha256(transaction_id) for transaction_id in transaction_ids]
+        self.levels: list[list[str]] = [level]
+        while len(level) > 1:
+            level = [sha256(level[i] + level[min(i + 1, len(level) - 1)])
+                     for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    @property
+    def root(self) -> str:
+        return self.levels[-1][0] if self.levels[0] else None
+
+    def append(self, transaction_id: str):
+        levels = self.levels
+        levels[0].append(sha256(transaction_id))
+        depth = 0
+        while len(levels[depth]) > 1:
+            level = levels[depth]
+            if depth + 1 == len(levels):
+                levels.append([])
+            parent = (len(level) - 1)//2
+            left = level[2*parent]
+            right = level[2*parent + 1] if 2*parent + 1 < len(level) else left
+            if parent < len(levels[depth + 1]):
+                levels[depth + 1][parent] = sha256(left + right)
+            else:
+                levels[depth + 1].append(sha256(left + right))
+            depth += 1
+
+
 class Block:
 
-    def __init__(self, prev_block, transactions: list[Transaction], miner: any, timestamp: float):
-        self.block_id: int = generate_random_id(4)
+    def __init__(self, prev_block, transactions: list[Transaction], miner: any, timestamp: float, rng: random.Random = random):
+        self.block_id: int = generate_random_id(4, rng)
         self.prev_block: "Block" = prev_block
         self.transactions: list[Transaction] = transactions
         self.timestamp: float = timestamp
         self.miner: any = miner
 
-        self.prev_block_hash = hash(prev_block) if prev_block else None
+        self.prev_block_hash = prev_block.block_hash() if prev_block else None
+        # computed once, when first needed
+        self.__merkle_tree: MerkleTree = None
+        self.__hash: str = None
 
-        logger.info(f"{self} <{EventType.BLOCK_CREATE}> {self.description()}")
+        logger.info("%s <%s> %s", self, EventType.BLOCK_CREATE,
+                    LazyDescription(self.description))
+
+    __setstate__ = set_state
 
     @property
     def id(self) -> int:
         return self.block_id
 
+    @property
+    def merkle_root(self) -> str:
+        if self.__merkle_tree is None:
+            self.__merkle_tree = MerkleTree(
+                [transaction.txn_id for transaction in self.transactions])
+        return self.__merkle_tree.root
+
     @property
     def header(self) -> str:
-        if self.block_id == 0:
-            return hash("genesis block")
-        if self.transactions == []:
-            transaction_ids = "no transactions"
-        else:
-            transaction_ids = reduce(
-                lambda a, b: a+b, map(lambda x: x.txn_id, self.transactions))
-        return f"{self.block_id}-{self.prev_block_hash}-{self.timestamp}-{transaction_ids}"
+        merkle_root = self.merkle_root or "no transactions"
+        return f"{self.block_id}-{self.prev_block_hash}-{self.timestamp}-{merkle_root}"
 
     @property
     def num_txns(self) -> int:
         return len(self.transactions)
 
-    def block_hash(self) -> int:
-        return hashlib.sha256(self.header.encode()).hexdigest()
+    def block_hash(self) -> str:
+        if self.__hash is None:
+            self.__hash = sha256(self.header)
+        return self.__hash
+
+    def append_transaction(self, transaction: Transaction):
+        '''
+        add a transaction (the coinbase) to the block before it is sealed
+        '''
+        self.transactions.append(transaction)
+        if self.__merkle_tree is not None:
+            self.__merkle_tree.append(transaction.txn_id)
+        self.__hash = None
 
     def __repr__(self) -> str:
         return f"Block(id={self.block_id})"
@@ -101,11 +162,18 @@ GENESIS_BLOCK = gen_genesis_block()
 
 class BlockChain:
 
-    def __init__(self, cpu_power: float, broadcast_block_function: Any, peers: list[Any], owner_peer: Any):
-        self.__blocks: list[Block] = []
+    def __init__(self, simulation: Simulation, cpu_power: float, broadcast_block_function: Any, owner_peer: Any):
+        self.__simulation: Simulation = simulation
+        self.__config = simulation.config
+        # blocks and their derived state, shared by all peers
+        self.__dag: "BlockDAG" = simulation.block_dag
+        # blocks of this peer, block -> position in arrival order
+        self.__blocks: dict[Block, int] = {}
+        self.__leaf_blocks: dict[Block, None] = {}  # ordered set
+        self.__fork_blocks: dict[Block, None] = {}  # blocks with > 1 child
         self.__peer_id: Any = owner_peer
         self.__num_generated_blocks: int = 0
-        self.__new_transactions: list[Transaction] = []
+        self.__new_transactions: Mempool = None
         self.__block_arrival_time: dict[Block, float] = {}
         self.__broadcast_block: Any = broadcast_block_function
         self.__mining_new_blocks: list[Block] = []
@@ -113,16 +181,19 @@ class BlockChain:
 
         self.__longest_chain_length: int = 0
         self.__longest_chain_leaf: Block = None
+        # blocks of the longest chain above the genesis block, by height
+        self.__longest_chain: list[Block] = []
+        self.__longest_chain_miners: dict[Any, int] = {}  # miner -> blocks
 
-        self.__branch_lengths: dict[Block, int] = {}
-        self.__branch_balances: dict[Block, dict[Any, int]] = {}
-        self.__branch_transactions: dict[Block, list[Transaction]] = {}
-        self.__missing_parent_blocks: list[Block] = []
+        self.__orphan_blocks = OrphanPool(
+            self.__config.ORPHAN_POOL_SIZE, self.__config.ORPHAN_MAX_AGE)
 
-        self.avg_interval_time = CONFIG.AVG_BLOCK_MINING_TIME
+        self.avg_interval_time = self.__config.AVG_BLOCK_MINING_TIME
         self.cpu_power: float = cpu_power
 
-        self.__init_genesis_block(peers)
+        self.__init_genesis_block()
+
+    __setstate__ = set_state
 
     @property
     def __dict__(self) -> dict:
@@ -132,8 +203,8 @@ class BlockChain:
         ): self.__block_arrival_time[x]}, self.__block_arrival_time))
         block_arrival_times = sorted(
             block_arrival_times, key=lambda x: list(x.values())[0])
-        longest_chain = self.__get_longest_chain()
-        longest_chain = list(map(lambda x: x.__repr__(), longest_chain))
+        longest_chain = list(
+            map(lambda x: x.__repr__(), reversed(self.__longest_chain)))
         return {
             "blocks": blocks,
             "block_arrival_time": block_arrival_times,
@@ -149,20 +220,40 @@ class BlockChain:
     def peer_id(self) -> Any:
         return self.__peer_id
 
+    @ property
+    def longest_chain_length(self) -> int:
+        return self.__longest_chain_length
+
+    @ property
+    def num_blocks(self) -> int:
+        '''
+        blocks added to the chain of this peer, the genesis block included
+        '''
+        return len(self.__blocks)
+
+    def longest_chain_blocks_by(self, miner: Any) -> int:
+        '''
+        number of blocks of the longest chain mined by miner
+        '''
+        return self.__longest_chain_miners.get(miner, 0)
+
+    def known_blocks(self) -> list[Block]:
+        '''
+        blocks known to this peer, parents before children
+        '''
+        return list(self.__blocks) + self.__mining_new_blocks + list(self.__orphan_blocks)
+
     def __repr__(self) -> str:
         return f"BlockChain(👥:{self.__peer_id})"
 
-    def __init_genesis_block(self, peers: list[Any]):
+    def __init_genesis_block(self):
         genesis_block = GENESIS_BLOCK
-        self.__blocks.append(genesis_block)
+        self.__index_block(genesis_block)
         self.__longest_chain_length = 1
         self.__longest_chain_leaf = genesis_block
-        self.__branch_lengths[genesis_block] = 1
-        self.__branch_balances[genesis_block] = {}
-        self.__branch_transactions[genesis_block] = []
-        for peer in peers:
-            self.__branch_balances[genesis_block].update(
-                {peer: CONFIG.INITIAL_COINS})
+        self.__new_transactions = Mempool(
+            self.__dag.balances, genesis_block)
+        self.__dag.set_tip(self, genesis_block)
 
     def __validate_block(self, block: Block) -> bool:
         '''
@@ -173,18 +264,36 @@ class BlockChain:
         if prev_block not in self.__blocks:
             logger.info(
                 "%s block_dropped %s previous block missing !!", self.peer_id, block)
-            self.__missing_parent_blocks.append(block)
+            if not self.__orphan_blocks.add(block, self.__simulation.clock):
+                logger.info(
+                    "%s block_dropped %s already waiting for its parent !!", self.peer_id, block)
             return False
         if block in self.__blocks:
             logger.info(
                 "%s block_dropped %s block already in blockchain !!", self.peer_id, block)
             return False
+        if not self.__dag.extends_finalized(prev_block):
+            logger.info(
+                "%s block_dropped %s forks below the finalized block !!", self.peer_id, block)
+            return False
+        # the transactions only depend on the ancestors, validated once
+        valid = self.__dag.validity(block)
+        if valid is None:
+            valid = self.__validate_transactions(block)
+            self.__dag.set_validity(block, valid)
+        elif not valid:
+            logger.info(
+                "%s block_dropped %s invalid block !!", self.peer_id, block)
+        return valid
+
+    def __validate_transactions(self, block: Block) -> bool:
+        prev_block = block.prev_block
+        if not self.__dag.balances.can_pay(block):
+            logger.info(
+                "%s block_dropped %s invalid transaction !!", self.peer_id, block)
+            return False
         for transaction in block.transactions:
-            if not self.__validate_transaction(transaction, prev_block):
-                logger.info(
-                    "%s block_dropped %s invalid transaction !!", self.peer_id, block)
-                return False
-            if transaction in self.__branch_transactions[prev_block]:
+            if self.__dag.transactions.included_upto(transaction, prev_block):
                 logger.info(
                     "%s block_dropped %s %s transaction already in blockchain!!", self.peer_id, block, transaction)
                 return False
@@ -192,35 +301,11 @@ class BlockChain:
         # logger.debug(f"Block {block} is valid")
         return True
 
-    def __validate_transaction(self, transaction: Transaction, prev_block: Block) -> bool:
+    def __branch_length(self, block: Block) -> int:
         '''
-        1. no balance of any peer shouldn't go negative
+        number of blocks from the genesis block to block
         '''
-        balances_upto_block = self.__branch_balances[prev_block]
-        if transaction.from_id and balances_upto_block[transaction.from_id] < transaction.amount:
-            # logger.debug(f"Transaction {transaction} is invalid")
-            return False
-
-        # logger.debug(f"Transaction {transaction} is valid")
-        return True
-
-    def __update_chain_length(self, block: Block):
-        prev_block = block.prev_block
-        chain_len_upto_block = self.__branch_lengths[prev_block] + 1
-        self.__branch_lengths[block] = chain_len_upto_block
-        # self.__branch_lengths.pop(prev_block)
-        # logger.debug(f"Chain length upto block {block} is {chain_len_upto_block}")
-
-    def __update_balances(self, block: Block):
-        prev_block = block.prev_block
-        balances_upto_block = self.__branch_balances[prev_block].copy()
-        for transaction in block.transactions:
-            if transaction.from_id:
-                balances_upto_block[transaction.from_id] -= transaction.amount
-            balances_upto_block[transaction.to_id] += transaction.amount
-        self.__branch_balances[block] = balances_upto_block
-        # self.__branch_balances.pop(prev_block)
-        # logger.debug(f"Balances upto block {block} are {balances_upto_block}")
+        return self.__dag.tree.height(block) + 1
 
     def __update_avg_interval_time(self, block: Block):
         return
@@ -233,15 +318,27 @@ class BlockChain:
         #     self.avg_interval_time * (num_blocks-1) + interval_time) / num_blocks
         # logger.debug("Avg interval updated %s", self.avg_interval_time)
 
-    def __update_branch_transactions(self, block: Block):
+    def __update_block_arrival_time(self, block: Block):
+        self.__block_arrival_time[block] = self.__simulation.clock
+
+    def __index_block(self, block: Block):
+        '''
+        add the block (in the DAG) to the blocks of this peer and the leaves
+        '''
+        self.__blocks[block] = len(self.__blocks)
+        self.__leaf_blocks[block] = None
         prev_block = block.prev_block
-        prev_branch_txns = (self.__branch_transactions[prev_block]).copy()
-        for transaction in block.transactions:
-            prev_branch_txns.append(transaction)
-        self.__branch_transactions[block] = prev_branch_txns
+        if prev_block is None:
+            return
+        self.__leaf_blocks.pop(prev_block, None)
+        if prev_block not in self.__fork_blocks and len(self.__known_children(prev_block)) == 2:
+            self.__fork_blocks[prev_block] = None
 
-    def __update_block_arrival_time(self, block: Block):
-        self.__block_arrival_time[block] = simulation.clock
+    def __known_children(self, block: Block) -> list[Block]:
+        '''
+        children of the block this peer has
+        '''
+        return [child for child in self.__dag.children(block) if child in self.__blocks]
 
     def __add_block(self, block: Block) -> bool:
         '''
@@ -251,24 +348,32 @@ class BlockChain:
             # if transaction in self.__new_transactions:
             if isinstance(transaction, CoinBaseTransaction):
                 continue
-            if transaction in self.__new_transactions:
-                self.__new_transactions.remove(transaction)
+            self.__new_transactions.remove(transaction)
 
-        self.__blocks.append(block)
-        self.__update_chain_length(block)
-        self.__update_balances(block)
+        self.__dag.add_block(block)
+        self.__index_block(block)
         self.__update_block_arrival_time(block)
         self.__update_avg_interval_time(block)
-        self.__update_branch_transactions(block)
 
-    def __validate_saved_blocks(self):
-        remove_blocks = []
-        for block in self.__missing_parent_blocks:
-            if self.__validate_block(block):
-                remove_blocks.append(block)
-                self.__add_block(block)
-        for block in remove_blocks:
-            self.__missing_parent_blocks.remove(block)
+    def __connect_orphans(self, block: Block):
+        '''
+        add the orphans waiting for the block, and for those, in the order
+        they arrived
+        '''
+        waiting = self.__orphan_blocks.pop_children(block)
+        heapq.heapify(waiting)
+        while waiting:
+            _, orphan = heapq.heappop(waiting)
+            children = self.__orphan_blocks.pop_children(orphan)
+            if not self.__validate_block(orphan):
+                # the orphans waiting for it can't be added either
+                while children:
+                    _, child = children.pop()
+                    children += self.__orphan_blocks.pop_children(child)
+                continue
+            self.__add_block(orphan)
+            for child in children:
+                heapq.heappush(waiting, child)
 
     def add_block(self, block: Block) -> bool:
         '''
@@ -279,14 +384,16 @@ class BlockChain:
 
         self.__add_block(block)
 
-        chain_len_upto_block = self.__branch_lengths[block]
-        self.__validate_saved_blocks()
+        chain_len_upto_block = self.__branch_length(block)
+        self.__connect_orphans(block)
         if chain_len_upto_block > self.__longest_chain_length:
             logger.debug("%s <longest_chain> %s %s generating new block !!",
                          self.__peer_id,
-                         str(self.__longest_chain_length), str(chain_len_upto_block))
+                         self.__longest_chain_length, chain_len_upto_block)
             self.__longest_chain_length = chain_len_upto_block
-            self.__longest_chain_leaf = block
+            self.__set_longest_chain_leaf(block)
+            self.__new_transactions.set_tip(block)
+            self.__dag.set_tip(self, block)
             self.__generate_block()
 
     def add_transaction(self, transaction: Transaction) -> bool:
@@ -295,19 +402,20 @@ class BlockChain:
         '''
         # if transaction in self.__branch_transactions:
         # return
-        self.__new_transactions.append(transaction)
+        self.__new_transactions.add(transaction)
         if transaction.from_id == self.__peer_id:
             return
-        if self.__pending_generate_block and len(self.__new_transactions) >= CONFIG.BLOCK_TXNS_TRIGGER_THRESHOLD:
+        if self.__pending_generate_block and len(self.__new_transactions) >= self.__config.BLOCK_TXNS_TRIGGER_THRESHOLD:
             self.__pending_generate_block = False
             self.__generate_block()
 
     def __mine_block_start(self, block: Block):
-        delay = expon_distribution(self.avg_interval_time/self.cpu_power)
+        delay = self.__peer_id.random_streams.mining.expon(
+            self.avg_interval_time/self.cpu_power)
 
-        new_event = Event(EventType.BLOCK_MINE_FINISH, simulation.clock, delay,
-                          self.__mine_block_end, (block,), f"mining block finished {block}")
-        simulation.enqueue(new_event)
+        new_event = Event(EventType.BLOCK_MINE_FINISH, self.__simulation.clock, delay,
+                          self.__mine_block_end, (block,), LazyDescription("mining block finished {}", block), self)
+        self.__simulation.enqueue(new_event)
 
     def __mine_block_end(self, block: Block):
         '''
@@ -318,12 +426,12 @@ class BlockChain:
         if block.prev_block == self.__longest_chain_leaf and self.__validate_block(block):
             logger.info(
                 "%s <%s> %s", self.__peer_id, EventType.BLOCK_MINE_SUCCESS, block)
-            block.transactions.append(CoinBaseTransaction(
-                self.__peer_id, block.timestamp))
+            block.append_transaction(CoinBaseTransaction(
+                self.__peer_id, block.timestamp, self.__peer_id.random_streams.ids))
             self.__add_block(block)
-            new_event = Event(EventType.BLOCK_BROADCAST, simulation.clock, 0,
-                              self.__broadcast_block, (block,), f"{self.__peer_id}->* broadcast {block}")
-            simulation.enqueue(new_event)
+            new_event = Event(EventType.BLOCK_BROADCAST, self.__simulation.clock, 0,
+                              self.__broadcast_block, (block,), LazyDescription("{}->* broadcast {}", self.__peer_id, block), self)
+            self.__simulation.enqueue(new_event)
         else:
             # no longer longest chain
             logger.info(
@@ -335,50 +443,49 @@ class BlockChain:
         '''
         Generate a new block
         '''
-        sorted(self.__new_transactions, key=lambda x: x.timestamp)
-        valid_transactions_for_longest_chain = []
-        balances_upto_block = self.__branch_balances[self.__longest_chain_leaf].copy(
-        )
-        for transaction in self.__new_transactions:
-            if balances_upto_block[transaction.from_id] < transaction.amount:
-                continue
-            balances_upto_block[transaction.from_id] -= transaction.amount
-            balances_upto_block[transaction.to_id] += transaction.amount
-            valid_transactions_for_longest_chain.append(transaction)
+        valid_transactions_for_longest_chain = self.__new_transactions.template()
 
-        if len(valid_transactions_for_longest_chain) < CONFIG.BLOCK_TXNS_MIN_THRESHOLD:
+        if len(valid_transactions_for_longest_chain) < self.__config.BLOCK_TXNS_MIN_THRESHOLD:
             logger.debug("<num_txns> not enough txns to mine a block !!",)
             self.__pending_generate_block = True
             return
 
         new_block = Block(self.__longest_chain_leaf,
                           valid_transactions_for_longest_chain,
-                          self.peer_id, simulation.clock)
+                          self.peer_id, self.__simulation.clock, self.__peer_id.random_streams.ids)
         self.__mining_new_blocks.append(new_block)
-        new_event = Event(EventType.BLOCK_MINE_START, simulation.clock, 0,
-                          self.__mine_block_start, (new_block,), f"attempt to mine block {new_block}")
-        simulation.enqueue(new_event)
+        new_event = Event(EventType.BLOCK_MINE_START, self.__simulation.clock, 0,
+                          self.__mine_block_start, (new_block,), LazyDescription("attempt to mine block {}", new_block), self)
+        self.__simulation.enqueue(new_event)
 
     def generate_block(self):
         self.__generate_block()
 
-    def __get_longest_chain(self):
-        chain = []
-        cur_chain = self.__longest_chain_leaf
-        while cur_chain.prev_block:
-            chain.append(cur_chain)
-            cur_chain = cur_chain.prev_block
-        return chain
+    def __set_longest_chain_leaf(self, leaf: Block):
+        '''
+        move the longest chain to the branch of leaf, only the blocks between
+        the common ancestor and the two leaves are updated
+        '''
+        chain, miners = self.__longest_chain, self.__longest_chain_miners
+        height = self.__dag.tree.height
+        new_blocks = []
+        block = leaf
+        while block.prev_block and not (height(block) <= len(chain) and chain[height(block) - 1] is block):
+            new_blocks.append(block)
+            block = block.prev_block
+        for old_block in chain[height(block):]:
+            miners[old_block.miner] -= 1
+        del chain[height(block):]
+        for new_block in reversed(new_blocks):
+            chain.append(new_block)
+            miners[new_block.miner] = miners.get(new_block.miner, 0) + 1
+        self.__longest_chain_leaf = leaf
 
     def __get_leaf_blocks(self):
         '''
         return leaf blocks
         '''
-        leaf_blocks = self.__blocks.copy()
-        for block in self.__blocks:
-            if block.prev_block in leaf_blocks:
-                leaf_blocks.remove(block.prev_block)
-        return leaf_blocks
+        return list(self.__leaf_blocks)
 
     def __get_branches(self):
         '''
@@ -389,7 +496,7 @@ class BlockChain:
         for block in leaf_blocks:
             branch_lengths.append({
                 "leaf_block": block.__repr__(),
-                "length": self.__branch_lengths[block]
+                "length": self.__branch_length(block)
             })
         return branch_lengths
 
@@ -397,22 +504,15 @@ class BlockChain:
         '''
         return forks
         '''
-        child_counts = {}
-        for block in self.__blocks:
-            prev_block = block.prev_block
-            if not prev_block:
-                continue
-            if prev_block not in child_counts:
-                child_counts[prev_block] = 0
-            child_counts[prev_block] = child_counts[prev_block] + 1
+        # in the order of the first child of every fork block
         forks = []
-        for block, child_freq in child_counts.items():
-            if child_freq > 1:
-                forks.append({
-                    "fork_at": block.__repr__(),
-                    "num_forks": child_freq
-                })
-        return forks
+        for block in self.__fork_blocks:
+            children = self.__known_children(block)
+            forks.append((min(map(self.__blocks.get, children)), {
+                "fork_at": block.__repr__(),
+                "num_forks": len(children)
+            }))
+        return [fork for _, fork in sorted(forks, key=lambda x: x[0])]
 
     @ property
     def branches_info(self):
@@ -432,11 +532,7 @@ class BlockChain:
 
     @ property
     def longest_chain_contribution(self):
-        count_longest_chain = 0
-        for block in self.__get_longest_chain():
-            if block.miner == self.__peer_id:
-                count_longest_chain += 1
-
+        count_longest_chain = self.longest_chain_blocks_by(self.__peer_id)
         if self.__num_generated_blocks == 0:
             return 0
         return round(count_longest_chain/self.__num_generated_blocks*100, 2)
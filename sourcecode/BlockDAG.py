@@ -0,0 +1,113 @@
+from typing import Any
+
+from BlockTree import BlockTree, TransactionIndex
+from Balances import BranchBalances
+
+
+class BlockDAG:
+    '''
+    Blocks connected by any peer of a simulation, with the state that only
+    depends on their ancestry: height, balances, the blocks including every
+    transaction and whether the block is valid. It is computed once per
+    block and shared by the peers (simulation.block_dag), every peer only
+    keeps which blocks it has and its own tip.
+
+    With a finality depth k, a block k blocks below the lowest tip of the
+    peers is final once every tip descends from it. The balances and the
+    transactions of its ancestors are collapsed into it, those of the
+    branches forking below it are dropped and blocks extending such a
+    branch are refused. Heights and children stay for the export.
+    '''
+
+    def __init__(self, genesis_block: Any, initial_balances: dict[Any, float], finality_depth: int = None):
+        self.finality_depth = finality_depth
+        self.finalized_block = genesis_block
+        self.tree = BlockTree(genesis_block)
+        self.balances = BranchBalances(
+            self.tree, genesis_block, initial_balances)
+        self.transactions = TransactionIndex(self.tree)
+        self.__children: dict[Any, list[Any]] = {}
+        self.__validity: dict[Any, bool] = {}
+        self.__tips: dict[Any, Any] = {}  # owner -> tip
+        self.__tip_heights: dict[int, int] = {}  # height -> number of tips
+        self.__min_tip_height: int = 0
+
+    def __contains__(self, block) -> bool:
+        return block in self.tree
+
+    def add_block(self, block: Any):
+        '''
+        add a valid block whose parent is in the DAG (once)
+        '''
+        if block in self.tree:
+            return
+        self.tree.add_block(block)
+        self.balances.add_block(block)
+        self.transactions.add_block(block)
+        self.__children.setdefault(block.prev_block, []).append(block)
+
+    def children(self, block: Any) -> list[Any]:
+        return self.__children.get(block, [])
+
+    def validity(self, block: Any) -> bool:
+        '''
+        result of validating the transactions of the block, None if not
+        validated yet
+        '''
+        return self.__validity.get(block)
+
+    def set_validity(self, block: Any, valid: bool):
+        self.__validity[block] = valid
+
+    def extends_finalized(self, block: Any) -> bool:
+        '''
+        the finalized block is the block or one of its ancestors
+        '''
+        if self.tree.height(self.finalized_block) == 0:
+            return True
+        return self.tree.is_ancestor(self.finalized_block, block)
+
+    def set_tip(self, owner: Any, block: Any):
+        '''
+        tip of a peer, the height of the tip of a peer never decreases
+        '''
+        heights, height = self.__tip_heights, self.tree.height(block)
+        previous = self.__tips.get(owner)
+        self.__tips[owner] = block
+        heights[height] = heights.get(height, 0) + 1
+        if previous is not None:
+            previous_height = self.tree.height(previous)
+            heights[previous_height] -= 1
+            if not heights[previous_height]:
+                del heights[previous_height]
+        if height < self.__min_tip_height:
+            self.__min_tip_height = height
+        while self.__min_tip_height not in heights:
+            self.__min_tip_height += 1
+        if self.finality_depth is not None:
+            self.__finalize(block, self.__min_tip_height - self.finality_depth)
+
+    def __finalize(self, tip: Any, height: int):
+        '''
+        finalize the ancestor of tip at height if every tip descends from it
+        '''
+        if height <= self.tree.height(self.finalized_block):
+            return
+        block = self.tree.ancestor(tip, height)
+        if not all(self.tree.is_ancestor(block, other_tip) for other_tip in self.__tips.values()):
+            return
+        chain = [block]
+        while chain[-1] is not self.finalized_block:
+            chain.append(chain[-1].prev_block)
+        finalized, stale = chain[1:], []
+        for child, parent in zip(chain, finalized):
+            branches = [other for other in self.children(parent) if other is not child]
+            while branches:
+                stale_block = branches.pop()
+                stale.append(stale_block)
+                branches.extend(self.children(stale_block))
+        self.balances.finalize(block, finalized + stale)
+        self.transactions.finalize(finalized, stale)
+        for pruned_block in finalized + stale:
+            self.__validity.pop(pruned_block, None)
+        self.finalized_block = block
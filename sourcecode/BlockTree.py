@@ -0,0 +1,114 @@
+from typing import Any
+
+
+def skip_height(height: int) -> int:
+    '''
+    height of the block the skip pointer of a block at height points to
+    (as in bitcoin's CBlockIndex), any ancestor is O(log height) jumps away
+    '''
+    if height < 2:
+        return 0
+
+    def clear_lowest_bit(n):
+        return n & (n - 1)
+    if height & 1:
+        return clear_lowest_bit(clear_lowest_bit(height - 1)) + 1
+    return clear_lowest_bit(height)
+
+
+class BlockTree:
+    '''
+    Heights and skip pointers of the blocks of a block tree, for ancestor
+    queries in O(log height).
+    '''
+
+    def __init__(self, root: Any):
+        self.__heights: dict[Any, int] = {root: 0}
+        self.__skips: dict[Any, Any] = {root: None}
+
+    def __contains__(self, block) -> bool:
+        return block in self.__heights
+
+    def add_block(self, block: Any):
+        '''
+        add a block, its parent must have been added
+        '''
+        height = self.__heights[block.prev_block] + 1
+        self.__heights[block] = height
+        self.__skips[block] = self.ancestor(
+            block.prev_block, skip_height(height))
+
+    def height(self, block: Any) -> int:
+        return self.__heights[block]
+
+    def ancestor(self, block: Any, height: int) -> Any:
+        '''
+        ancestor of the block at height (the block itself at its height)
+        '''
+        heights, skips = self.__heights, self.__skips
+        current = heights[block]
+        if height > current or height < 0:
+            return None
+        while current > height:
+            skip = skip_height(current)
+            skip_prev = skip_height(current - 1)
+            # take the skip pointer unless the one of the parent gets closer
+            if skips[block] is not None and (skip == height or (
+                    skip > height and not (skip_prev < skip - 2 and skip_prev >= height))):
+                block, current = skips[block], skip
+            else:
+                block, current = block.prev_block, current - 1
+        return block
+
+    def is_ancestor(self, ancestor: Any, block: Any) -> bool:
+        '''
+        ancestor is the block or one of its ancestors
+        '''
+        return self.ancestor(block, self.__heights[ancestor]) is ancestor
+
+
+class TransactionIndex:
+    '''
+    Blocks of a block tree that include every transaction, to find out if a
+    transaction is already on the branch of a block.
+    '''
+
+    def __init__(self, tree: BlockTree):
+        self.__tree = tree
+        self.__blocks: dict[Any, list[Any]] = {}
+        # transactions of the finalized blocks, on every branch left
+        self.__finalized: dict[Any, None] = {}
+
+    def add_block(self, block: Any):
+        for transaction in block.transactions:
+            self.__blocks.setdefault(transaction, []).append(block)
+
+    def finalize(self, finalized: list, stale: list):
+        '''
+        collapse the transactions of the finalized blocks into a set and
+        forget those of the stale blocks, only descendants of the finalized
+        blocks can be queried afterwards
+        '''
+        for block in finalized:
+            for transaction in block.transactions:
+                self.__blocks.pop(transaction, None)
+                self.__finalized[transaction] = None
+        for block in stale:
+            for transaction in block.transactions:
+                blocks = self.__blocks.get(transaction)
+                if blocks is None:
+                    continue
+                blocks.remove(block)
+                if not blocks:
+                    del self.__blocks[transaction]
+
+    def included_upto(self, transaction: Any, block: Any) -> bool:
+        '''
+        transaction is in the block or one of its ancestors
+        '''
+        if transaction in self.__finalized:
+            return True
+        blocks = self.__blocks.get(transaction)
+        if not blocks:
+            return False
+        return any(self.__tree.is_ancestor(including_block, block) for including_block in blocks)
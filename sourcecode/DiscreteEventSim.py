@@ -1,13 +1,20 @@
-import inspect
+import math
+from time import perf_counter_ns
 from enum import Enum
-from queue import PriorityQueue
+from itertools import count
 import logging
 
 
-import utils as UITLS
+from config import CONFIG
+from logger import LazyDescription
+from EventQueue import EVENT_QUEUE_BACKENDS
+from random_streams import RandomStreams
+from metrics import EventMetrics
 
 logger = logging.getLogger(__name__)
 
+_event_ids = count()
+
 
 class EventType(Enum):
     TXN_CREATE = 'TXN_CREATED'
@@ -31,32 +38,32 @@ class EventType(Enum):
 
 
 class Event:
-    def __init__(self, event_type: EventType, created_at, delay, action, payload, meta_description=""):
-        self.id = UITLS.generate_random_id(6)
+    __slots__ = ('id', 'type', 'created_at', 'delay', 'actionable_at',
+                 'action', 'payload', 'meta_description', 'owner')
+
+    def __init__(self, event_type: EventType, created_at, delay, action, payload, meta_description="", owner=None):
+        self.id = next(_event_ids)
         self.type: EventType = event_type  # type of the event
         self.created_at = created_at  # when it is created
         self.delay = delay
         self.actionable_at = self.created_at + delay  # when it should be executed
         self.action = action  # what to execute
         self.payload = payload  # arguments for the action
-        self.log_message = ""  # log message
         # additional information about the event
         self.meta_description = meta_description
+        self.owner = owner  # object which created the event
 
-        self.owner = "nan"
-        try:
-            caller_class = inspect.currentframe().f_back.f_locals['self']
-            self.owner = caller_class
-            caller_class_name = caller_class.__class__.__name__
-            if caller_class_name == "BlockChain":
-                self.owner = f"{caller_class.peer_id}"
-            if caller_class_name == "OneWayLINK":
-                self.owner = f"{caller_class.from_peer}->{caller_class.to_peer}"
-        except Exception:
-            try:
-                self.owner = inspect.currentframe().f_back.f_locals['module']
-            except Exception:
-                pass
+    @property
+    def owner_description(self) -> str:
+        owner = self.owner
+        if owner is None:
+            return "nan"
+        owner_class_name = owner.__class__.__name__
+        if owner_class_name == "BlockChain":
+            return f"{owner.peer_id}"
+        if owner_class_name == "OneWayLINK":
+            return f"{owner.from_peer}->{owner.to_peer}"
+        return f"{owner}"
 
     def __gt__(self, other):
         return self.actionable_at > other.actionable_at
@@ -73,10 +80,10 @@ class Event:
         return format(round(self.actionable_at, 6), ",")
 
     def description(self):
-        return f"📆({self.id} 🔀:{self.type} 👷:{self.owner} ⏰️:{self.created_at_formatted}-{self.actionable_at_formatted} 📦:{self.payload}) 📝:\"{self.meta_description}\""
+        return f"📆({self.id} 🔀:{self.type} 👷:{self.owner_description} ⏰️:{self.created_at_formatted}-{self.actionable_at_formatted} 📦:{self.payload}) 📝:\"{self.meta_description}\""
 
     def __repr__(self) -> str:
-        return f"📆(🔀:{self.type} 👷:{self.owner} ⏰️:{self.created_at_formatted}-{self.actionable_at_formatted} 📦:{self.payload})"
+        return f"📆(🔀:{self.type} 👷:{self.owner_description} ⏰️:{self.created_at_formatted}-{self.actionable_at_formatted} 📦:{self.payload})"
 
 
 class HookType():
@@ -86,24 +93,82 @@ class HookType():
     POST_RUN = 'post_run'
 
 
+SEND_EVENT_TYPES = frozenset([EventType.TXN_SEND, EventType.BLOCK_SEND])
+
+
+def _with_predicate(fn, predicate):
+    if predicate is None:
+        return fn
+
+    def hook(event):
+        if predicate(event):
+            fn(event)
+    return hook
+
+
 class Simulation:
-    def __init__(self):
+    '''
+    Context of one simulation: clock, event queue, configuration and random
+    number streams. Peers, links and blockchains get the simulation they
+    belong to, so independent simulations can run in the same process.
+    '''
+
+    def __init__(self, config: CONFIG = None, seed=None):
+        self.config: CONFIG = config if config is not None else CONFIG()
+        self.random_streams = RandomStreams(seed)
+        self.seed = self.random_streams.seed
         self.clock = 0.0
-        self.event_queue = PriorityQueue()
+        self.event_queue = EVENT_QUEUE_BACKENDS[self.config.EVENT_QUEUE]()
         self.__hooks = {
             HookType.PRE_ENQUEUE: [],
             HookType.POST_ENQUEUE: [],
             HookType.PRE_RUN: [],
             HookType.POST_RUN: []
         }
+        # hook_type -> event_type -> hooks to execute
+        self.__dispatch_table: dict[str, dict[EventType, tuple]] = {}
+        self.__compile_hooks()
         self.stop_sim = False
+        self.next_checkpoint_at = math.inf
+        self.__checkpoint_interval = None
+        self.__save_checkpoint = None
+        self.metrics = EventMetrics() if self.config.METRICS else None
+        # blocks shared by the peers (BlockDAG, created by network.py)
+        self.block_dag = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # hooks with predicates are closures, compile them again on load
+        state.pop('_Simulation__dispatch_table')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dispatch_table = {}
+        self.__compile_hooks()
+
+    def enable_checkpoints(self, interval: float, save_checkpoint):
+        '''
+        Call save_checkpoint() every interval of simulated time,
+        between two events.
+        '''
+        self.__checkpoint_interval = interval
+        self.__save_checkpoint = save_checkpoint
+        self.next_checkpoint_at = self.clock + interval
+
+    def __checkpoint(self):
+        while self.next_checkpoint_at <= self.clock:
+            self.next_checkpoint_at += self.__checkpoint_interval
+        self.__save_checkpoint()
 
     def __enqueue(self, event):
-        self.__execute_hooks(HookType.PRE_ENQUEUE, event)
+        for hook in self.__dispatch_table[HookType.PRE_ENQUEUE][event.type]:
+            hook(event)
         self.event_queue.put(event)
         # logger.debug("Scheduled: %s", event)
         # logger.info(f"Event payload: {event.payload}\n")
-        self.__execute_hooks(HookType.POST_ENQUEUE, event)
+        for hook in self.__dispatch_table[HookType.POST_ENQUEUE][event.type]:
+            hook(event)
 
     def enqueue(self, event):
         '''
@@ -111,36 +176,66 @@ class Simulation:
         '''
         self.__enqueue(event)
 
-    def reg_hooks(self, hook_type: HookType, fn):
+    def reg_hooks(self, hook_type: HookType, fn, event_types: list[EventType] = None, predicate=None):
         '''
-        Register a function to be called before running an event.
+        Register a function to be called at hook_type of an event.
+        event_types: only call for these types of events (default: all)
+        predicate: only call if predicate(event) is true
         '''
-        self.__hooks[hook_type].append(fn)
+        if event_types is not None:
+            event_types = frozenset(event_types)
+        self.__hooks[hook_type].append((fn, event_types, predicate))
+        self.__compile_hooks()
 
-    def __execute_hooks(self, hook_type, event):
+    def __compile_hooks(self):
         '''
-        Execute hooks for the event.
+        Precompute the hooks to execute for every hook type and event type.
         '''
-        for hook in self.__hooks[hook_type]:
-            hook(event)
+        for hook_type, hooks in self.__hooks.items():
+            self.__dispatch_table[hook_type] = {
+                event_type: tuple(_with_predicate(fn, predicate)
+                                  for fn, event_types, predicate in hooks
+                                  if event_types is None or event_type in event_types)
+                for event_type in EventType
+            }
 
     def __run_event(self, event):
-        self.__execute_hooks(HookType.PRE_RUN, event)
-        if self.stop_sim:
-            return
-        if event.type in [EventType.TXN_SEND, EventType.BLOCK_SEND]:
+        pre_run_hooks = self.__dispatch_table[HookType.PRE_RUN][event.type]
+        if pre_run_hooks:
+            for hook in pre_run_hooks:
+                hook(event)
+            if self.stop_sim:
+                return
+        if event.type in SEND_EVENT_TYPES:
             logger.debug("Running: %s", event)
-            logger.debug("Details: %s", event.description())
+            logger.debug("Details: %s", LazyDescription(event.description))
         else:
             logger.info("Running: %s", event)
-        event.action(*event.payload)
-        self.__execute_hooks(HookType.POST_RUN, event)
+        if self.metrics is None:
+            event.action(*event.payload)
+        else:
+            started_at = perf_counter_ns()
+            event.action(*event.payload)
+            handler_time = perf_counter_ns() - started_at
+            self.metrics.record(event.type, handler_time, len(self.event_queue))
+        for hook in self.__dispatch_table[HookType.POST_RUN][event.type]:
+            hook(event)
 
-    def __run_loop(self):
-        while not self.event_queue.empty() and not self.stop_sim:
-            next_event = self.event_queue.get()
+    def __run_loop(self, end_time: float = math.inf):
+        event_queue = self.event_queue
+        bounded = end_time < math.inf
+        if self.metrics is not None:
+            self.metrics.start()
+        while not event_queue.empty() and not self.stop_sim:
+            if bounded and event_queue.peek_time() >= end_time:
+                break
+            next_event = event_queue.get()
             self.clock = next_event.actionable_at
             self.__run_event(next_event)
+            if self.clock >= self.next_checkpoint_at:
+                self.__checkpoint()
+        if self.metrics is not None:
+            self.metrics.stop()
 
     def run(self):
         '''
@@ -148,7 +243,20 @@ class Simulation:
         '''
         # self.is_running = True
         # self.__dequeue_timer()
-        self.__run_loop()
+        end_time = self.config.END_TIME
+        self.__run_loop(math.inf if end_time is None else end_time)
+
+    def run_until(self, end_time: float):
+        '''
+        Run the events actionable before end_time.
+        '''
+        self.__run_loop(end_time)
 
+    def next_event_time(self) -> float:
+        '''
+        actionable_at of the next event, inf if there is none
+        '''
+        if self.event_queue.empty():
+            return math.inf
+        return self.event_queue.peek_time()
 
-simulation = Simulation()
@@ -0,0 +1,178 @@
+import heapq
+from itertools import count
+
+
+class EventQueue:
+    '''
+    Interface of the event queues used by the simulation.
+    Events scheduled for the same time are returned in the order they were
+    enqueued, so every backend produces the same order of events.
+    '''
+
+    def put(self, event):
+        raise NotImplementedError
+
+    def get(self):
+        raise NotImplementedError
+
+    def peek_time(self) -> float:
+        '''
+        actionable_at of the event get() would return
+        '''
+        raise NotImplementedError
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def qsize(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return self.qsize()
+
+
+class HeapEventQueue(EventQueue):
+    '''
+    Binary heap of (actionable_at, sequence, event) entries.
+    '''
+
+    def __init__(self):
+        self.__heap = []
+        self.__sequence = count()
+
+    def put(self, event):
+        heapq.heappush(
+            self.__heap, (event.actionable_at, next(self.__sequence), event))
+
+    def get(self):
+        return heapq.heappop(self.__heap)[2]
+
+    def peek_time(self) -> float:
+        return self.__heap[0][0]
+
+    def empty(self) -> bool:
+        return not self.__heap
+
+    def qsize(self) -> int:
+        return len(self.__heap)
+
+    def __len__(self) -> int:
+        return len(self.__heap)
+
+
+class CalendarEventQueue(EventQueue):
+    '''
+    Calendar queue (R. Brown, 1988).
+    Time is divided into buckets of fixed width, the buckets form a circular
+    "year". An event goes into bucket (actionable_at // width) % num_buckets,
+    every bucket is a binary heap. Dequeue scans the buckets starting from the
+    current one, so both operations are amortized O(1) as long as the width
+    matches the spacing of the events near the head of the queue. The calendar
+    is resized (and the width re-estimated) whenever the number of events
+    doubles or halves.
+    '''
+    MIN_BUCKETS = 16
+    NUM_WIDTH_SAMPLES = 25
+
+    def __init__(self, num_buckets: int = MIN_BUCKETS, width: float = 1.0):
+        self.__sequence = count()
+        self.__size = 0
+        self.__last_time = 0.0
+        self.__init_calendar(num_buckets, width)
+
+    def __init_calendar(self, num_buckets: int, width: float):
+        self.__num_buckets = num_buckets
+        self.__mask = num_buckets - 1
+        self.__width = width
+        self.__buckets = [[] for _ in range(num_buckets)]
+        # virtual bucket (= actionable_at // width) being scanned
+        self.__current = int(self.__last_time // width)
+        self.__grow_at = 2*num_buckets
+        self.__shrink_at = num_buckets//2 if num_buckets > self.MIN_BUCKETS else -1
+
+    def __estimate_width(self, entries: list) -> float:
+        '''
+        3 times the average separation of the events at the head of the queue
+        ignoring the separations which are much larger than the average.
+        '''
+        samples = heapq.nsmallest(self.NUM_WIDTH_SAMPLES, entries)
+        separations = [b[0] - a[0] for a, b in zip(samples, samples[1:])]
+        if not separations:
+            return self.__width
+        avg_separation = sum(separations)/len(separations)
+        separations = [x for x in separations if x <= 2*avg_separation]
+        avg_separation = sum(separations)/len(separations)
+        if avg_separation <= 0:
+            return self.__width
+        return 3*avg_separation
+
+    def __resize(self, num_buckets: int):
+        entries = [entry for bucket in self.__buckets for entry in bucket]
+        self.__init_calendar(num_buckets, self.__estimate_width(entries))
+        width, mask, buckets = self.__width, self.__mask, self.__buckets
+        # appended in order, every bucket is a heap
+        for entry in sorted(entries):
+            buckets[int(entry[0] // width) & mask].append(entry)
+
+    def put(self, event):
+        actionable_at = event.actionable_at
+        entry = (actionable_at, next(self.__sequence), event)
+        virtual_bucket = int(actionable_at // self.__width)
+        # sequence numbers are unique, events are never compared
+        heapq.heappush(self.__buckets[virtual_bucket & self.__mask], entry)
+        if actionable_at < self.__last_time:
+            # event in the past of the calendar, rewind the scan
+            self.__last_time = actionable_at
+            self.__current = min(self.__current, virtual_bucket)
+        self.__size += 1
+        if self.__size > self.__grow_at:
+            self.__resize(2*self.__num_buckets)
+
+    def __find_head(self):
+        '''
+        bucket holding the earliest event and its virtual bucket
+        '''
+        if not self.__size:
+            raise IndexError("get from an empty event queue")
+        buckets, mask, width = self.__buckets, self.__mask, self.__width
+        current = self.__current
+        for _ in range(self.__num_buckets):
+            bucket = buckets[current & mask]
+            if bucket and int(bucket[0][0] // width) <= current:
+                break
+            current += 1
+        else:
+            # nothing in this year, jump to the earliest event
+            bucket = min((bucket for bucket in buckets if bucket),
+                         key=lambda bucket: bucket[0])
+            current = int(bucket[0][0] // width)
+        return bucket, current
+
+    def get(self):
+        bucket, current = self.__find_head()
+        entry = heapq.heappop(bucket)
+        self.__current = current
+        self.__last_time = entry[0]
+        self.__size -= 1
+        if self.__size < self.__shrink_at:
+            self.__resize(self.__num_buckets//2)
+        return entry[2]
+
+    def peek_time(self) -> float:
+        bucket, _ = self.__find_head()
+        return bucket[0][0]
+
+    def empty(self) -> bool:
+        return not self.__size
+
+    def qsize(self) -> int:
+        return self.__size
+
+    def __len__(self) -> int:
+        return self.__size
+
+
+EVENT_QUEUE_BACKENDS = {
+    "heap": HeapEventQueue,
+    "calendar": CalendarEventQueue,
+}
@@ -1,67 +1,127 @@
-import random
 from typing import Union
 
 from Transaction import Transaction
 from Block import Block
-from DiscreteEventSim import simulation, Event, EventType
-from utils import expon_distribution
+from DiscreteEventSim import Simulation, Event, EventType
+from logger import LazyDescription
+from utils import set_state
 
 
 class OneWayLINK:
-    def __init__(self, from_peer: "Peer", to_peer: "Peer", pij: float, cij: float):
+    def __init__(self, simulation: Simulation, from_peer: "Peer", to_peer: "Peer", pij: float, cij: float):
+        self.simulation = simulation
         self.from_peer = from_peer
         self.to_peer = to_peer
         self.pij = pij
         self.cij = cij
+        # messages to a peer simulated by another process (parallel.py)
+        self.outbox: list = None
 
-    def __get_delay(self, message: Union[Transaction, Block]):
-        dij = expon_distribution((96/8)/self.cij)  # ms
+    def get_delay(self, message: Union[Transaction, Block]):
+        dij = self.from_peer.random_streams.links.expon(
+            (96/8)/self.cij)  # ms
         return self.pij + message.size/self.cij + dij  # ms
 
-    def __link_delay_sim(self, message: Union[Transaction, Block]):
-        delay = self.__get_delay(message)
+    def receive_event(self, message: Union[Transaction, Block], delay: float, sent_at: float = None) -> Event:
+        '''
+        event of the other peer receiving the message after delay
+        sent_at: time the message was sent (default: now)
+        '''
         event_type = EventType.TXN_RECEIVE if isinstance(
             message, Transaction) else EventType.BLOCK_RECEIVE
-        event_description = f"{self.from_peer}->{self.to_peer}*; {message}; Δ:{round(delay,4)}ms"
-        new_event = Event(event_type, simulation.clock,
-                          delay, self.to_peer.receive_msg, (message, self.from_peer), event_description)
-        simulation.enqueue(new_event)
+        event_description = LazyDescription(
+            "{}->{}*; {}; Δ:{:.4f}ms", self.from_peer, self.to_peer, message, delay)
+        if sent_at is None:
+            sent_at = self.simulation.clock
+        return Event(event_type, sent_at,
+                     delay, self.to_peer.receive_msg, (message, self.from_peer), event_description, self)
 
-    def transmit(self, message: Union[Transaction, Block]):
+    def transmit(self, message: Union[Transaction, Block], delay: float):
         '''
         Transmit a message to the other peer.
         '''
-        event_type = EventType.TXN_SEND if isinstance(
-            message, Transaction) else EventType.BLOCK_SEND
-        event_description = f"{self.from_peer}*->{self.to_peer}; {message};"
-        new_event = Event(event_type, simulation.clock,
-                          0, self.__link_delay_sim, (message,), event_description)
-        simulation.enqueue(new_event)
+        if self.outbox is not None:
+            self.outbox.append(
+                (self.simulation.clock, delay, self, message))
+            return
+        self.simulation.enqueue(self.receive_event(message, delay))
 
     def __repr__(self) -> str:
         return f"Link({self.from_peer}->{self.to_peer})"
 
 
+class FanOut:
+    '''
+    Broadcast of a message over several links as a single pending event.
+    Delays of all links are drawn when the message is sent, the receive
+    event of the next delivery is only enqueued when the previous one is run.
+    '''
+
+    def __init__(self, simulation: Simulation, message: Union[Transaction, Block], links: list[OneWayLINK], delays: list[float]):
+        self.simulation = simulation
+        self.message = message
+        deliveries = [(delay, index, link)
+                      for index, (link, delay) in enumerate(zip(links, delays))]
+        # latest first, deliveries are popped from the end
+        self.deliveries = sorted(deliveries, reverse=True)
+        self.sent_at = simulation.clock
+
+    def schedule_next(self):
+        delay, _, link = self.deliveries[-1]
+        event = link.receive_event(self.message, delay, self.sent_at)
+        event.action = self.deliver
+        event.payload = ()
+        self.simulation.enqueue(event)
+
+    def deliver(self):
+        _, _, link = self.deliveries.pop()
+        if self.deliveries:
+            self.schedule_next()
+        link.to_peer.receive_msg(self.message, link.from_peer)
+
+
+def broadcast(simulation: Simulation, message: Union[Transaction, Block], links: list[OneWayLINK]):
+    '''
+    Send a message over several links.
+    Only the receive events are enqueued, either one per link or a single
+    lazily expanded fan-out (CONFIG.LAZY_FANOUT).
+    '''
+    # delays are drawn in link order, however the message is delivered
+    deliveries = [(link, link.get_delay(message)) for link in links]
+    if simulation.config.LAZY_FANOUT:
+        # messages to peers of other processes are never part of a fan-out
+        local = [(link, delay)
+                 for link, delay in deliveries if link.outbox is None]
+        if len(local) > 1:
+            FanOut(simulation, message, [link for link, _ in local],
+                   [delay for _, delay in local]).schedule_next()
+            deliveries = [(link, delay)
+                          for link, delay in deliveries if link.outbox is not None]
+    for link, delay in deliveries:
+        link.transmit(message, delay)
+
+
 class Link:
-    def __init__(self, peer1: "Peer", peer2: "Peer"):
+    def __init__(self, simulation: Simulation, peer1: "Peer", peer2: "Peer", pij: float):
         self.peer1 = peer1
         self.peer2 = peer2
         # overall latency = ρij + |m|/cij + dij
-        self.pij = random.uniform(10, 501)  # ms
+        self.pij = pij  # ms
         self.cij = 5 if peer1.is_slow_network or peer2.is_slow_network else 100  # Mbps
         self.cij = self.cij*1024/(8*1000)  # kB/ms
 
-        self.link1 = OneWayLINK(
-            from_peer=peer1, to_peer=peer2, pij=self.pij, cij=self.cij)
-        self.link2 = OneWayLINK(
-            from_peer=peer2, to_peer=peer1, pij=self.pij, cij=self.cij)
+        self.link1 = OneWayLINK(simulation,
+                                from_peer=peer1, to_peer=peer2, pij=self.pij, cij=self.cij)
+        self.link2 = OneWayLINK(simulation,
+                                from_peer=peer2, to_peer=peer1, pij=self.pij, cij=self.cij)
+
+    __setstate__ = set_state
 
-    def get_link(self, peer: "Peer"):
+    def get_link(self, peer: "Peer") -> OneWayLINK:
         '''
         Get the one way link object for the given peer.
         '''
-        link = (self.link1 if peer == self.peer1 else self.link2)
-        return link.transmit
+        return self.link1 if peer == self.peer1 else self.link2
 
     def __repr__(self):
         return f"Link({self.peer1}<->{self.peer2})"
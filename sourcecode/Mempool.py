@@ -0,0 +1,180 @@
+from typing import Any
+
+from Balances import BranchBalances
+
+# position of the seed of an account whose balance at the tip changed
+TIP_CHANGED = -1
+
+
+class Mempool:
+    '''
+    Pending transactions of a peer in arrival order, indexed by transaction
+    and by account, with the block template: the transactions a block on
+    the tip would include, taken in arrival order and skipping those whose
+    sender can't pay them with the balances of the tip and of the
+    transactions taken before.
+
+    The template is kept up to date incrementally. A new transaction only
+    extends it and removing a skipped one changes nothing. Removing a
+    taken transaction or changing the tip marks the template dirty from the
+    first position it can affect. It is then recomputed from there when it
+    is needed. Every account restarts from its balance before the position,
+    which was saved for every transaction. Accounts whose history changed
+    restart from a seed instead.
+    '''
+    COMPACT_MIN = 1024  # removed transactions kept in the order before compaction
+
+    def __init__(self, balances: BranchBalances, tip: Any):
+        self.__balances = balances
+        self.__tip = tip
+        # arrival order, removed transactions stay until the next compaction
+        self.__order: list = []
+        self.__positions: dict[Any, int] = {}  # pending transaction -> position
+        self.__by_account: dict[Any, dict[Any, None]] = {}
+        # transaction -> (sender balance before, receiver balance before, taken)
+        self.__states: dict[Any, tuple[float, float, bool]] = {}
+        # balances after the last transaction (accounts with transactions)
+        self.__running: dict[Any, float] = {}
+        self.__dirty_from: int = None
+        # account -> (position, balance before it or None: at the tip)
+        self.__seeds: dict[Any, tuple[int, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self.__positions)
+
+    def __contains__(self, transaction) -> bool:
+        return transaction in self.__positions
+
+    def add(self, transaction: Any):
+        if transaction in self.__positions:
+            return
+        position = len(self.__order)
+        self.__order.append(transaction)
+        self.__positions[transaction] = position
+        for account in (transaction.from_id, transaction.to_id):
+            self.__by_account.setdefault(account, {})[transaction] = None
+        if self.__dirty_from is None:
+            base = self.__balances.at(self.__tip)
+            self.__select(transaction, self.__running,
+                          lambda account, stored: base.item(account.index))
+
+    def remove(self, transaction: Any):
+        position = self.__positions.pop(transaction, None)
+        if position is None:
+            return
+        for account in (transaction.from_id, transaction.to_id):
+            pending = self.__by_account.get(account)
+            if pending is not None:
+                pending.pop(transaction, None)
+                if not pending:
+                    del self.__by_account[account]
+        state = self.__states.pop(transaction, None)
+        if state is None or not state[2]:
+            # not taken, no effect on the template
+            self.__compact()
+            return
+        self.__mark_dirty(position)
+        self.__seed(transaction.from_id, position, state[0])
+        self.__seed(transaction.to_id, position, state[1])
+
+    def set_tip(self, tip: Any):
+        '''
+        build the template on top of another block
+        '''
+        if tip is self.__tip:
+            return
+        changed_accounts = self.__balances.changed_accounts(self.__tip, tip)
+        self.__tip = tip
+        for account in changed_accounts:
+            self.__running.pop(account, None)
+            pending = self.__by_account.get(account)
+            if pending:
+                self.__mark_dirty(self.__positions[next(iter(pending))])
+            if pending or self.__dirty_from is not None:
+                self.__seeds[account] = (TIP_CHANGED, None)
+
+    def template(self) -> list:
+        '''
+        transactions of a block on the tip, in arrival order
+        '''
+        if self.__dirty_from is not None:
+            self.__refresh()
+        positions, states = self.__positions, self.__states
+        return [transaction for position, transaction in enumerate(self.__order)
+                if positions.get(transaction) == position and states[transaction][2]]
+
+    def __mark_dirty(self, position: int):
+        if self.__dirty_from is None or position < self.__dirty_from:
+            self.__dirty_from = position
+
+    def __seed(self, account, position: int, balance: float):
+        '''
+        balance of the account before position, the seed of the smallest
+        position is kept
+        '''
+        seed = self.__seeds.get(account)
+        if seed is None or position < seed[0]:
+            self.__seeds[account] = (position, balance)
+
+    def __select(self, transaction, running: dict, start):
+        '''
+        take or skip the transaction, start(account, stored balance) gives
+        the balance of the accounts not in running
+        '''
+        from_id, to_id, amount = transaction.from_id, transaction.to_id, transaction.amount
+        state = self.__states.get(transaction)
+        from_balance = running[from_id] if from_id in running else start(
+            from_id, state[0] if state else None)
+        taken = from_balance >= amount
+        running[from_id] = from_balance - amount if taken else from_balance
+        to_balance = running[to_id] if to_id in running else start(
+            to_id, state[1] if state else None)
+        running[to_id] = to_balance + amount if taken else to_balance
+        self.__states[transaction] = (from_balance, to_balance, taken)
+
+    def __refresh(self):
+        '''
+        recompute the template from the first dirty position
+        '''
+        order, positions, seeds = self.__order, self.__positions, self.__seeds
+        base = self.__balances.at(self.__tip)
+        old_running, running = self.__running, {}
+        position = self.__dirty_from
+
+        def start(account, stored):
+            seed = seeds.get(account)
+            if seed is not None and position > seed[0]:
+                return base.item(account.index) if seed[1] is None else seed[1]
+            if stored is not None:
+                return stored
+            # not selected before, added after every selected transaction
+            return old_running[account] if account in old_running else base.item(account.index)
+
+        for position in range(self.__dirty_from, len(order)):
+            transaction = order[position]
+            if positions.get(transaction) == position:
+                self.__select(transaction, running, start)
+
+        for account, (_, balance) in seeds.items():
+            if account in running:
+                continue
+            if balance is None:
+                old_running.pop(account, None)
+            else:
+                old_running[account] = balance
+        old_running.update(running)
+        self.__dirty_from = None
+        self.__seeds = {}
+        self.__compact()
+
+    def __compact(self):
+        '''
+        drop the removed transactions from the order (template not dirty)
+        '''
+        order, positions = self.__order, self.__positions
+        if self.__dirty_from is not None or len(order) < self.COMPACT_MIN or 2*len(positions) > len(order):
+            return
+        self.__order = [transaction for position, transaction in enumerate(order)
+                        if positions.get(transaction) == position]
+        self.__positions = {transaction: position for position,
+                            transaction in enumerate(self.__order)}
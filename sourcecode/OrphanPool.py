@@ -0,0 +1,63 @@
+from typing import Any
+
+
+class OrphanPool:
+    '''
+    Blocks received before their parent, indexed by the missing parent.
+    The pool keeps at most max_size blocks for at most max_age (simulated
+    time), the oldest are evicted first.
+    '''
+
+    def __init__(self, max_size: int, max_age: float = None):
+        self.max_size = max_size
+        self.max_age = max_age
+        # orphan -> (arrival time, arrival number), in arrival order
+        self.__orphans: dict[Any, tuple[float, int]] = {}
+        self.__by_parent: dict[Any, list[Any]] = {}
+        self.__num_added = 0
+
+    def __len__(self) -> int:
+        return len(self.__orphans)
+
+    def __contains__(self, block) -> bool:
+        return block in self.__orphans
+
+    def __iter__(self):
+        return iter(self.__orphans)
+
+    def add(self, block: Any, now: float) -> bool:
+        '''
+        add a block whose parent is missing, False if it is already there
+        '''
+        if block in self.__orphans:
+            return False
+        self.__orphans[block] = (now, self.__num_added)
+        self.__num_added += 1
+        self.__by_parent.setdefault(block.prev_block, []).append(block)
+        self.__evict(now)
+        return True
+
+    def pop_children(self, parent: Any) -> list[tuple[int, Any]]:
+        '''
+        remove the orphans waiting for parent, (arrival number, orphan)
+        '''
+        return [(self.__orphans.pop(child)[1], child)
+                for child in self.__by_parent.pop(parent, [])]
+
+    def __remove(self, block: Any):
+        del self.__orphans[block]
+        siblings = self.__by_parent[block.prev_block]
+        siblings.remove(block)
+        if not siblings:
+            del self.__by_parent[block.prev_block]
+
+    def __evict(self, now: float):
+        orphans = self.__orphans
+        while len(orphans) > self.max_size:
+            self.__remove(next(iter(orphans)))
+        if self.max_age is not None:
+            while orphans:
+                oldest = next(iter(orphans))
+                if now - orphans[oldest][0] <= self.max_age:
+                    break
+                self.__remove(oldest)
@@ -1,34 +1,37 @@
-import random
 import logging
 from copy import deepcopy
 from typing import Union
 
 from Transaction import Transaction
 from Block import Block
-from utils import expon_distribution, generate_random_id
+from utils import generate_random_id, set_state
 from Block import BlockChain
-from DiscreteEventSim import simulation, Event, EventType
-from Link import Link
-
-from config import CONFIG
+from DiscreteEventSim import Simulation, Event, EventType
+from Link import Link, OneWayLINK, broadcast
+from logger import LazyDescription
 
 logger = logging.getLogger(__name__)
 
 
 class Peer:
 
-    def __init__(self, id, is_slow_network=False, is_slow_cpu=False):
-        # self.id: int = id
-        self.id: str = generate_random_id(3)
+    def __init__(self, simulation: Simulation, id, is_slow_network=False, is_slow_cpu=False):
+        self.simulation: Simulation = simulation
+        self.index: int = id  # position in the list of peers of the network
+        self.random_streams = simulation.random_streams.peer(id)
+        self.id: str = generate_random_id(
+            3, simulation.random_streams.ids)
         self.is_slow_network: float = is_slow_network
         self.is_slow_cpu: float = is_slow_cpu
-        self.crypto_coins: int = CONFIG.INITIAL_COINS
-        self.neighbours: dict["Peer", any] = {}
+        self.crypto_coins: int = simulation.config.INITIAL_COINS
+        self.neighbours: dict["Peer", OneWayLINK] = {}
         self.neighbours_meta: dict["Peer", Link] = {}
         self.cpu_power: float = self.__calculate_cpu_power()
 
         self.forwarded_messages: set[Union[Transaction, Block]] = set()
 
+    __setstate__ = set_state
+
     @property
     def cpu_net_description(self):
         desc_cpu = "slow" if self.is_slow_cpu else "fast"
@@ -38,18 +41,18 @@ class Peer:
         return f"CPU: {desc_cpu}, Net: {desc_net}"
 
     def __calculate_cpu_power(self) -> float:
-        num_peers = CONFIG.NUMBER_OF_PEERS
-        z1 = CONFIG.Z1
+        num_peers = self.simulation.config.NUMBER_OF_PEERS
+        z1 = self.simulation.config.Z1
         deno = (10-9*z1)*num_peers
         neu = 1
         low_cpu_power = round(neu/deno, 4)
         high_cpu_power = round(10*low_cpu_power, 4)
         return low_cpu_power if self.is_slow_cpu else high_cpu_power
 
-    def init_blockchain(self, peers: list["Peer"]):
-        self.block_chain = BlockChain(cpu_power=self.cpu_power,
+    def init_blockchain(self):
+        self.block_chain = BlockChain(self.simulation,
+                                      cpu_power=self.cpu_power,
                                       broadcast_block_function=self.broadcast_block,
-                                      peers=peers,
                                       owner_peer=self)
 
     def connect(self, peer: "Peer", link: Link):
@@ -81,27 +84,25 @@ class Peer:
     def __repr__(self):
         return f"Peer(id={self.id})"
 
-    def __forward_msg_to_peer(self, msg: Union[Transaction, Block], peer: "Peer"):
-        self.neighbours[peer](msg)
-
     def __forward_msg_to_peers(self, msg: Union[Transaction, Block], peers: list["Peer"]):
         '''
         Forward a message to given peers.
         '''
         self.forwarded_messages.add(msg.id)
 
-        for peer in peers:
-            self.__forward_msg_to_peer(msg, peer)
+        broadcast(self.simulation, msg,
+                  [self.neighbours[peer] for peer in peers])
 
     @ property
     def connected_peers(self):
         return list(self.neighbours.keys())
 
     def __create_txn(self, timestamp):
-        to_peer = random.choice(self.connected_peers)
-        amount = random.uniform(0, self.crypto_coins)
+        random_streams = self.random_streams
+        to_peer = random_streams.workload.choice(self.connected_peers)
+        amount = random_streams.workload.uniform(0, self.crypto_coins)
         self.crypto_coins -= amount
-        return Transaction(self, to_peer, amount, timestamp)
+        return Transaction(self, to_peer, amount, timestamp, random_streams.ids)
 
     def generate_random_txn(self, timestamp):
         '''
@@ -110,10 +111,11 @@ class Peer:
         # timestamp = simulation.clock
         new_txn = self.__create_txn(timestamp)
         self.block_chain.add_transaction(new_txn)
-        new_txn_event_description = f"{self.id}->*; {new_txn};"
+        new_txn_event_description = LazyDescription(
+            "{}->*; {};", self.id, new_txn)
         new_txn_event = Event(EventType.TXN_BROADCAST, timestamp,
-                              timestamp, self.broadcast_txn, (new_txn,), new_txn_event_description)
-        simulation.enqueue(new_txn_event)
+                              timestamp, self.broadcast_txn, (new_txn,), new_txn_event_description, self)
+        self.simulation.enqueue(new_txn_event)
 
     def receive_msg(self, msg: Union[Transaction, Block], source: "Peer"):
         '''
@@ -150,3 +152,21 @@ class Peer:
         Broadcast a block to all connected peers.
         '''
         self.broadcast_msg(block)
+
+
+class RemotePeer(Peer):
+    '''
+    Stub of a peer simulated by another process (parallel.py): the end of
+    the links to it and the account of the transactions sent to it.
+    '''
+
+    def __init__(self, simulation: Simulation, id, is_slow_network=False, is_slow_cpu=False):
+        self.simulation: Simulation = simulation
+        self.index: int = id
+        # drawn as by Peer, the ids of the other peers stay the same
+        self.id: str = generate_random_id(
+            3, simulation.random_streams.ids)
+        self.is_slow_network: float = is_slow_network
+        self.is_slow_cpu: float = is_slow_cpu
+        self.neighbours: dict["Peer", OneWayLINK] = {}
+        self.neighbours_meta: dict["Peer", Link] = {}
@@ -1,4 +1,6 @@
-from utils import generate_random_id
+import random
+from utils import generate_random_id, set_state
+from logger import LazyDescription
 import logging
 
 from DiscreteEventSim import EventType
@@ -7,15 +9,18 @@ logger = logging.getLogger(__name__)
 
 
 class Transaction:
-    def __init__(self, from_id, to_id, amount, timestamp):
-        self.txn_id: str = generate_random_id(6)
+    def __init__(self, from_id, to_id, amount, timestamp, rng: random.Random = random):
+        self.txn_id: str = generate_random_id(6, rng)
         self.from_id: "Peer" = from_id
         self.to_id: "Peer" = to_id
         self.amount: float = amount
         self.timestamp: float = timestamp
         self.size: int = 1  # KB
 
-        logger.debug(f"{self} <{EventType.TXN_CREATE}>: {self.description()}")
+        logger.debug("%s <%s>: %s", self, EventType.TXN_CREATE,
+                     LazyDescription(self.description))
+
+    __setstate__ = set_state
 
     @property
     def id(self) -> str:
@@ -39,10 +44,10 @@ class Transaction:
 
 
 class CoinBaseTransaction(Transaction):
-    def __init__(self, to_id, timestamp):
-        super().__init__(from_id=None, to_id=to_id, amount=50, timestamp=timestamp)
-        logger.debug(
-            f"{self} coinbase <{EventType.TXN_CREATE}>: {self.description()}")
+    def __init__(self, to_id, timestamp, rng: random.Random = random):
+        super().__init__(from_id=None, to_id=to_id, amount=50, timestamp=timestamp, rng=rng)
+        logger.debug("%s coinbase <%s>: %s", self, EventType.TXN_CREATE,
+                     LazyDescription(self.description))
 
     def description(self) -> str:
         return (f"CoinBase(id:{self.txn_id} to:{(self.to_id)}, :{self.amount}, 󰔛:{self.timestamp})")
@@ -0,0 +1,182 @@
+'''
+Benchmark of fixed-seed scenarios with a regression gate.
+
+usage: python benchmark.py [--scenarios peers_20,fork_heavy] [--repeat N]
+                           [--baseline benchmark_baseline.json] [--threshold 0.2]
+                           [--save-baseline]
+
+Every scenario runs in a fresh process (so peak RSS is its own) and records
+wall time of setup, run and export_data, events run per second and peak RSS.
+Results are written to benchmark_results.json. If the baseline file exists,
+every scenario is compared with it and the exit status is 1 if any of them
+is worse than the baseline by more than threshold (relative).
+'''
+import os
+import sys
+import json
+import argparse
+import resource
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+BENCHMARK_SEED = 1
+SCENARIOS = {
+    # scaling the number of peers
+    "peers_20": {"NUMBER_OF_PEERS": 20, "TARGET_NUM_BLOCKS": 20, "TXN_PER_BLOCK": 50},
+    "peers_200": {"NUMBER_OF_PEERS": 200, "TARGET_NUM_BLOCKS": 5, "TXN_PER_BLOCK": 50},
+    "peers_2000": {"NUMBER_OF_PEERS": 2000, "TARGET_NUM_BLOCKS": 2, "TXN_PER_BLOCK": 50},
+    # long chains
+    "blocks_100": {"NUMBER_OF_PEERS": 20, "TARGET_NUM_BLOCKS": 100, "TXN_PER_BLOCK": 20},
+    # large blocks
+    "txn_per_block_500": {"NUMBER_OF_PEERS": 20, "TARGET_NUM_BLOCKS": 5, "TXN_PER_BLOCK": 500},
+    # blocks faster than they propagate: many forks
+    "fork_heavy": {"NUMBER_OF_PEERS": 50, "TARGET_NUM_BLOCKS": 30, "TXN_PER_BLOCK": 20,
+                   "AVG_BLOCK_MINING_TIME": 20*1000},
+}
+# metric -> True if larger is better
+GATED_METRICS = {
+    "wall_time": False,
+    "events_per_second": True,
+    "peak_rss_mb": False,
+    "export_time": False,
+}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on linux, bytes on macOS
+    return peak/(1024*1024) if sys.platform == "darwin" else peak/1024
+
+
+def run_scenario(overrides: dict, seed) -> dict:
+    '''
+    Run one scenario and export its results (worker process).
+    '''
+    # imported here so that the logger is initialised in the worker
+    import simulation as SIM
+    from config import CONFIG
+
+    config = CONFIG(METRICS=True, **overrides)
+    cwd = os.getcwd()
+    # export_data writes into the working directory, removed afterwards
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as workdir:
+        os.chdir(workdir)
+        try:
+            start_time = perf_counter()
+            simulation_run = SIM.setup_simulation(config, seed)
+            setup_time = perf_counter() - start_time
+
+            start_time = perf_counter()
+            SIM.run_simulation(simulation_run, show_progress=False)
+            run_time = perf_counter() - start_time
+
+            simulation, peers = simulation_run.simulation, simulation_run.peers
+            start_time = perf_counter()
+            SIM.export_data(simulation, peers)
+            export_time = perf_counter() - start_time
+        finally:
+            os.chdir(cwd)
+
+    metrics = simulation.metrics
+    return {
+        "wall_time": round(setup_time + run_time + export_time, 3),
+        "setup_time": round(setup_time, 3),
+        "run_time": round(run_time, 3),
+        "export_time": round(export_time, 3),
+        "num_events": metrics.num_events,
+        "events_per_second": round(metrics.num_events/run_time, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "simulation_time": simulation.clock,
+    }
+
+
+def run_benchmark(names: list[str], repeat: int = 1) -> dict:
+    '''
+    best of repeat runs (by wall time) of every scenario
+    '''
+    results = {}
+    context = mp.get_context("spawn")
+    for name in names:
+        runs = []
+        for _ in range(repeat):
+            # a fresh process per run, peak RSS is not shared between runs
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(
+                    run_scenario, SCENARIOS[name], BENCHMARK_SEED).result())
+        results[name] = min(runs, key=lambda run: run["wall_time"])
+        print(f"{name.ljust(20)} {results[name]['wall_time']:9.3f}s "
+              f"{results[name]['events_per_second']:12.1f} events/s "
+              f"{results[name]['peak_rss_mb']:9.1f} MB")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    '''
+    regressions of results with respect to baseline
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result["num_events"] != expected["num_events"]:
+            print(f"{name}: {result['num_events']} events, baseline had "
+                  f"{expected['num_events']} (the workload changed)")
+        for metric, larger_is_better in GATED_METRICS.items():
+            value, reference = result[metric], expected[metric]
+            if not reference:
+                continue
+            change = (value - reference)/reference
+            if larger_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append(
+                    f"{name}: {metric} {reference} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma separated names of scenarios")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs per scenario, the fastest is kept")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    names = args.scenarios.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}, known: {list(SCENARIOS)}")
+
+    results = run_benchmark(names, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, nothing to compare")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    if not regressions:
+        print(f"No regression beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+'''
+Checkpoints of a running simulation.
+A checkpoint is a zlib compressed pickle of the simulation run: clock,
+pending events, peers, links, blockchains, blocks, transactions and random
+streams. Loading it gives back the run exactly as it was when it was saved.
+'''
+import os
+import sys
+import types
+import pickle
+import zlib
+
+CHECKPOINT_MAGIC = b"P2PSIM-CKPT-1\n"
+COMPRESSION_LEVEL = 1  # fast, most of the gain is in the repeated ids
+
+
+class CheckpointPickler(pickle.Pickler):
+    '''
+    Pickler for bound methods of private functions (event actions such as
+    BlockChain.__mine_block_end), default pickling looks them up by their
+    unmangled name.
+    '''
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, types.MethodType):
+            return NotImplemented
+        name = obj.__func__.__name__
+        if name.startswith('__') and not name.endswith('__'):
+            class_name = obj.__func__.__qualname__.rsplit('.', 2)[-2]
+            name = f"_{class_name.lstrip('_')}{name}"
+        return getattr, (obj.__self__, name)
+
+
+def _raise_recursion_limit(limit: int) -> int:
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, limit))
+    return old_limit
+
+
+def save(path: str, obj, blocks: list = ()):
+    '''
+    Save obj to path.
+    blocks (parents before children) are pickled first so that the chains of
+    prev_block references are not pickled recursively.
+    '''
+    old_limit = _raise_recursion_limit(100*1000)
+    try:
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(CHECKPOINT_MAGIC)
+            compressor = zlib.compressobj(COMPRESSION_LEVEL)
+            writer = _CompressedWriter(f, compressor)
+            CheckpointPickler(writer, pickle.HIGHEST_PROTOCOL).dump(
+                (list(blocks), obj))
+            f.write(compressor.flush())
+        # keep the previous checkpoint until the new one is complete
+        os.replace(f"{path}.tmp", path)
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+
+def load(path: str):
+    '''
+    Load the object saved by save()
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError(f"{path} is not a simulation checkpoint")
+        data = zlib.decompress(f.read())
+    old_limit = _raise_recursion_limit(100*1000)
+    try:
+        _, obj = pickle.loads(data)
+    finally:
+        sys.setrecursionlimit(old_limit)
+    return obj
+
+
+class _CompressedWriter:
+    def __init__(self, file, compressor):
+        self.file = file
+        self.compressor = compressor
+
+    def write(self, data) -> int:
+        self.file.write(self.compressor.compress(data))
+        return len(data)
@@ -1,3 +1,6 @@
+from utils import set_state
+
+
 class CONFIG:
     '''
     Simulation configuration
@@ -9,6 +12,8 @@ class CONFIG:
     Z0 = 0.7  # network z0 is slow
     Z1 = 0.8  # cpu z1 is slow
     AVG_TXN_INTERVAL_TIME = 10*1000
+    TXN_INTERVAL_DISTRIBUTION = "exponential"  # exponential | uniform | constant
+    TXN_PEER_RATES = None  # relative transaction rate of every peer, None: equal
     AVG_BLOCK_MINING_TIME = 1000*1000  # avg block interval time (ms)
 
     # tuning parameters
@@ -30,6 +35,47 @@ class CONFIG:
     # mean of exponential time interval bw transactions (ms)
     INITIAL_COINS = 1000
     EVENT_QUEUE_TIMEOUT = 5
+    EVENT_QUEUE = "heap"  # heap | calendar
+    LAZY_FANOUT = False  # one pending event per broadcast instead of per link
+    CHECKPOINT_INTERVAL = None  # simulated time between checkpoints (ms)
+    CHECKPOINT_PATH = "simulation.ckpt"
+    END_TIME = None  # simulated time at which the run stops (ms), None: no limit
+    NUM_PARTITIONS = 2  # processes of the parallel engine (parallel.py)
+    METRICS = True  # per event type counts, handler times and queue depths
+    PROFILER = None  # None | cprofile | sampling (profiler.py)
+    PROFILE_WINDOW = None  # (start, end) simulated time to profile (ms), None: whole run
+    PROFILE_PATH = "profile"  # prefix of the profile files
+    ORPHAN_POOL_SIZE = 1000  # blocks kept per peer while their parent is missing
+    ORPHAN_MAX_AGE = 10*AVG_BLOCK_MINING_TIME  # simulated time an orphan is kept (ms)
+    FINALITY_DEPTH = None  # blocks below the tips after which a block is final, None: never
+
+    def __init__(self, **overrides):
+        '''
+        configuration of one simulation, overrides replace the defaults above
+        '''
+        for key, value in overrides.items():
+            if not hasattr(CONFIG, key):
+                raise AttributeError(f"unknown config parameter {key}")
+            setattr(self, key, value)
+        self.__update_derived_parameters(overrides)
+
+    def __update_derived_parameters(self, overrides: dict):
+        '''
+        recompute derived parameters which are not overridden explicitly
+        '''
+        derived = {
+            "TOTAL_NUM_BLOCKS": lambda: self.TARGET_NUM_BLOCKS,
+            "TOTAL_NUM_TRANSACTIONS": lambda: self.TARGET_NUM_BLOCKS*self.TXN_PER_BLOCK,
+            "TXN_PER_PEER": lambda: self.TOTAL_NUM_TRANSACTIONS/self.NUMBER_OF_PEERS,
+            "BLOCK_TXNS_MIN_THRESHOLD": lambda: min(50, self.TXN_PER_BLOCK),
+            "BLOCK_TXNS_TRIGGER_THRESHOLD": lambda: self.TXN_PER_BLOCK,
+            "ORPHAN_MAX_AGE": lambda: 10*self.AVG_BLOCK_MINING_TIME,
+        }
+        for key, value in derived.items():
+            if key not in overrides:
+                setattr(self, key, value())
+
+    __setstate__ = set_state
 
     @property
     def __dict__(self) -> dict:
@@ -39,6 +85,8 @@ class CONFIG:
             "Z0": self.Z0,
             "Z1": self.Z1,
             "AVG_TXN_INTERVAL_TIME": self.AVG_TXN_INTERVAL_TIME,
+            "TXN_INTERVAL_DISTRIBUTION": self.TXN_INTERVAL_DISTRIBUTION,
+            "TXN_PEER_RATES": self.TXN_PEER_RATES,
             "AVG_BLOCK_MINING_TIME": self.AVG_BLOCK_MINING_TIME,
             "TARGET_NUMBER_OF_BLOCKS": self.TARGET_NUM_BLOCKS,
             "NUMBER_OF_TXNS_PER_BLOCK": self.TXN_PER_BLOCK,
@@ -49,4 +97,17 @@ class CONFIG:
             "BLOCK_TXNS_TRIGGER_THRESHOLD": self.BLOCK_TXNS_TRIGGER_THRESHOLD,
             "INITIAL_COINS": self.INITIAL_COINS,
             "EVENT_QUEUE_TIMEOUT": self.EVENT_QUEUE_TIMEOUT,
+            "EVENT_QUEUE": self.EVENT_QUEUE,
+            "LAZY_FANOUT": self.LAZY_FANOUT,
+            "CHECKPOINT_INTERVAL": self.CHECKPOINT_INTERVAL,
+            "CHECKPOINT_PATH": self.CHECKPOINT_PATH,
+            "END_TIME": self.END_TIME,
+            "NUM_PARTITIONS": self.NUM_PARTITIONS,
+            "METRICS": self.METRICS,
+            "PROFILER": self.PROFILER,
+            "PROFILE_WINDOW": self.PROFILE_WINDOW,
+            "PROFILE_PATH": self.PROFILE_PATH,
+            "ORPHAN_POOL_SIZE": self.ORPHAN_POOL_SIZE,
+            "ORPHAN_MAX_AGE": self.ORPHAN_MAX_AGE,
+            "FINALITY_DEPTH": self.FINALITY_DEPTH,
         })
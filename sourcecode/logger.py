@@ -16,3 +16,28 @@ def init_logger():
     logger = logging.getLogger(__name__)
     logging.disable(logging.CRITICAL + 1)
     return logger
+
+
+class LazyDescription:
+    '''
+    Description which is rendered only when it is converted to a string.
+    Pass it as a logging argument (or as an event meta description) so that
+    no formatting is done unless a handler actually emits the record.
+    formatter is either a format string or a callable taking args.
+    '''
+    __slots__ = ('formatter', 'args')
+
+    def __init__(self, formatter, *args):
+        self.formatter = formatter
+        self.args = args
+
+    def __str__(self) -> str:
+        if isinstance(self.formatter, str):
+            return self.formatter.format(*self.args)
+        return self.formatter(*self.args)
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+    def __repr__(self) -> str:
+        return str(self)
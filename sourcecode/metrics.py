@@ -0,0 +1,272 @@
+'''
+Wall-clock metrics of the event handlers of a simulation: per event type
+the number of events, total and percentile handler time and the depth of
+the event queue, exported with the results (json) and as a Prometheus text
+file.
+'''
+from time import perf_counter
+
+import numpy as np
+
+
+class LatencyHistogram:
+    '''
+    Histogram of durations in ns with HdrHistogram style buckets: every
+    power of two is split into SUB_BUCKETS linear buckets, so a recorded
+    value is off by less than 1/SUB_BUCKETS of itself.
+    '''
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+
+    @classmethod
+    def bucket_of(cls, value: int) -> int:
+        magnitude = value.bit_length() - cls.SUB_BUCKET_BITS
+        if magnitude <= 0:
+            return value
+        return (magnitude << cls.SUB_BUCKET_BITS) | ((value >> (magnitude - 1)) & (cls.SUB_BUCKETS - 1))
+
+    @classmethod
+    def bucket_range(cls, bucket: int) -> tuple[int, int]:
+        '''
+        [lower, upper) of the values in the bucket
+        '''
+        magnitude, sub_bucket = bucket >> cls.SUB_BUCKET_BITS, bucket & (
+            cls.SUB_BUCKETS - 1)
+        if magnitude == 0:
+            return sub_bucket, sub_bucket + 1
+        lower = (cls.SUB_BUCKETS + sub_bucket) << (magnitude - 1)
+        return lower, lower + (1 << (magnitude - 1))
+
+    @classmethod
+    def buckets_of(cls, values: np.ndarray) -> np.ndarray:
+        '''
+        bucket_of() of every value (non-negative, below 2**53)
+        '''
+        _, bit_lengths = np.frexp(values)
+        magnitudes = bit_lengths.astype(np.int64) - cls.SUB_BUCKET_BITS
+        shifts = np.maximum(magnitudes - 1, 0)
+        buckets = (magnitudes << cls.SUB_BUCKET_BITS) | (
+            (values >> shifts) & (cls.SUB_BUCKETS - 1))
+        return np.where(magnitudes <= 0, values, buckets)
+
+    def record(self, value: int):
+        bucket = self.bucket_of(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+
+    def add(self, buckets: np.ndarray):
+        '''
+        record values given by their buckets
+        '''
+        counts = self.counts
+        for bucket, count in zip(*(x.tolist() for x in np.unique(buckets, return_counts=True))):
+            counts[bucket] = counts.get(bucket, 0) + count
+
+    def percentile(self, percent: float) -> float:
+        '''
+        value below which percent of the recorded values are (middle of the bucket)
+        '''
+        total = sum(self.counts.values())
+        if not total:
+            return 0
+        rank = percent/100*total
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                break
+        lower, upper = self.bucket_range(bucket)
+        return (lower + upper - 1)/2
+
+    def cumulative_counts(self) -> list[tuple[int, int]]:
+        '''
+        (upper bound, number of values below it) at every power of two
+        with recorded values
+        '''
+        cumulative, seen = {}, 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            upper = self.bucket_range(bucket)[1]
+            cumulative[1 << (upper - 1).bit_length()] = seen
+        return list(cumulative.items())
+
+
+class EventTypeMetrics:
+    '''
+    metrics of one event type
+    '''
+    __slots__ = ('count', 'handler_time_ns', 'histogram', 'max_queue_depth')
+
+    def __init__(self):
+        self.count = 0
+        self.handler_time_ns = 0
+        self.histogram = LatencyHistogram()
+        self.max_queue_depth = 0
+
+    def __getstate__(self):
+        return (self.count, self.handler_time_ns, self.histogram, self.max_queue_depth)
+
+    def __setstate__(self, state):
+        self.count, self.handler_time_ns, self.histogram, self.max_queue_depth = state
+
+
+class EventMetrics:
+    '''
+    Metrics of the events run by a simulation (CONFIG.METRICS).
+    record() only appends to three lists, the recorded events are folded
+    into the per event type metrics with numpy every FLUSH_EVERY events and
+    when the run stops.
+    '''
+    PERCENTILES = (50, 90, 99, 99.9)
+    FLUSH_EVERY = 1 << 16
+
+    def __init__(self):
+        self.event_types: dict[object, EventTypeMetrics] = {}
+        self.queue_depth_high_water = 0
+        self.wall_time = 0.0
+        self.__started_at = None
+        # events recorded since the last flush()
+        self.__types = []
+        self.__handler_times = []
+        self.__queue_depths = []
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        state['_EventMetrics__started_at'] = None
+        return state
+
+    def start(self):
+        self.__started_at = perf_counter()
+
+    def stop(self):
+        if self.__started_at is not None:
+            self.wall_time += perf_counter() - self.__started_at
+            self.__started_at = None
+        self.flush()
+
+    def record(self, event_type, handler_time_ns: int, queue_depth: int):
+        '''
+        event_type ran for handler_time_ns with queue_depth events queued
+        '''
+        self.__types.append(event_type)
+        self.__handler_times.append(handler_time_ns)
+        self.__queue_depths.append(queue_depth)
+        if len(self.__types) >= self.FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        '''
+        fold the recorded events into the metrics of their event types
+        '''
+        types = self.__types
+        if not types:
+            return
+        type_ids = np.fromiter(map(id, types), dtype=np.int64, count=len(types))
+        handler_times = np.array(self.__handler_times, dtype=np.int64)
+        queue_depths = np.array(self.__queue_depths, dtype=np.int64)
+        buckets = LatencyHistogram.buckets_of(handler_times)
+        _, first_indices, inverse = np.unique(
+            type_ids, return_index=True, return_inverse=True)
+        for i, first_index in enumerate(first_indices.tolist()):
+            event_type = types[first_index]
+            metrics = self.event_types.get(event_type)
+            if metrics is None:
+                metrics = self.event_types[event_type] = EventTypeMetrics()
+            selected = inverse == i
+            metrics.count += int(selected.sum())
+            metrics.handler_time_ns += int(handler_times[selected].sum())
+            metrics.histogram.add(buckets[selected])
+            metrics.max_queue_depth = max(
+                metrics.max_queue_depth, int(queue_depths[selected].max()))
+        self.queue_depth_high_water = max(
+            self.queue_depth_high_water, int(queue_depths.max()))
+        self.__types = []
+        self.__handler_times = []
+        self.__queue_depths = []
+
+    @property
+    def num_events(self) -> int:
+        return sum(metrics.count for metrics in self.event_types.values())
+
+    @property
+    def events_per_second(self) -> float:
+        if not self.wall_time:
+            return 0
+        return self.num_events/self.wall_time
+
+    def __sorted_event_types(self) -> list:
+        return sorted(self.event_types.items(), key=lambda x: x[0].name)
+
+    def summary(self) -> dict:
+        '''
+        json serialisable metrics, times in µs
+        '''
+        self.flush()
+        event_types = {}
+        for event_type, metrics in self.__sorted_event_types():
+            event_types[event_type.name] = {
+                "count": metrics.count,
+                "total_handler_time_us": round(metrics.handler_time_ns/1000, 3),
+                "mean_handler_time_us": round(metrics.handler_time_ns/metrics.count/1000, 3),
+                "handler_time_percentiles_us": {
+                    f"p{percent}": round(metrics.histogram.percentile(percent)/1000, 3) for percent in self.PERCENTILES
+                },
+                "max_queue_depth": metrics.max_queue_depth,
+                "events_per_second": round(metrics.count/self.wall_time, 1) if self.wall_time else 0,
+            }
+        return {
+            "num_events": self.num_events,
+            "wall_time": round(self.wall_time, 3),
+            "events_per_second": round(self.events_per_second, 1),
+            "queue_depth_high_water": self.queue_depth_high_water,
+            "event_types": event_types,
+        }
+
+    def to_prometheus(self, prefix: str = "p2psim") -> str:
+        '''
+        metrics in the Prometheus text exposition format
+        '''
+        self.flush()
+        event_types = self.__sorted_event_types()
+        lines = [
+            f"# HELP {prefix}_events_total Events run, by event type.",
+            f"# TYPE {prefix}_events_total counter",
+        ]
+        lines += [f'{prefix}_events_total{{event_type="{event_type.name}"}} {metrics.count}'
+                  for event_type, metrics in event_types]
+        lines += [
+            f"# HELP {prefix}_event_handler_seconds Wall-clock time of the event handlers.",
+            f"# TYPE {prefix}_event_handler_seconds histogram",
+        ]
+        for event_type, metrics in event_types:
+            label = f'event_type="{event_type.name}"'
+            for upper, seen in metrics.histogram.cumulative_counts():
+                lines.append(
+                    f'{prefix}_event_handler_seconds_bucket{{{label},le="{upper/1e9:g}"}} {seen}')
+            lines += [
+                f'{prefix}_event_handler_seconds_bucket{{{label},le="+Inf"}} {metrics.count}',
+                f'{prefix}_event_handler_seconds_sum{{{label}}} {metrics.handler_time_ns/1e9:g}',
+                f'{prefix}_event_handler_seconds_count{{{label}}} {metrics.count}',
+            ]
+        lines += [
+            f"# HELP {prefix}_event_queue_depth_max Largest number of queued events when an event ran.",
+            f"# TYPE {prefix}_event_queue_depth_max gauge",
+        ]
+        lines += [f'{prefix}_event_queue_depth_max{{event_type="{event_type.name}"}} {metrics.max_queue_depth}'
+                  for event_type, metrics in event_types]
+        lines += [
+            f"# HELP {prefix}_events_per_second Events run per wall-clock second.",
+            f"# TYPE {prefix}_events_per_second gauge",
+            f"{prefix}_events_per_second {self.events_per_second:g}",
+            f"# HELP {prefix}_run_seconds Wall-clock time spent running events.",
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {self.wall_time:g}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str = "metrics.prom"):
+        with open(path, 'w') as f:
+            f.write(self.to_prometheus())
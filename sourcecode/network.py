@@ -1,7 +1,8 @@
-import random
-from Peer import Peer
+from Peer import Peer, RemotePeer
 from Link import Link
-from config import CONFIG
+from DiscreteEventSim import Simulation
+from Block import GENESIS_BLOCK
+from BlockDAG import BlockDAG
 
 
 def is_connected(peers: list[Peer]):
@@ -36,34 +37,60 @@ def draw_graph(peers):
     plt.show()
 
 
-def create_network(n: int) -> list[Peer]:
+def random_topology(n: int, config, rng) -> tuple[list[bool], list[bool], list[tuple[int, int, float]]]:
+    '''
+    slow network and slow cpu flags of every peer and the links
+    (peer, neighbour, pij), drawn from the network stream
+    '''
     is_slow_nets = [False] * n
     is_slow_cpus = [False] * n
-    for i in random.sample(list(range(n)), round(n*CONFIG.Z0)):
+    for i in rng.sample(list(range(n)), round(n*config.Z0)):
         is_slow_nets[i] = True
-    for i in random.sample(list(range(n)), round(n*CONFIG.Z1)):
+    for i in rng.sample(list(range(n)), round(n*config.Z1)):
         is_slow_cpus[i] = True
 
-    peers = [Peer(id=i, is_slow_network=is_slow_nets[i], is_slow_cpu=is_slow_cpus[i])
-             for i in range(n)]
+    links = []
+    for i in range(n):
+        # choose random number of neighbours
+        num_neighbours = rng.randint(4, 6)
+        # num_neighbours = random.randint(2, 3)
+        random_neighbours = rng.sample(
+            range(n), num_neighbours)  # choose random neighbours
+        for j in random_neighbours:
+            if j != i:  # don't add yourself as a neighbour
+                links.append((i, j, rng.uniform(10, 501)))  # ρij (ms)
+    return is_slow_nets, is_slow_cpus, links
 
-    for peer in peers:
-        peer.init_blockchain(peers=peers)
 
+def create_network(n: int, simulation: Simulation, local_peers: set[int] = None) -> list[Peer]:
+    '''
+    local_peers: indices of the peers to simulate, None: all
+    (the other peers are simulated by another process, parallel.py, and
+    only a stub is created for them; links between two of them are left out)
+    '''
+    config = simulation.config
+    is_slow_nets, is_slow_cpus, links = random_topology(
+        n, config, simulation.random_streams.network)
+
+    peers = [(Peer if local_peers is None or i in local_peers else RemotePeer)(
+        simulation, id=i, is_slow_network=is_slow_nets[i], is_slow_cpu=is_slow_cpus[i])
+        for i in range(n)]
+
+    simulation.block_dag = BlockDAG(
+        GENESIS_BLOCK, {peer: config.INITIAL_COINS for peer in peers}, config.FINALITY_DEPTH)
     for peer in peers:
-        # choose random number of neighbours
-        num_neighbours = random.randint(4, 6)
-        # num_neighbours = random.randint(2, 3)
-        random_neighbours = random.sample(
-            peers, num_neighbours)  # choose random neighbours
-        for neighbour in random_neighbours:
-            if neighbour != peer:  # don't add yourself as a neighbour
-                link = Link(peer, neighbour)
-                # add neighbour to peer
-                peer.connect(peer=neighbour, link=link)
-                # add peer to neighbour
-                neighbour.connect(peer=peer, link=link)
+        if not isinstance(peer, RemotePeer):
+            peer.init_blockchain()
+
+    for i, j, pij in links:
+        if local_peers is None or i in local_peers or j in local_peers:
+            peer, neighbour = peers[i], peers[j]
+            link = Link(simulation, peer, neighbour, pij)
+            # add neighbour to peer
+            peer.connect(peer=neighbour, link=link)
+            # add peer to neighbour
+            neighbour.connect(peer=peer, link=link)
     if is_connected(peers):
         return peers
     else:
-        return create_network(n)
+        return create_network(n, simulation, local_peers)
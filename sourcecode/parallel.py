@@ -0,0 +1,787 @@
+'''
+Conservative parallel simulation, partitioned by peer.
+
+usage: python parallel.py [num_partitions] --end-time ms [--peers N] [--blocks N]
+                          [--seed N] [--verify]
+
+Peers are partitioned so that the links between partitions are slow: links
+are merged by increasing propagation delay (pij) into groups of at most
+NUMBER_OF_PEERS/num_partitions peers, the groups are packed into the
+partitions. Every logical process (one OS process per partition) draws the
+same network from the seed but only builds the peers of its partition, with
+a stub (RemotePeer) for the peers of other partitions, the links with a
+local peer and the transaction arrivals of its peers. Messages sent over a
+link to a peer of another partition are handed to the process of that peer
+at the end of a round.
+
+Synchronisation is in rounds, without a coordinator: at the end of a round
+every process sends the others its messages to them, the time of its next
+event and the earliest arrival of its messages to every process. With T_j
+the next event of process j after the deliveries and D_ji the smallest sum
+of the pij of a chain of links from partition j to partition i (D_ii: the
+round trip to another partition and back), process i runs its events before
+min over j of T_j + D_ji. No event, in this round or a later one, can send
+a message that arrives at process i before that, so no process ever
+receives a message in its past, and a process far from the others runs
+ahead.
+
+The block trigger and the termination of simulation.py (SimulationRun
+hooks) depend on the events of all peers and are evaluated exactly, so a run
+gives the same results as simulation.py for the same seed (--verify):
+- every process logs the transactions and block events of its hooks and
+  sends the log with its next event time. The logs before the earliest next
+  event of all processes are complete, every process replays them in time
+  order (GlobalHooks, every process has a copy and draws the same miners)
+  and the miner's process enqueues the triggered block. A block triggered at
+  t is created at t + 10 and actionable at 2*(t + 10), no round ends past
+  that point for the earliest next event, so triggered blocks are never in
+  the past of a process.
+- the run stops right after TOTAL_NUM_BLOCKS + 6 blocks are broadcast. A
+  broadcast follows a queued mining event or a mining time not drawn yet,
+  the next mining times of a peer are peeked from its stream. No round ends
+  past the time by which the remaining broadcasts could have happened at
+  the earliest, so the blocks broadcast in a round never exceed the count
+  simulation.py stops at, and the process which broadcasts the last block
+  stops right after it.
+'''
+import io
+import sys
+import heapq
+import bisect
+import argparse
+import json
+import math
+import queue
+import pickle
+import traceback
+import multiprocessing as mp
+from time import time
+
+import numpy as np
+
+import simulation as SIM
+from network import create_network, random_topology
+from DiscreteEventSim import Simulation, EventType, HookType
+from random_streams import RandomStream, RandomStreams
+from Transaction import Transaction
+from Block import Block, GENESIS_BLOCK
+from Peer import Peer
+from config import CONFIG
+
+
+def partition_peers(num_peers: int, num_partitions: int, links: list[tuple[int, int, float]]) -> list[int]:
+    '''
+    partition of every peer: the links (peer, neighbour, pij) are merged by
+    increasing pij into groups of at most num_peers/num_partitions peers
+    (Kruskal), the largest groups first go to the smallest partition
+    '''
+    max_size = max(1, num_peers//num_partitions)
+    groups = list(range(num_peers))  # union-find parent of every peer
+    sizes = [1]*num_peers
+
+    def find(peer: int) -> int:
+        while groups[peer] != peer:
+            groups[peer] = groups[groups[peer]]
+            peer = groups[peer]
+        return peer
+
+    for i, j, _ in sorted(links, key=lambda link: link[2]):
+        i, j = find(i), find(j)
+        if i != j and sizes[i] + sizes[j] <= max_size:
+            groups[j] = i
+            sizes[i] += sizes[j]
+    members: dict[int, list[int]] = {}
+    for peer in range(num_peers):
+        members.setdefault(find(peer), []).append(peer)
+    partition, loads = [0]*num_peers, [0]*num_partitions
+    for group in sorted(members.values(), key=lambda group: (-len(group), group[0])):
+        index = loads.index(min(loads))
+        for peer in group:
+            partition[peer] = index
+        loads[index] += len(group)
+    return partition
+
+
+def partition_delays(partition: list[int], links: list[tuple[int, int, float]]) -> list[list[float]]:
+    '''
+    delays[j][i]: smallest delay of a chain of messages from partition j to
+    partition i over links between partitions (delays[i][i]: round trip),
+    shortest paths by Floyd-Warshall
+    '''
+    num_partitions = max(partition) + 1
+    delays = [[math.inf]*num_partitions for _ in range(num_partitions)]
+    for i, j, pij in links:
+        a, b = partition[i], partition[j]
+        if a != b:
+            delays[a][b] = delays[b][a] = min(delays[a][b], pij)
+    for via in range(num_partitions):
+        for a in range(num_partitions):
+            for b in range(num_partitions):
+                delays[a][b] = min(delays[a][b], delays[a][via] + delays[via][b])
+    return delays
+
+
+def setup_partition(config: CONFIG, seed, local_peers: set[int] = None) -> tuple[Simulation, list[Peer]]:
+    '''
+    Create the simulation of the peers in local_peers (None: all peers).
+    '''
+    simulation = Simulation(config, seed)
+    peers = create_network(config.NUMBER_OF_PEERS, simulation, local_peers)
+    SIM.schedule_transactions(simulation, peers, local_peers)
+    return simulation, peers
+
+
+def trigger_time(time: float) -> float:
+    '''
+    time at which the block triggered by a transaction broadcast at time is
+    created (simulation.block_trigger_event)
+    '''
+    return 2*(time + 10)
+
+
+# events of the peers of a process the global hooks depend on
+HOOK_TXN = 0  # transaction broadcast
+HOOK_RESET = 1  # block event enqueued (mining or broadcast)
+
+
+class GlobalHooks:
+    '''
+    Block trigger and termination of SimulationRun. The hook events of all
+    processes are replayed in time order once every process is past them,
+    every process has a copy and takes the same decisions.
+    '''
+
+    def __init__(self, config: CONFIG, seed, num_processes: int):
+        self.config = config
+        # miners of the triggered blocks, drawn as by SimulationRun
+        self.workload = RandomStreams(seed).workload
+        self.free_txns = 0
+        self.blocks_broadcasted = 0
+        # hook events not replayed yet, (time, kind) by process
+        self.pending: list[list[tuple[float, int]]] = [
+            [] for _ in range(num_processes)]
+
+    @ property
+    def remaining_blocks(self) -> int:
+        '''
+        broadcasts until the run stops
+        '''
+        return self.config.TOTAL_NUM_BLOCKS + 6 - self.blocks_broadcasted
+
+    def add(self, logs: list[list[tuple[float, int]]], blocks_broadcasted: int):
+        '''
+        hook events run by every process (in the order it ran them) and
+        blocks broadcast since the last call
+        '''
+        for pending, log in zip(self.pending, logs):
+            pending += log
+        self.blocks_broadcasted += blocks_broadcasted
+
+    def replay(self, until: float) -> list[tuple[float, int]]:
+        '''
+        (time, miner index) of the blocks triggered by the hook events before
+        until, all the events before until have been run
+        '''
+        threshold = self.config.BLOCK_TXNS_TRIGGER_THRESHOLD*5
+        parts = []
+        for source, pending in enumerate(self.pending):
+            position = bisect.bisect_left(pending, (until,))
+            parts.append([(time, source, kind)
+                          for time, kind in pending[:position]])
+            del pending[:position]
+        triggers = []
+        for time, _, kind in heapq.merge(*parts):
+            if kind == HOOK_RESET:
+                self.free_txns = 0
+                continue
+            self.free_txns += 1
+            if self.free_txns > threshold:
+                triggers.append((time, self.workload.choice(
+                    range(self.config.NUMBER_OF_PEERS))))
+                self.free_txns = 0
+        return triggers
+
+
+# A ladder bounds the number of times (of possible block broadcasts) below
+# any x: (values, counts, total), at most counts[i] of the times are below
+# x <= values[i] (values sorted), at most total are below any x. It keeps
+# the first ranks of the times exactly, then every RANK_GROWTH-th.
+EXACT_RANKS = 64
+RANK_GROWTH = 1.25
+
+
+def ladder_ranks(num_times: int) -> np.ndarray:
+    '''
+    ranks (from 0) of the sorted times kept in the ladder of num_times times
+    '''
+    ranks = list(range(min(num_times, EXACT_RANKS)))
+    while ranks and ranks[-1] < num_times - 1:
+        ranks.append(min(num_times - 1, math.ceil(ranks[-1]*RANK_GROWTH)))
+    return np.array(ranks, dtype=np.int64)
+
+
+def sorted_ladder(times) -> tuple:
+    '''
+    ladder of sorted times
+    '''
+    ranks = ladder_ranks(len(times))
+    return np.asarray(times, dtype=float)[ranks], ranks, len(times)
+
+
+def merge_ladders(ladders: list[tuple]) -> tuple:
+    '''
+    ladder of the times of all the ladders
+    '''
+    values = np.sort(np.concatenate([np.empty(0)] + [values for values, _, _ in ladders]))
+    counts = np.zeros(len(values), dtype=np.int64)
+    for ladder_values, ladder_counts, total in ladders:
+        # first pair at or above every value
+        positions = np.searchsorted(ladder_values, values)
+        counts += np.append(ladder_counts, total)[positions]
+    return values, counts, sum(total for _, _, total in ladders)
+
+
+def thin_ladder(ladder: tuple) -> tuple:
+    '''
+    ladder with the pairs of the exact ranks and geometrically growing counts
+    '''
+    values, counts, total = ladder
+    positions = ladder_ranks(total)
+    positions = np.unique(np.searchsorted(counts, positions, side="right") - 1)
+    positions = positions[positions >= 0]
+    return values[positions], counts[positions], total
+
+
+def rank_bound(ladder: tuple, rank: int) -> float:
+    '''
+    lower bound of the rank-th smallest time
+    '''
+    values, counts, total = ladder
+    if total < rank:
+        return math.inf
+    # pairs with at most rank - 1 times below their value
+    position = np.searchsorted(counts, rank - 1, side="right")
+    return values[position - 1].item() if position else -math.inf
+
+
+class _MiningTimes:
+    '''
+    Mining times (expon(1)) of the next attempts of a peer, peeked from its
+    mining stream. The ladder of the times of a range of attempts is
+    computed once (snapshot), attempts added later are kept apart until
+    there are too many of them.
+    '''
+    MAX_ADDED = EXACT_RANKS
+
+    def __init__(self, stream: RandomStream):
+        self.stream = stream
+        self.started = 0  # attempts started, their times are drawn
+        self.__range = (0, 0)  # attempts of the snapshot
+        self.__snapshot = sorted_ladder([])
+        self.__added: list[float] = []  # times of the attempts after the snapshot
+        self.__examined = 0
+        self.__upcoming = None
+        self.__generated = np.empty(0)  # peeked, not examined yet
+        self.__cache = None
+
+    def __take(self, num_times: int) -> np.ndarray:
+        parts, num_generated = [self.__generated], len(self.__generated)
+        while num_generated < num_times:
+            parts.append(next(self.__upcoming))
+            num_generated += len(parts[-1])
+        generated = np.concatenate(parts)
+        self.__generated = generated[num_times:]
+        return generated[:num_times]
+
+    def __take_snapshot(self, end: int):
+        self.__upcoming = self.stream.upcoming_exponentials(num_batches=64)
+        self.__generated = np.empty(0)
+        self.__snapshot = sorted_ladder(np.sort(self.__take(end - self.started)))
+        self.__range = (self.started, end)
+        self.__added = []
+        self.__examined = end
+
+    def ladder(self, end: int) -> tuple:
+        '''
+        ladder of the times of the attempts started to end - 1
+        '''
+        if self.__cache is not None and self.__cache[0] == (self.started, end):
+            return self.__cache[1]
+        start, snapshot_end = self.__range
+        if end > self.__examined and self.__upcoming is not None:
+            self.__added = sorted(self.__added + self.__take(end - self.__examined).tolist())
+            self.__examined = end
+        if (self.__upcoming is None or len(self.__added) > self.MAX_ADDED
+                or end - self.started <= EXACT_RANKS or self.started - start > (snapshot_end - start)//2):
+            self.__take_snapshot(end)
+        ladder = merge_ladders([self.__snapshot, sorted_ladder(self.__added)])
+        self.__cache = ((self.started, end), ladder)
+        return ladder
+
+
+def message_key(message) -> tuple:
+    '''
+    key of a transaction or block, the same in every process
+    '''
+    if isinstance(message, Block):
+        return ("block", message.block_id, message.timestamp, message.miner.index)
+    from_index = message.from_id.index if message.from_id else None
+    return ("txn", message.txn_id, message.timestamp, from_index, message.to_id.index)
+
+
+class _MessagePickler(pickle.Pickler):
+    '''
+    Peers are pickled by index, blocks and transactions the destination
+    already has by key.
+    '''
+
+    def __init__(self, file, process: "LogicalProcess", destination: int):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.registry = process.registry
+        self.known = process.known_by[destination]
+        # pickled in full by this pickler, later references use the memo
+        self.pickled = set()
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Peer):
+            return ("peer", obj.index)
+        if obj is GENESIS_BLOCK:
+            return ("genesis",)
+        if isinstance(obj, (Block, Transaction)):
+            key = message_key(obj)
+            if key in self.pickled:
+                return None
+            if key in self.known:
+                return ("message", key)
+            self.known.add(key)
+            self.pickled.add(key)
+            self.registry.setdefault(key, obj)
+        return None
+
+
+class _MessageUnpickler(pickle.Unpickler):
+    def __init__(self, file, process: "LogicalProcess"):
+        super().__init__(file)
+        self.peers = process.peers
+        self.registry = process.registry
+
+    def persistent_load(self, pid):
+        if pid[0] == "peer":
+            return self.peers[pid[1]]
+        if pid[0] == "genesis":
+            return GENESIS_BLOCK
+        return self.registry[pid[1]]
+
+
+class LogicalProcess:
+    '''
+    Peers of one partition and their simulation.
+    '''
+
+    def __init__(self, config: CONFIG, seed, partition: list[int], index: int):
+        self.index = index
+        self.seed = seed
+        self.partition = partition
+        num_partitions = max(partition) + 1
+        self.local_peers = {i for i, p in enumerate(partition) if p == index}
+        self.simulation, self.peers = setup_partition(
+            config, seed, self.local_peers)
+        # messages sent to the peers of every other partition
+        self.outboxes: list[list] = [[] for _ in range(num_partitions)]
+        # keys of the messages every other process has
+        self.known_by: list[set] = [set() for _ in range(num_partitions)]
+        self.registry: dict[tuple, object] = {}
+        self.hooks = GlobalHooks(config, seed, num_partitions)
+        # hook events and blocks broadcast since the end of the last round
+        self.hook_log: list[tuple[float, int]] = []
+        self.blocks_broadcasted = 0
+        # times of the mining attempts and broadcasts in the event queue
+        self.__block_events: list[float] = []
+        # by local peer: mining attempts and triggered blocks in the event
+        # queue, times of the next mining attempts
+        self.__num_starts = dict.fromkeys(self.local_peers, 0)
+        self.__num_triggers = dict.fromkeys(self.local_peers, 0)
+        self.__mining_times = {i: _MiningTimes(self.peers[i].random_streams.mining)
+                               for i in sorted(self.local_peers)}
+        self.__offsets = None
+        block_events = [EventType.BLOCK_BROADCAST,
+                        EventType.BLOCK_MINE_FINISH, EventType.BLOCK_MINE_START]
+        self.simulation.reg_hooks(
+            HookType.POST_ENQUEUE, self.__block_enqueued, block_events)
+        self.simulation.reg_hooks(
+            HookType.POST_RUN, self.__block_run, block_events)
+        self.simulation.reg_hooks(HookType.POST_RUN, self.__txn_run,
+                                  [EventType.TXN_BROADCAST])
+        self.simulation.reg_hooks(HookType.POST_RUN, self.__trigger_run,
+                                  [EventType.BLOCK_CREATE])
+        for i in sorted(self.local_peers):
+            for neighbour, link in self.peers[i].neighbours.items():
+                other = partition[neighbour.index]
+                if other != index:
+                    link.outbox = self.outboxes[other]
+        # smallest delay of an effect of every process on this one
+        _, _, links = random_topology(
+            config.NUMBER_OF_PEERS, config, RandomStreams(seed).network)
+        self.lookaheads = [delays[index]
+                           for delays in partition_delays(partition, links)]
+
+    def __block_enqueued(self, event):
+        # resets the free transactions (SimulationRun.post_enqueue_hooks)
+        self.hook_log.append((self.simulation.clock, HOOK_RESET))
+        if event.type == EventType.BLOCK_MINE_START:
+            self.__num_starts[event.owner.peer_id.index] += 1
+        else:
+            heapq.heappush(self.__block_events, event.actionable_at)
+
+    def __block_run(self, event):
+        if event.type == EventType.BLOCK_MINE_START:
+            index = event.owner.peer_id.index
+            self.__num_starts[index] -= 1
+            self.__mining_times[index].started += 1
+            return
+        heapq.heappop(self.__block_events)
+        if event.type == EventType.BLOCK_BROADCAST:
+            self.blocks_broadcasted += 1
+            # SimulationRun.post_run_block_hooks
+            if self.blocks_broadcasted >= self.hooks.remaining_blocks:
+                self.simulation.stop_sim = True
+
+    def __txn_run(self, event):
+        self.hook_log.append((self.simulation.clock, HOOK_TXN))
+
+    def __trigger_run(self, event):
+        self.__num_triggers[event.owner.index] -= 1
+
+    def trigger_block(self, miner_index: int, time: float):
+        '''
+        the miner (a peer of this partition) starts mining a block
+        '''
+        self.__num_triggers[miner_index] += 1
+        self.simulation.enqueue(SIM.block_trigger_event(
+            self.peers[miner_index], time))
+
+    def block_candidates(self) -> tuple[tuple, tuple]:
+        '''
+        Ladders of the earliest times at which a peer of this process could
+        broadcast a block: the blocks being mined and, as offsets from the
+        next event of the process, the next mining times of the attempts
+        the peers can still start (at most one per block a peer can still
+        add, per triggered block and for the transactions it waits for).
+        '''
+        config = self.simulation.config
+        ladders, means = [], []
+        for index, mining_times in self.__mining_times.items():
+            block_chain = self.peers[index].block_chain
+            num_attempts = (max(0, config.TOTAL_NUM_BLOCKS + 6 - block_chain.num_blocks)
+                            + self.__num_triggers[index] + self.__num_starts[index] + 1)
+            ladders.append(mining_times.ladder(mining_times.started + num_attempts))
+            means.append(block_chain.avg_interval_time/block_chain.cpu_power)
+        # the ladders of the peers are cached, merged again when one changes
+        if self.__offsets is None or any(a is not b for a, b in zip(ladders, self.__offsets[0])):
+            self.__offsets = ladders, thin_ladder(merge_ladders(
+                [(mean*values, counts, total) for mean, (values, counts, total) in zip(means, ladders)]))
+        return sorted_ladder(sorted(self.__block_events)), self.__offsets[1]
+
+    def run(self, exchange: "_Exchange") -> int:
+        '''
+        Run rounds until the global hooks stop the run, END_TIME is reached
+        or there are no events left. Returns the number of rounds.
+        '''
+        config = self.simulation.config
+        num_partitions = len(self.outboxes)
+        end_time = math.inf if config.END_TIME is None else config.END_TIME
+        hooks = self.hooks
+        num_rounds = 0
+        while True:
+            # (next event, earliest arrival at every process, hook events,
+            # blocks broadcast, block candidates) of every process, the
+            # messages to every process
+            batches = self.collect_messages()
+            hook_log, self.hook_log = self.hook_log, []
+            blocks_broadcasted, self.blocks_broadcasted = self.blocks_broadcasted, 0
+            state = (self.simulation.next_event_time(),
+                     [batch[0] if batch is not None else math.inf for batch in batches],
+                     hook_log, blocks_broadcasted,
+                     self.block_candidates())
+            states = [state]*num_partitions
+            received = exchange.exchange(
+                num_rounds, [(state, batch[1] if batch is not None else None) for batch in batches])
+            for source, (source_state, data) in received:
+                states[source] = source_state
+                if data is not None:
+                    self.deliver_messages(source, data)
+            next_times = [min([state[0]] + [other[1][index] for other in states])
+                          for index, state in enumerate(states)]
+
+            # the same decisions in every process
+            hooks.add([state[2] for state in states],
+                      sum(state[3] for state in states))
+            if hooks.remaining_blocks <= 0:
+                break
+            window_end = end_time
+            for time, miner_index in hooks.replay(min(next_times)):
+                miner_partition = self.partition[miner_index]
+                if miner_partition == self.index:
+                    self.trigger_block(miner_index, time)
+                next_times[miner_partition] = min(
+                    next_times[miner_partition], trigger_time(time))
+                # the attempts of the triggered blocks are not candidates
+                window_end = min(window_end, trigger_time(time))
+            window_start = min(next_times)
+            if window_start >= end_time:
+                break
+            # no other process can broadcast the block that stops the run
+            # before stop_at
+            ladders = []
+            for next_time, (*_, (times, (offsets, counts, total))) in zip(next_times, states):
+                ladders += [times, (next_time + offsets, counts, total)]
+            stop_at = rank_bound(merge_ladders(ladders), hooks.remaining_blocks)
+            # a block triggered in this round is created after the window
+            window_end = min([window_end, trigger_time(window_start), stop_at] +
+                             [next_time + lookahead for next_time, lookahead in zip(next_times, self.lookaheads)])
+            if stop_at <= window_start:
+                # the earliest possible broadcast is at window_start, only its
+                # process runs the events at window_start
+                first = min(range(num_partitions), key=lambda j: min(
+                    values[0] if len(values) else math.inf for values, _, _ in ladders[2*j:2*j + 2]))
+                window_end = math.nextafter(
+                    window_start, math.inf) if first == self.index else window_start
+            self.simulation.run_until(window_end)
+            num_rounds += 1
+        return num_rounds
+
+    def __intern(self, message, source: int):
+        '''
+        the copy of the message this process already has, if any
+        '''
+        key = message_key(message)
+        self.known_by[source].add(key)
+        known = self.registry.get(key)
+        if known is not None:
+            return known
+        self.registry[key] = message
+        if isinstance(message, Block):
+            message.transactions = [self.__intern(txn, source)
+                                    for txn in message.transactions]
+            if message.prev_block is not None and message.prev_block is not GENESIS_BLOCK:
+                message.prev_block = self.__intern(message.prev_block, source)
+        return message
+
+    def collect_messages(self) -> list:
+        '''
+        (earliest arrival time, deliveries) for every partition, None if
+        there is nothing to deliver. The messages are pickled once each, the
+        deliveries are columns of numbers referring to them.
+        '''
+        batches = []
+        for destination, outbox in enumerate(self.outboxes):
+            if not outbox:
+                batches.append(None)
+                continue
+            sent_ats, delays, links, sent = zip(*outbox)
+            positions: dict[int, int] = {}
+            message_positions = [positions.setdefault(id(message), len(positions))
+                                 for message in sent]
+            messages = list({id(message): message for message in sent}.values())
+            from_indices = [link.from_peer.index for link in links]
+            to_indices = [link.to_peer.index for link in links]
+            earliest = min(map(sum, zip(sent_ats, delays)))
+            buffer = io.BytesIO()
+            _MessagePickler(buffer, self, destination).dump(messages)
+            batches.append((earliest, (buffer.getvalue(), sent_ats, delays,
+                                       from_indices, to_indices, message_positions)))
+            outbox.clear()
+        return batches
+
+    def deliver_messages(self, source: int, data: tuple):
+        '''
+        enqueue the receive events of the messages sent by another process
+        '''
+        pickled, *deliveries = data
+        messages = [self.__intern(message, source)
+                    for message in _MessageUnpickler(io.BytesIO(pickled), self).load()]
+        peers, enqueue = self.peers, self.simulation.enqueue
+        for sent_at, delay, from_index, to_index, position in zip(*deliveries):
+            link = peers[from_index].neighbours[peers[to_index]]
+            enqueue(link.receive_event(messages[position], delay, sent_at))
+
+    def results(self) -> dict:
+        peers = [self.peers[i] for i in sorted(self.local_peers)]
+        return {
+            "indices": [peer.index for peer in peers],
+            "summary": SIM.calculate_summary(peers),
+            "contributions": [(peer.is_slow_cpu, peer.is_slow_network, peer.block_chain.longest_chain_contribution)
+                              for peer in peers],
+            "clock": self.simulation.clock,
+            "metrics": self.simulation.metrics.summary() if self.simulation.metrics is not None else None,
+        }
+
+
+# seconds between the checks of the other processes while waiting for them
+POLL_INTERVAL = 1.0
+
+
+class _Exchange:
+    '''
+    All-to-all exchange of the logical processes at the end of a round,
+    every process reads from its own inbox.
+    '''
+
+    def __init__(self, inboxes: list, index: int):
+        self.inboxes = inboxes
+        self.index = index
+        # messages of the next round, received from processes that are ahead
+        self.early: list[tuple] = []
+
+    def exchange(self, round: int, messages: list) -> list:
+        '''
+        send messages[i] to every other process i, return the (source,
+        message) of every other process for this round by source
+        '''
+        for destination, inbox in enumerate(self.inboxes):
+            if destination != self.index:
+                inbox.put((round, self.index, messages[destination]))
+        received = [(source, message) for _, source, message in self.early]
+        self.early = []
+        while len(received) < len(self.inboxes) - 1:
+            try:
+                message_round, source, message = self.inboxes[self.index].get(
+                    timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # the parent terminates the processes if one of them fails
+                parent = mp.parent_process()
+                if parent is not None and not parent.is_alive():
+                    raise RuntimeError("the parent process exited")
+                continue
+            if message_round == round:
+                received.append((source, message))
+            else:
+                self.early.append((message_round, source, message))
+        return sorted(received, key=lambda item: item[0])
+
+
+def _run_logical_process(inboxes: list, results, config: CONFIG, seed, partition: list[int], index: int):
+    '''
+    worker process: run the rounds, put the results (or the traceback of
+    the error) in the results queue
+    '''
+    try:
+        process = LogicalProcess(config, seed, partition, index)
+        num_rounds = process.run(_Exchange(inboxes, index))
+        results.put((index, num_rounds, process.results()))
+    except Exception:
+        results.put((index, None, traceback.format_exc()))
+
+
+def merge_results(results: list[dict]) -> dict:
+    '''
+    results of the whole network, peers in index order
+    '''
+    rows = sorted((index, summary, contribution)
+                  for result in results
+                  for index, summary, contribution in zip(result["indices"], result["summary"], result["contributions"]))
+    return {
+        "ratios": SIM.average_ratios([contribution for _, _, contribution in rows]),
+        "summary": [summary for _, summary, _ in rows],
+        "simulation_time": max(result["clock"] for result in results),
+        # one entry per process
+        "metrics": [result["metrics"] for result in results],
+    }
+
+
+def run_parallel(config: CONFIG, seed, num_partitions: int) -> dict:
+    '''
+    Run the simulation with one process per partition of the peers.
+    '''
+    num_partitions = max(1, min(num_partitions, config.NUMBER_OF_PEERS))
+    _, _, links = random_topology(
+        config.NUMBER_OF_PEERS, config, RandomStreams(seed).network)
+    partition = partition_peers(
+        config.NUMBER_OF_PEERS, num_partitions, links)
+    inboxes = [mp.Queue() for _ in range(num_partitions)]
+    results = mp.Queue()
+    workers = [mp.Process(target=_run_logical_process, args=(inboxes, results, config, seed, partition, index))
+               for index in range(num_partitions)]
+    for worker in workers:
+        worker.start()
+    collected = {}
+    try:
+        # read before joining, a worker exits once its results are read
+        while len(collected) < num_partitions:
+            try:
+                index, num_rounds, result = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                for index, worker in enumerate(workers):
+                    if index not in collected and worker.exitcode not in (None, 0):
+                        raise RuntimeError(
+                            f"logical process {index} exited with code {worker.exitcode}")
+                continue
+            if num_rounds is None:
+                raise RuntimeError(f"logical process {index} failed:\n{result}")
+            collected[index] = num_rounds, result
+    finally:
+        for worker in workers:
+            if worker.is_alive() and len(collected) < num_partitions:
+                worker.terminate()
+            worker.join()
+    merged = merge_results([collected[index][1] for index in range(num_partitions)])
+    merged["num_windows"] = collected[0][0]
+    return merged
+
+
+def run_sequential(config: CONFIG, seed) -> dict:
+    '''
+    Run simulation.py (SimulationRun) in this process.
+    '''
+    simulation_run = SIM.setup_simulation(config, seed)
+    SIM.run_simulation(simulation_run, show_progress=False)
+    peers = simulation_run.peers
+    return {
+        "ratios": SIM.calculate_ratios(peers),
+        "summary": SIM.calculate_summary(peers),
+        "simulation_time": simulation_run.simulation.clock,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument("num_partitions", type=int, nargs="?", default=CONFIG.NUM_PARTITIONS,
+                        help="processes, one per partition of the peers")
+    parser.add_argument("--verify", action="store_true",
+                        help="run simulation.py in one process and compare the results")
+    parser.add_argument("--end-time", type=float, default=CONFIG.END_TIME,
+                        help="simulated time at which the run stops (ms), required if CONFIG.END_TIME is None")
+    parser.add_argument("--peers", type=int, default=CONFIG.NUMBER_OF_PEERS,
+                        help="NUMBER_OF_PEERS")
+    parser.add_argument("--blocks", type=int, default=CONFIG.TARGET_NUM_BLOCKS,
+                        help="TARGET_NUM_BLOCKS")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="seed of the random streams")
+    args = parser.parse_args()
+    if args.end_time is None:
+        # the block trigger alone takes a very long run to reach the blocks
+        parser.error("--end-time is required, CONFIG.END_TIME is None")
+    config = CONFIG(END_TIME=args.end_time, NUMBER_OF_PEERS=args.peers,
+                    TARGET_NUM_BLOCKS=args.blocks)
+    num_partitions = args.num_partitions
+    seed = args.seed
+
+    start_time = time()
+    results = run_parallel(config, seed, num_partitions)
+    print(f"{num_partitions} processes: {time() - start_time:.2f}s, "
+          f"{results['num_windows']} windows")
+    with open('parallel_results.json', 'w') as f:
+        json.dump(results, f, indent=4)
+    if not args.verify:
+        return 0
+    start_time = time()
+    expected = run_sequential(config, seed)
+    print(f"simulation.py: {time() - start_time:.2f}s")
+    same = all(results[key] == expected[key]
+               for key in ("ratios", "summary", "simulation_time"))
+    print("results match" if same else "results differ")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,41 @@
+'''
+Profile a simulation run.
+
+usage: python performance.py [cprofile|sampling] [window start] [window end]
+
+Writes profile.collapsed (flamegraph.pl profile.collapsed > profile.svg),
+profile_subsystems.json and, with cprofile, profile.prof and prof.csv.
+'''
+import sys
+import csv
 import cProfile
-import simulation
 import pstats
-import io
+
+import simulation
+from config import CONFIG
 
 
-def prof_to_csv(prof: cProfile.Profile):
-    out_stream = io.StringIO()
-    pstats.Stats(prof, stream=out_stream).print_stats()
-    result = out_stream.getvalue()
-    # chop off header lines
-    result = 'ncalls' + result.split('ncalls')[-1]
-    lines = [','.join(line.rstrip().split(None, 5))
-             for line in result.split('\n')]
-    return '\n'.join(lines)
+def prof_to_csv(prof: cProfile.Profile | str, path: str = "prof.csv"):
+    '''
+    one row per function of the profile (or pstats file), by cumulative time
+    '''
+    stats = pstats.Stats(prof).stats
+    rows = sorted(stats.items(), key=lambda x: -x[1][3])
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["ncalls", "primitive_calls", "tottime",
+                         "cumtime", "filename", "lineno", "function"])
+        for (filename, lineno, function), (primitive_calls, ncalls, tottime, cumtime, _) in rows:
+            writer.writerow([ncalls, primitive_calls, f"{tottime:.6f}",
+                             f"{cumtime:.6f}", filename, lineno, function])
 
 
 if __name__ == "__main__":
-    pr = cProfile.Profile()
-    pr.enable()
-    # main()
-    simulation.main()
-    pr.disable()
-    csv = prof_to_csv(pr)
-    with open("prof.csv", 'w+') as f:
-        f.write(csv)
+    backend = sys.argv[1] if len(sys.argv) > 1 else "cprofile"
+    window = (float(sys.argv[2]), float(sys.argv[3])
+              ) if len(sys.argv) > 3 else None
+    config = CONFIG(PROFILER=backend, PROFILE_WINDOW=window)
+    simulation.main(config)
+    if backend == "cprofile":
+        # export_data may have changed into the output directory
+        prof_to_csv(f"{config.PROFILE_PATH}.prof")
@@ -0,0 +1,285 @@
+'''
+Profiling of a simulation run (CONFIG.PROFILER).
+
+Two backends:
+    cprofile  deterministic, every call is timed (slower run)
+    sampling  the stack of the main thread is sampled every INTERVAL of
+              CPU time (SIGPROF), nearly no overhead
+
+Both attribute the time to subsystems (event engine, links, block
+validation, mempool, export, visualisation, ...) and write
+    <path>.collapsed        collapsed stacks for flamegraph.pl / speedscope
+    <path>_subsystems.json  seconds per subsystem
+    <path>.prof             pstats file (cprofile only)
+With CONFIG.PROFILE_WINDOW = (start, end) only the events in that window
+of simulated time are profiled, without setup and export.
+'''
+import os
+import json
+import signal
+import cProfile
+import pstats
+from collections import Counter
+
+# (module, function) -> subsystem, checked before SUBSYSTEM_MODULES
+SUBSYSTEM_FUNCTIONS = {
+    ("simulation.py", "export_data"): "export",
+    ("simulation.py", "calculate_summary"): "export",
+    ("simulation.py", "calculate_ratios"): "export",
+    ("simulation.py", "setup_simulation"): "setup",
+    ("Block.py", "__dict__"): "export",
+    ("Block.py", "header"): "export",
+    ("Block.py", "block_hash"): "export",
+    ("Block.py", "branches_info"): "export",
+    ("Block.py", "longest_chain_contribution"): "export",
+    ("Block.py", "__get_leaf_blocks"): "export",
+    ("Block.py", "__get_branches"): "export",
+    ("Block.py", "__get_forks"): "export",
+    ("Peer.py", "__dict__"): "export",
+    ("Peer.py", "cpu_net_description"): "export",
+    ("Transaction.py", "__dict__"): "export",
+    ("Link.py", "__dict__"): "export",
+    ("Block.py", "add_transaction"): "mempool",
+    ("Block.py", "__generate_block"): "mempool",
+    ("Block.py", "generate_block"): "mempool",
+    ("Peer.py", "generate_random_txn"): "mempool",
+    ("Peer.py", "__create_txn"): "mempool",
+}
+SUBSYSTEM_MODULES = {
+    "DiscreteEventSim.py": "event engine",
+    "EventQueue.py": "event engine",
+    "metrics.py": "event engine",
+    "workload.py": "event engine",
+    "random_streams.py": "random numbers",
+    "parallel.py": "parallel engine",
+    "Link.py": "links",
+    "Peer.py": "links",
+    "Block.py": "block validation",
+    "Balances.py": "balances",
+    "BlockTree.py": "block validation",
+    "OrphanPool.py": "block validation",
+    "BlockDAG.py": "block validation",
+    "Transaction.py": "mempool",
+    "Mempool.py": "mempool",
+    "network.py": "setup",
+    "checkpoint.py": "checkpoints",
+    "visualisation.py": "visualisation",
+    "logger.py": "logging",
+}
+# third party packages (directory in the path of the module)
+SUBSYSTEM_PACKAGES = {
+    "matplotlib": "visualisation",
+    "networkx": "visualisation",
+    "pygraphviz": "visualisation",
+    "json": "export",
+    "logging": "logging",
+}
+OTHER = "other"
+
+
+def subsystem_of(filename: str, function: str) -> str:
+    '''
+    subsystem of a function, None if it is only known from its callers
+    '''
+    module = os.path.basename(filename)
+    subsystem = SUBSYSTEM_FUNCTIONS.get((module, function))
+    if subsystem is None:
+        subsystem = SUBSYSTEM_MODULES.get(module)
+    if subsystem is None:
+        for directory in filename.split(os.sep)[:-1]:
+            if directory in SUBSYSTEM_PACKAGES:
+                return SUBSYSTEM_PACKAGES[directory]
+    return subsystem
+
+
+def frame_name(filename: str, function: str) -> str:
+    if filename == "~":  # built-in function
+        name = function
+    else:
+        name = f"{os.path.basename(filename)}:{function}"
+    # ';' separates the frames of a collapsed stack
+    return name.replace(";", ",")
+
+
+class Profiler:
+    '''
+    Interface of the profiler backends.
+    '''
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def subsystem_times(self) -> dict[str, float]:
+        '''
+        seconds spent in every subsystem
+        '''
+        raise NotImplementedError
+
+    def collapsed_stacks(self) -> dict[str, int]:
+        '''
+        "root;...;leaf" -> weight
+        '''
+        raise NotImplementedError
+
+    def export(self, path: str = "profile"):
+        with open(f"{path}.collapsed", 'w') as f:
+            for stack, weight in sorted(self.collapsed_stacks().items()):
+                f.write(f"{stack} {weight}\n")
+        subsystems = self.subsystem_times()
+        total = sum(subsystems.values())
+        with open(f"{path}_subsystems.json", 'w') as f:
+            json.dump({
+                subsystem: {
+                    "seconds": round(seconds, 6),
+                    "percent": round(100*seconds/total, 2) if total else 0,
+                } for subsystem, seconds in sorted(subsystems.items(), key=lambda x: -x[1])
+            }, f, indent=4)
+
+
+class CProfileProfiler(Profiler):
+    '''
+    cProfile backend. Built-in functions are attributed to the subsystem
+    of their most expensive caller. Collapsed stacks are rebuilt from the
+    caller/callee times, splitting the time of a function between its
+    callers in proportion (as flameprof does).
+    '''
+    MIN_STACK_TIME = 1e-5  # s, smaller branches are dropped
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    @property
+    def stats(self) -> dict:
+        return pstats.Stats(self.profile).stats
+
+    def subsystem_times(self) -> dict[str, float]:
+        stats = self.stats
+        subsystems = {}
+
+        def subsystem_of_function(function, visiting=()):
+            if function in subsystems:
+                return subsystems[function]
+            filename, _, name = function
+            subsystem = subsystem_of(filename, name)
+            if subsystem is None:
+                callers = stats[function][4]
+                candidates = [caller for caller in callers
+                              if caller in stats and caller not in visiting]
+                if candidates:
+                    caller = max(candidates, key=lambda x: callers[x][3])
+                    subsystem = subsystem_of_function(
+                        caller, visiting + (function,))
+                else:
+                    subsystem = OTHER
+            subsystems[function] = subsystem
+            return subsystem
+
+        times = Counter()
+        for function, (_, _, total_time, _, _) in stats.items():
+            times[subsystem_of_function(function)] += total_time
+        return dict(times)
+
+    def collapsed_stacks(self) -> dict[str, int]:
+        stats = self.stats
+        callees = {function: {} for function in stats}
+        for function, (_, _, _, _, callers) in stats.items():
+            for caller, caller_stats in callers.items():
+                if caller in callees:
+                    callees[caller][function] = caller_stats[3]
+        stacks = Counter()
+
+        def expand(function, path: tuple, fraction: float):
+            _, _, total_time, cumulative_time, _ = stats[function]
+            stack = path + (frame_name(function[0], function[2]),)
+            own_time = total_time*fraction
+            if own_time >= self.MIN_STACK_TIME:
+                stacks[";".join(stack)] += round(own_time*1e6)
+            for callee, time_from_function in callees[function].items():
+                time_on_path = time_from_function*fraction
+                callee_time = stats[callee][3]
+                if callee_time <= 0 or time_on_path < self.MIN_STACK_TIME:
+                    continue
+                if frame_name(callee[0], callee[2]) in stack:
+                    continue  # recursion
+                expand(callee, stack, min(1, time_on_path/callee_time))
+
+        roots = [function for function, (_, _, _, _, callers) in stats.items()
+                 if not any(caller in stats for caller in callers)]
+        for root in roots:
+            expand(root, (), 1.0)
+        return dict(stacks)
+
+    def export(self, path: str = "profile"):
+        super().export(path)
+        self.profile.dump_stats(f"{path}.prof")
+
+
+class SamplingProfiler(Profiler):
+    '''
+    Sampling backend: SIGPROF every INTERVAL seconds of CPU time records
+    the stack of the interrupted frame (main thread, Unix only).
+    '''
+    INTERVAL = 0.001
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()  # stacks of code objects, leaf first
+        self.__previous_handler = None
+
+    def __sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        self.samples[tuple(stack)] += 1
+
+    def start(self):
+        self.__previous_handler = signal.signal(signal.SIGPROF, self.__sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.__previous_handler or signal.SIG_DFL)
+
+    def subsystem_times(self) -> dict[str, float]:
+        times = Counter()
+        for stack, count in self.samples.items():
+            subsystem = OTHER
+            for code in stack:
+                found = subsystem_of(code.co_filename, code.co_name)
+                if found is not None:
+                    subsystem = found
+                    break
+            times[subsystem] += count*self.interval
+        return dict(times)
+
+    def collapsed_stacks(self) -> dict[str, int]:
+        stacks = Counter()
+        for stack, count in self.samples.items():
+            stacks[";".join(frame_name(code.co_filename, code.co_name)
+                            for code in reversed(stack))] += count
+        return dict(stacks)
+
+
+PROFILERS = {
+    "cprofile": CProfileProfiler,
+    "sampling": SamplingProfiler,
+}
+
+
+def create_profiler(config) -> Profiler:
+    '''
+    profiler selected by CONFIG.PROFILER, None if profiling is off
+    '''
+    if not config.PROFILER:
+        return None
+    return PROFILERS[config.PROFILER]()
@@ -0,0 +1,83 @@
+'''
+Compare the event queue backends with the classic "hold" model:
+the queue is filled up to a given depth and then every operation dequeues
+the earliest event and enqueues a new one at clock + delay.
+Delays follow the mix of the simulator: link delays (10-501 ms), transaction
+inter-arrival times (exp 10s) and block mining times (exp 1e6 ms).
+heapq is implemented in C, the heap backend is faster up to between 100k
+and 300k pending events, where the calendar queue catches up.
+
+usage: python queue_benchmark.py [num_hold_operations]
+'''
+import sys
+import random
+from time import perf_counter
+
+from EventQueue import EVENT_QUEUE_BACKENDS
+
+QUEUE_DEPTHS = [100, 1000, 10*1000, 100*1000, 300*1000]
+
+
+class BenchEvent:
+    __slots__ = ('actionable_at',)
+
+    def __init__(self, actionable_at: float):
+        self.actionable_at = actionable_at
+
+
+def sample_delay(rand: random.Random) -> float:
+    kind = rand.random()
+    if kind < 0.9:
+        return rand.uniform(10, 501) + rand.expovariate(1/96)
+    if kind < 0.99:
+        return rand.expovariate(1/(10*1000))
+    return rand.expovariate(1/(1000*1000))
+
+
+def hold_benchmark(backend: str, depth: int, num_operations: int, seed: int = 0) -> float:
+    '''
+    returns time per hold operation (µs)
+    '''
+    rand = random.Random(seed)
+    event_queue = EVENT_QUEUE_BACKENDS[backend]()
+    for _ in range(depth):
+        event_queue.put(BenchEvent(sample_delay(rand)))
+    delays = [sample_delay(rand) for _ in range(num_operations)]
+
+    start = perf_counter()
+    for delay in delays:
+        event = event_queue.get()
+        event_queue.put(BenchEvent(event.actionable_at + delay))
+    return (perf_counter() - start)/num_operations*1e6
+
+
+def check_same_order(num_events: int = 20*1000, seed: int = 0):
+    '''
+    all backends must pop the events in the same order
+    '''
+    rand = random.Random(seed)
+    events = [BenchEvent(round(sample_delay(rand), 0))
+              for _ in range(num_events)]
+    orders = {}
+    for backend, queue_class in EVENT_QUEUE_BACKENDS.items():
+        event_queue = queue_class()
+        for event in events:
+            event_queue.put(event)
+        orders[backend] = [id(event_queue.get()) for _ in range(num_events)]
+    assert len(set(map(tuple, orders.values()))) == 1, "backends differ"
+
+
+def main():
+    num_operations = int(sys.argv[1]) if len(sys.argv) > 1 else 100*1000
+    check_same_order()
+    backends = list(EVENT_QUEUE_BACKENDS.keys())
+    print("µs per hold operation")
+    print("depth".rjust(10) + "".join(b.rjust(12) for b in backends))
+    for depth in QUEUE_DEPTHS:
+        row = [hold_benchmark(backend, depth, num_operations)
+               for backend in backends]
+        print(str(depth).rjust(10) + "".join(f"{x:12.3f}" for x in row))
+
+
+if __name__ == "__main__":
+    main()
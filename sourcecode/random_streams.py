@@ -0,0 +1,135 @@
+import copy
+
+import numpy as np
+
+
+class RandomStream:
+    '''
+    Seeded stream of random numbers.
+    Samples are drawn from numpy in batches and handed out from a buffer,
+    so a sample costs a list pop instead of a call into the random module.
+    '''
+    BATCH_SIZE = 4096
+
+    def __init__(self, seed_sequence: np.random.SeedSequence, batch_size: int = BATCH_SIZE):
+        self.generator = np.random.default_rng(seed_sequence)
+        self.batch_size = batch_size
+        self.__exponentials: list[float] = []
+        self.__uniforms: list[float] = []
+
+    def __refill_exponentials(self):
+        self.__exponentials = self.generator.standard_exponential(
+            self.batch_size).tolist()
+
+    def __refill_uniforms(self):
+        self.__uniforms = self.generator.random(self.batch_size).tolist()
+
+    def random(self) -> float:
+        '''
+        uniform sample in [0, 1)
+        '''
+        if not self.__uniforms:
+            self.__refill_uniforms()
+        return self.__uniforms.pop()
+
+    def expon(self, mean: float) -> float:
+        '''
+        sample from exponential distribution with given mean
+        '''
+        if not self.__exponentials:
+            self.__refill_exponentials()
+        return self.__exponentials.pop()*mean
+
+    def upcoming_exponentials(self, num_batches: int = 1):
+        '''
+        generator of the next samples of expon(1) in arrays, without drawing
+        them (exact if the stream draws no other distribution in between)
+        '''
+        yield np.array(self.__exponentials[::-1])
+        generator = copy.deepcopy(self.generator)
+        while True:
+            # the buffer hands out every batch from its end
+            samples = generator.standard_exponential(num_batches*self.batch_size)
+            yield samples.reshape(num_batches, self.batch_size)[:, ::-1].ravel()
+
+    def expovariate(self, lambd: float) -> float:
+        return self.expon(1/lambd)
+
+    def uniform(self, a: float, b: float) -> float:
+        return a + (b-a)*self.random()
+
+    def choice(self, seq):
+        return seq[int(self.random()*len(seq))]
+
+    def randint(self, a: int, b: int) -> int:
+        '''
+        random integer in [a, b]
+        '''
+        return a + int(self.random()*(b-a+1))
+
+    def sample(self, population, k: int) -> list:
+        '''
+        k unique elements of population
+        '''
+        indices = self.generator.choice(len(population), k, replace=False)
+        return [population[i] for i in indices.tolist()]
+
+
+class PeerRandomStreams:
+    '''
+    Random streams of one peer.
+    The draws of a peer only depend on the events of that peer, not on how
+    the events of different peers are interleaved, so a run gives the same
+    results whether the peers are simulated in one process or partitioned
+    across several (parallel.py).
+    '''
+    STREAMS = ("links", "mining", "workload", "ids")
+    BATCH_SIZE = 64  # one set of streams per peer, keep the buffers small
+    links: RandomStream  # queuing delays of messages sent by the peer
+    mining: RandomStream  # block mining times
+    workload: RandomStream  # transaction receivers and amounts
+    ids: RandomStream  # ids of transactions and blocks
+
+    def __init__(self, entropy, peer_index: int):
+        self.__entropy = entropy
+        self.__peer_index = peer_index
+
+    def __getattr__(self, name: str) -> RandomStream:
+        # streams are created on first use, a process of the parallel engine
+        # never draws for the peers it does not simulate
+        if name not in self.STREAMS:
+            raise AttributeError(name)
+        seed_sequence = np.random.SeedSequence(
+            self.__entropy, spawn_key=(self.STREAMS.index(name), self.__peer_index))
+        stream = RandomStream(seed_sequence, self.BATCH_SIZE)
+        setattr(self, name, stream)
+        return stream
+
+
+class RandomStreams:
+    '''
+    Independent random streams of a simulation, all derived from one seed.
+    Every purpose has its own stream, so changing how one of them is used
+    (e.g. link delays) does not disturb the others.
+    Draws made by the events of a peer come from the streams of that peer
+    (peer()).
+    '''
+    STREAMS = ("network", "workload", "ids", "arrivals")
+    network: RandomStream  # network topology, link propagation delays
+    workload: RandomStream  # miners of blocks triggered by the simulation run
+    ids: RandomStream  # ids of peers
+    arrivals: RandomStream  # transaction arrival times and senders
+
+    def __init__(self, seed=None):
+        root = np.random.SeedSequence(seed)
+        self.seed = root.entropy  # reproduces the run when seed is None
+        for index, name in enumerate(self.STREAMS):
+            seed_sequence = np.random.SeedSequence(
+                root.entropy, spawn_key=(index,))
+            setattr(self, name, RandomStream(seed_sequence))
+
+    def peer(self, peer_index: int) -> PeerRandomStreams:
+        '''
+        streams of the peer with the given index
+        '''
+        return PeerRandomStreams(self.seed, peer_index)
@@ -1,14 +1,18 @@
-import random
+import sys
 import json
+import math
 import pickle
 from time import time, strftime
 from tqdm import tqdm
 
-from logger import init_logger
+from logger import init_logger, LazyDescription
 from network import is_connected, create_network
-from DiscreteEventSim import simulation, Event, EventType, HookType
-from utils import expon_distribution, create_directory, change_directory, copy_to_directory, clear_dir
+from DiscreteEventSim import Simulation, Event, EventType, HookType
+from utils import create_directory, change_directory, copy_to_directory, clear_dir
 from visualisation import visualize
+from workload import TransactionArrivals
+from profiler import Profiler, create_profiler
+import checkpoint
 
 from config import CONFIG
 
@@ -16,11 +20,6 @@ from config import CONFIG
 logger = init_logger()
 START_TIME = time()
 START_TIME = strftime("%Y-%m-%d_%H:%M:%S")
-config_instance = ''
-peers_network = []
-pbar_txns, pbar_blocks = None, None
-free_tnx_counter = 0
-blocks_broadcasted = 0
 
 
 def log_peers(peers):
@@ -34,23 +33,41 @@ def log_peers(peers):
     logger.info(is_connected(peers))
 
 
-def schedule_transactions(peers):
+def schedule_transactions(simulation: Simulation, peers, local_peers: set[int] = None):
     '''
-    Schedule transactions
+    Start the arrival process of transactions
+    (of the peers in local_peers only, None: all)
     '''
-    time = 0
-    while simulation.event_queue.qsize() < CONFIG.TOTAL_NUM_TRANSACTIONS:
-        # Generate exponential random variable for interarrival time
-        interarrival_time = expon_distribution(CONFIG.AVG_TXN_INTERVAL_TIME)
-        # logger.debug(f"Interarrival time: {interarrival_time}")
-        from_peer = random.choice(peers)
-        new_txn_event = Event(EventType.TXN_CREATE, time,
-                              time, from_peer.generate_random_txn, (time,), f"{from_peer} create_txn")
-        time = time + interarrival_time
-        simulation.enqueue(new_txn_event)
+    config = simulation.config
+    arrivals = TransactionArrivals(simulation, peers,
+                                   num_transactions=config.TOTAL_NUM_TRANSACTIONS,
+                                   mean_interarrival=config.AVG_TXN_INTERVAL_TIME,
+                                   distribution=config.TXN_INTERVAL_DISTRIBUTION,
+                                   peer_rates=config.TXN_PEER_RATES,
+                                   local_peers=local_peers)
+    arrivals.start()
+    return arrivals
+
+
+def block_trigger_event(miner_peer, clock: float) -> Event:
+    '''
+    event of miner_peer starting to mine a block, triggered at clock
+    '''
+    time_stamp = clock + 10
+    return Event(EventType.BLOCK_CREATE, time_stamp,
+                 time_stamp, miner_peer.block_chain.generate_block, (), LazyDescription("{} create_block", miner_peer), miner_peer)
 
 
 def calculate_ratios(peers):
+    return average_ratios([(peer.is_slow_cpu, peer.is_slow_network, peer.block_chain.longest_chain_contribution)
+                           for peer in peers])
+
+
+def average_ratios(contributions):
+    '''
+    contributions: (is_slow_cpu, is_slow_network, longest_chain_contribution)
+    of every peer
+    '''
     ratios = {
         'cpu_low': {
             'net_low': [],
@@ -61,21 +78,17 @@ def calculate_ratios(peers):
             'net_high': [],
         }
     }
-    for peer in peers:
-        if peer.is_slow_cpu:
-            if peer.is_slow_network:
-                ratios['cpu_low']['net_low'].append(
-                    peer.block_chain.longest_chain_contribution)
+    for is_slow_cpu, is_slow_network, contribution in contributions:
+        if is_slow_cpu:
+            if is_slow_network:
+                ratios['cpu_low']['net_low'].append(contribution)
             else:
-                ratios['cpu_low']['net_high'].append(
-                    peer.block_chain.longest_chain_contribution)
+                ratios['cpu_low']['net_high'].append(contribution)
         else:
-            if peer.is_slow_network:
-                ratios['cpu_high']['net_low'].append(
-                    peer.block_chain.longest_chain_contribution)
+            if is_slow_network:
+                ratios['cpu_high']['net_low'].append(contribution)
             else:
-                ratios['cpu_high']['net_high'].append(
-                    peer.block_chain.longest_chain_contribution)
+                ratios['cpu_high']['net_high'].append(contribution)
 
     if len(ratios['cpu_low']['net_low']):
         ratios['cpu_low']['net_low'] = round(
@@ -117,11 +130,10 @@ def calculate_summary(peers):
     return summary
 
 
-def export_data(peers):
+def export_data(simulation: Simulation, peers):
     '''
     Export data to a file
     '''
-    global config_instance
     raw_data = []
     json_data = []
     for peer in peers:
@@ -132,115 +144,230 @@ def export_data(peers):
     json_data['ratios'] = calculate_ratios(peers=peers)
     # json_data['config'] = CONFIG.__dict__
     json_data['summary'] = calculate_summary(peers=peers)
+    if simulation.metrics is not None:
+        json_data['metrics'] = simulation.metrics.summary()
 
-    if CONFIG.SAVE_RESULTS:
+    if simulation.config.SAVE_RESULTS:
         output_dir = f"output/{START_TIME}"
         create_directory(output_dir)
         copy_to_directory('blockchain_simulation.log', output_dir)
         change_directory(output_dir)
     clear_dir('graphs')
 
-    config_instance = CONFIG()
     with open('config.json', 'w') as f:
-        json.dump(config_instance.__dict__, f, indent=4)
+        json.dump(simulation.config.__dict__, f, indent=4)
     with open('results.json', 'w') as f:
         json.dump(json_data, f, indent=4)
     with open('results.pkl', 'wb') as f:
         pickle.dump(json_data, f)
+    if simulation.metrics is not None:
+        simulation.metrics.export('metrics.prom')
     visualize(json_data)
 
 
-def setup_progressbars():
+class SimulationRun:
     '''
-    Setup progress bars
+    State of a simulation run used by the hooks: progress bars,
+    transactions since the last block and number of broadcasted blocks.
+    This is what a checkpoint saves.
     '''
-    global pbar_txns, pbar_blocks
-    pbar_txns = tqdm(desc='Txns: ', total=CONFIG.TOTAL_NUM_TRANSACTIONS,
-                     position=0, leave=True)
-    pbar_blocks = tqdm(
-        desc='Blks: ', total=CONFIG.TOTAL_NUM_BLOCKS, position=1, leave=True)
-
-
-def post_enqueue_hooks(event):
-    global free_tnx_counter
-    if event.type in [EventType.BLOCK_BROADCAST, EventType.BLOCK_MINE_FINISH, EventType.BLOCK_MINE_START]:
-        free_tnx_counter = 0
 
+    def __init__(self, simulation: Simulation, peers):
+        self.simulation = simulation
+        self.peers = peers
+        self.pbar_txns, self.pbar_blocks = None, None
+        self.free_tnx_counter = 0
+        self.txns_broadcasted = 0
+        self.blocks_broadcasted = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pbar_txns'], state['pbar_blocks'] = None, None
+        return state
+
+    def enable_checkpoints(self):
+        config = self.simulation.config
+        if config.CHECKPOINT_INTERVAL:
+            self.simulation.enable_checkpoints(
+                config.CHECKPOINT_INTERVAL, self.save_checkpoint)
+
+    def save_checkpoint(self):
+        blocks = {}
+        for peer in self.peers:
+            for block in peer.block_chain.known_blocks():
+                blocks[block.id] = block
+        checkpoint.save(self.simulation.config.CHECKPOINT_PATH,
+                        self, blocks.values())
+        logger.info("Checkpoint saved at %s", self.simulation.clock)
+
+    def setup_progressbars(self):
+        '''
+        Setup progress bars
+        '''
+        config = self.simulation.config
+        self.pbar_txns = tqdm(desc='Txns: ', total=config.TOTAL_NUM_TRANSACTIONS,
+                              initial=self.txns_broadcasted, position=0, leave=True)
+        self.pbar_blocks = tqdm(
+            desc='Blks: ', total=config.TOTAL_NUM_BLOCKS,
+            initial=self.blocks_broadcasted, position=1, leave=True)
+
+    def close_progressbars(self):
+        if self.pbar_txns:
+            self.pbar_txns.close()
+        if self.pbar_blocks:
+            self.pbar_blocks.close()
+
+    def post_enqueue_hooks(self, event):
+        self.free_tnx_counter = 0
+
+    def post_run_txn_hooks(self, event):
+
+        def update_progress_bars():
+            self.free_tnx_counter += 1
+            self.txns_broadcasted += 1
+            if self.pbar_txns:
+                self.pbar_txns.update(1)
+
+        def create_block_trigger():
+            simulation = self.simulation
+            if self.free_tnx_counter > (simulation.config.BLOCK_TXNS_TRIGGER_THRESHOLD*5):
+                miner_peer = simulation.random_streams.workload.choice(
+                    self.peers)
+                simulation.enqueue(block_trigger_event(
+                    miner_peer, simulation.clock))
+                self.free_tnx_counter = 0
+
+        update_progress_bars()
+        create_block_trigger()
+
+    def post_run_block_hooks(self, event):
+
+        def update_progress_bars():
+            self.blocks_broadcasted += 1
+            if self.pbar_blocks:
+                self.pbar_blocks.update(1)
+
+        def termination_condition():
+            if self.blocks_broadcasted > self.simulation.config.TOTAL_NUM_BLOCKS + 5:
+                self.simulation.stop_sim = True
+
+        update_progress_bars()
+        termination_condition()
+
+    def add_simulation_hooks(self):
+        simulation = self.simulation
+        simulation.reg_hooks(HookType.POST_ENQUEUE, self.post_enqueue_hooks,
+                             [EventType.BLOCK_BROADCAST, EventType.BLOCK_MINE_FINISH, EventType.BLOCK_MINE_START])
+        simulation.reg_hooks(HookType.POST_RUN, self.post_run_txn_hooks,
+                             [EventType.TXN_BROADCAST])
+        simulation.reg_hooks(HookType.POST_RUN, self.post_run_block_hooks,
+                             [EventType.BLOCK_BROADCAST])
+
+
+def setup_simulation(config: CONFIG, seed=None) -> SimulationRun:
+    '''
+    Create the simulation, the network of peers and schedule transactions.
+    '''
+    simulation = Simulation(config, seed)
+    peers_network = create_network(config.NUMBER_OF_PEERS, simulation)
+    logger.info("Network created")
 
-def post_run_hooks(event):
-
-    def update_progress_bars():
-        global pbar_txns, pbar_blocks
-        global free_tnx_counter, blocks_broadcasted
-        if event.type == EventType.TXN_BROADCAST:
-            free_tnx_counter += 1
-            pbar_txns.update(1)
-        elif event.type == EventType.BLOCK_BROADCAST:
-            blocks_broadcasted += 1
-            pbar_blocks.update(1)
-
-    def termination_condition():
-        global blocks_broadcasted
-        if blocks_broadcasted > CONFIG.TOTAL_NUM_BLOCKS + 5:
-            simulation.stop_sim = True
-
-    def create_block_trigger():
-        global free_tnx_counter
-        if free_tnx_counter > (CONFIG.BLOCK_TXNS_TRIGGER_THRESHOLD*5):
-            miner_peer = random.choice(peers_network)
-            time_stamp = simulation.clock + 10
-            new_block_event = Event(EventType.BLOCK_CREATE, time_stamp,
-                                    time_stamp, miner_peer.block_chain.generate_block, (), f"{miner_peer} create_block")
-            simulation.enqueue(new_block_event)
-            free_tnx_counter = 0
+    log_peers(peers_network)
+    schedule_transactions(simulation, peers_network)
+    logger.info("Transactions scheduled")
 
-    update_progress_bars()
-    termination_condition()
-    create_block_trigger()
+    simulation_run = SimulationRun(simulation, peers_network)
+    simulation_run.add_simulation_hooks()
+    simulation_run.enable_checkpoints()
+    return simulation_run
 
 
-def add_simulation_hooks(simulation):
+def resume_simulation(checkpoint_path: str) -> SimulationRun:
+    '''
+    Load a simulation run from a checkpoint.
+    '''
+    simulation_run = checkpoint.load(checkpoint_path)
+    logger.info("Simulation resumed at %s", simulation_run.simulation.clock)
+    return simulation_run
 
-    simulation.reg_hooks(HookType.POST_ENQUEUE, post_enqueue_hooks)
-    simulation.reg_hooks(HookType.POST_RUN, post_run_hooks)
 
+def run_simulation(simulation_run: SimulationRun, show_progress=True, profiler: Profiler = None):
+    '''
+    Run the simulation until the termination condition is met.
+    With a profiler and CONFIG.PROFILE_WINDOW only the events of the window
+    are profiled.
+    '''
+    logger.info("Simulation started")
+    simulation = simulation_run.simulation
+    window = simulation.config.PROFILE_WINDOW
+    try:
+        if show_progress:
+            simulation_run.setup_progressbars()
+        if profiler is not None and window is not None:
+            end_time = simulation.config.END_TIME
+            end_time = math.inf if end_time is None else end_time
+            start, end = window
+            simulation.run_until(min(start, end_time))
+            profiler.start()
+            try:
+                simulation.run_until(min(end, end_time))
+            finally:
+                profiler.stop()
+        simulation.run()
+        logger.info("Simulation ended")
+    finally:
+        simulation_run.close_progressbars()
 
-def main():
-    global config_instance, peers_network, pbar_txns, pbar_blocks
 
-    config_instance = CONFIG()
+def main(config: CONFIG = None, seed=None, checkpoint_path: str = None):
+    '''
+    Run one simulation (or resume it from a checkpoint) and export the results.
+    '''
+    if checkpoint_path:
+        simulation_run = resume_simulation(checkpoint_path)
+        config = simulation_run.simulation.config
+        print(f"Resuming from {checkpoint_path}")
+    else:
+        if config is None:
+            config = CONFIG()
+        simulation_run = None
 
     print('Simulation parameters: ')
-    for key, value in config_instance.__dict__.items():
+    for key, value in config.__dict__.items():
         print(f"{key.rjust(35)}: {value}")
 
-    peers_network = create_network(CONFIG.NUMBER_OF_PEERS)
-    logger.info("Network created")
-    print("Network created")
+    profiler = create_profiler(config)
+    # without a window the whole run is profiled, setup and export included
+    profile_all = profiler is not None and config.PROFILE_WINDOW is None
+    if profile_all:
+        profiler.start()
 
-    log_peers(peers_network)
-    schedule_transactions(peers_network)
-    logger.info("Transactions scheduled")
-    print("Transactions scheduled")
+    if simulation_run is None:
+        simulation_run = setup_simulation(config, seed)
+        print("Network created")
+        print("Transactions scheduled")
+    simulation, peers_network = simulation_run.simulation, simulation_run.peers
 
-    logger.info("Simulation started")
     print("Simulation started")
     try:
-        setup_progressbars()
-        add_simulation_hooks(simulation)
-        simulation.run()
-        logger.info("Simulation ended")
+        run_simulation(simulation_run,
+                       profiler=None if profile_all else profiler)
     except KeyboardInterrupt:
         logger.info("Simulation interrupted")
     finally:
-        pbar_txns.close()
-        pbar_blocks.close()
         print("Simulation ended")
 
-        export_data(peers_network)
+        export_data(simulation, peers_network)
         logger.info("Data exported")
         print("Data exported")
+        if profiler is not None:
+            if profile_all:
+                profiler.stop()
+            profiler.export(config.PROFILE_PATH)
+            print(f"Profile exported to {config.PROFILE_PATH}.*")
+    return simulation, peers_network
 
 
 if __name__ == "__main__":
-    main()
+    # python simulation.py [checkpoint to resume from]
+    main(checkpoint_path=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,134 @@
+'''
+Run the simulation for a grid of configurations and seeds in parallel.
+
+usage: python sweep.py [sweep.json] [num_workers]
+
+sweep.json (optional) contains either a grid of parameters
+    {"grid": {"NUMBER_OF_PEERS": [10, 20], "Z0": [0.3, 0.7]}, "seeds": [1, 2]}
+or a list of configurations
+    {"configs": [{"NUMBER_OF_PEERS": 10}, {"Z1": 0.2}], "seeds": [1]}
+Parameter names are the attributes of CONFIG, derived parameters are
+recomputed for every configuration.
+'''
+import os
+import sys
+import csv
+import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time
+from tqdm import tqdm
+
+from config import CONFIG
+
+SWEEP_GRID = {
+    "NUMBER_OF_PEERS": [20],
+    "Z0": [0.3, 0.7],
+    "Z1": [0.3, 0.7],
+    "AVG_TXN_INTERVAL_TIME": [10*1000],
+    "AVG_BLOCK_MINING_TIME": [1000*1000],
+}
+SWEEP_SEEDS = [1, 2, 3]
+
+
+def expand_grid(grid: dict) -> list[dict]:
+    '''
+    cartesian product of the parameter values
+    '''
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def run_one(overrides: dict, seed) -> dict:
+    '''
+    Run one simulation without exporting the results (worker process).
+    '''
+    # imported here so that the logger is initialised in the worker
+    import simulation as SIM
+
+    config = CONFIG(**overrides)
+    start_time = time()
+    simulation_run = SIM.setup_simulation(config, seed)
+    SIM.run_simulation(simulation_run, show_progress=False)
+    simulation, peers = simulation_run.simulation, simulation_run.peers
+    return {
+        "config": overrides,
+        "seed": seed,
+        "wall_time": time() - start_time,
+        "simulation_time": simulation.clock,
+        "ratios": SIM.calculate_ratios(peers),
+        "summary": SIM.calculate_summary(peers),
+        "metrics": simulation.metrics.summary() if simulation.metrics is not None else None,
+    }
+
+
+def to_row(result: dict) -> dict:
+    '''
+    flatten the result of one run into a row of the table
+    '''
+    row = dict(result["config"])
+    row["seed"] = result["seed"]
+    for cpu, ratios in result["ratios"].items():
+        for net, ratio in ratios.items():
+            row[f"ratio_{cpu}_{net}"] = ratio
+    summary = result["summary"]
+    row["avg_num_forks"] = sum(x["num_forks"] for x in summary)/len(summary)
+    row["avg_num_branches"] = sum(
+        x["num_branches"] for x in summary)/len(summary)
+    row["simulation_time"] = result["simulation_time"]
+    row["wall_time"] = round(result["wall_time"], 3)
+    if result.get("metrics"):
+        row["num_events"] = result["metrics"]["num_events"]
+        row["events_per_second"] = result["metrics"]["events_per_second"]
+        row["queue_depth_high_water"] = result["metrics"]["queue_depth_high_water"]
+    return row
+
+
+def run_sweep(configs: list[dict], seeds: list, max_workers: int = None) -> list[dict]:
+    '''
+    run every configuration with every seed, results are in input order
+    '''
+    jobs = [(overrides, seed) for overrides in configs for seed in seeds]
+    results = [None]*len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {executor.submit(run_one, overrides, seed): i
+                   for i, (overrides, seed) in enumerate(jobs)}
+        for future in tqdm(as_completed(futures), total=len(jobs), desc='Runs: '):
+            results[futures[future]] = future.result()
+    return results
+
+
+def export_sweep(results: list[dict], path: str = "sweep_results"):
+    '''
+    write the merged table (csv) and the full results (json)
+    '''
+    rows = [to_row(result) for result in results]
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(f"{path}.csv", 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(f"{path}.json", 'w') as f:
+        json.dump(results, f, indent=4)
+
+
+def main():
+    grid, configs, seeds = SWEEP_GRID, None, SWEEP_SEEDS
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            sweep = json.load(f)
+        grid = sweep.get("grid", {})
+        configs = sweep.get("configs")
+        seeds = sweep.get("seeds", seeds)
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    if configs is None:
+        configs = expand_grid(grid)
+
+    print(f"{len(configs)} configurations x {len(seeds)} seeds")
+    results = run_sweep(configs, seeds, max_workers)
+    export_sweep(results)
+    print("Results exported to sweep_results.csv and sweep_results.json")
+
+
+if __name__ == "__main__":
+    main()
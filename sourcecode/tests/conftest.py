@@ -0,0 +1,21 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+# the modules of the simulation are imported from sourcecode/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def simulation_module(tmp_path_factory):
+    '''
+    simulation.py, its log file is created in a temporary directory
+    '''
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("simulation"))
+    try:
+        return importlib.import_module("simulation")
+    finally:
+        os.chdir(cwd)
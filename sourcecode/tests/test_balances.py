@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from Balances import BranchBalances
+from BlockTree import BlockTree
+
+
+class FakeAccount:
+    def __init__(self, index: int):
+        self.index = index
+
+
+class FakeTransaction:
+    def __init__(self, from_id, to_id, amount: float):
+        self.from_id, self.to_id, self.amount = from_id, to_id, amount
+
+
+class FakeBlock:
+    def __init__(self, prev_block, transactions: list):
+        self.prev_block, self.transactions = prev_block, transactions
+
+
+def full_balances(block, balances: dict) -> dict:
+    '''
+    baseline, a full copy of the balances per block
+    '''
+    balances = dict(balances)
+    for transaction in block.transactions:
+        if transaction.from_id:
+            balances[transaction.from_id] -= transaction.amount
+        balances[transaction.to_id] += transaction.amount
+    return balances
+
+
+def by_account(balances, accounts: list) -> dict:
+    '''
+    balances of the accounts from the array indexed by account index
+    '''
+    return {account: balances.item(account.index) for account in accounts}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_balances_match_full_copies(seed):
+    rng = random.Random(seed)
+    accounts = [FakeAccount(i) for i in range(1, rng.randint(2, 10))]
+    root = FakeBlock(None, [])
+    expected = {root: {account: rng.uniform(0, 100) for account in accounts}}
+    tree = BlockTree(root)
+    balances = BranchBalances(tree, root, expected[root])
+    blocks = [root]
+    for _ in range(200):
+        if rng.random() < 0.6:
+            # a block on any block, coinbase transactions have no sender
+            parent = rng.choice(blocks[-10:] if rng.random() < 0.8 else blocks)
+            block = FakeBlock(parent, [FakeTransaction(
+                rng.choice(accounts + [None]), rng.choice(accounts), rng.uniform(0, 20))
+                for _ in range(rng.randint(0, 6))])
+            tree.add_block(block)
+            balances.add_block(block)
+            expected[block] = full_balances(block, expected[parent])
+            blocks.append(block)
+        else:
+            block = rng.choice(blocks)
+            assert by_account(balances.at(block), accounts) == expected[block]
+    for block in reversed(blocks):
+        assert by_account(balances.at(block), accounts) == expected[block]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_changed_accounts(seed):
+    rng = random.Random(seed)
+    accounts = [FakeAccount(i) for i in range(1, 20)]
+    root = FakeBlock(None, [])
+    tree = BlockTree(root)
+    expected = {root: {account: 100.0 for account in accounts}}
+    balances = BranchBalances(tree, root, expected[root])
+    blocks = [root]
+    for _ in range(100):
+        parent = rng.choice(blocks)
+        block = FakeBlock(parent, [FakeTransaction(
+            rng.choice(accounts), rng.choice(accounts), rng.uniform(1, 5)) for _ in range(2)])
+        tree.add_block(block)
+        balances.add_block(block)
+        expected[block] = full_balances(block, expected[parent])
+        blocks.append(block)
+    for _ in range(50):
+        source, target = rng.choice(blocks), rng.choice(blocks)
+        changed = balances.changed_accounts(source, target)
+        differing = {account for account in accounts
+                     if expected[source][account] != expected[target][account]}
+        assert differing <= set(changed)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_can_pay_checks_every_transaction_on_its_own(seed):
+    rng = random.Random(seed)
+    accounts = [FakeAccount(i) for i in range(1, 6)]
+    root = FakeBlock(None, [])
+    tree = BlockTree(root)
+    expected = {root: {account: 20.0 for account in accounts}}
+    balances = BranchBalances(tree, root, expected[root])
+    blocks = [root]
+    for _ in range(200):
+        parent = rng.choice(blocks)
+        block = FakeBlock(parent, [FakeTransaction(
+            rng.choice(accounts + [None]), rng.choice(accounts), rng.uniform(0, 15))
+            for _ in range(rng.randint(0, 4))])
+        # baseline, every sender has the amount after the parent
+        valid = all(expected[parent][transaction.from_id] >= transaction.amount
+                    for transaction in block.transactions if transaction.from_id)
+        assert balances.can_pay(block) == valid
+        if valid:
+            tree.add_block(block)
+            balances.add_block(block)
+            expected[block] = full_balances(block, expected[parent])
+            blocks.append(block)
+    assert len(blocks) > 20
@@ -0,0 +1,59 @@
+import os
+import sys
+import json
+import tempfile
+
+import benchmark
+from benchmark import compare
+
+
+def result(**metrics) -> dict:
+    values = {"wall_time": 10.0, "events_per_second": 1000.0,
+              "peak_rss_mb": 100.0, "export_time": 1.0, "num_events": 5000}
+    values.update(metrics)
+    return values
+
+
+def test_compare_threshold():
+    baseline = {"peers_20": result()}
+    # within the threshold, better or exactly at it
+    for metrics in [{}, {"wall_time": 11.9}, {"wall_time": 5.0}, {"events_per_second": 800.0},
+                    {"events_per_second": 5000.0}, {"peak_rss_mb": 120.0}]:
+        assert compare({"peers_20": result(**metrics)}, baseline, 0.2) == []
+    regressions = compare({"peers_20": result(wall_time=13.0, events_per_second=700.0)},
+                          baseline, 0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("peers_20: wall_time 10.0 -> 13.0")
+    assert regressions[1].startswith("peers_20: events_per_second 1000.0 -> 700.0")
+    assert compare({"peers_20": result(wall_time=13.0)}, baseline, 0.5) == []
+
+
+def test_compare_without_baseline():
+    baseline = {"peers_20": result(export_time=0.0)}
+    results = {"peers_20": result(export_time=0.5), "fork_heavy": result(wall_time=100.0)}
+    # no reference for the export time of peers_20, fork_heavy is new
+    assert compare(results, baseline, 0.2) == []
+    assert compare(results, {}, 0.2) == []
+
+
+def test_run_scenario_removes_its_directory(simulation_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    cwd = os.getcwd()
+    scenario = benchmark.run_scenario(
+        {"NUMBER_OF_PEERS": 10, "TARGET_NUM_BLOCKS": 1, "TXN_PER_BLOCK": 5}, 1)
+    assert os.getcwd() == cwd
+    assert os.listdir(tmp_path) == []
+    assert scenario["num_events"] > 0
+
+
+def test_main_exit_status(monkeypatch, tmp_path, capsys):
+    monkeypatch.chdir(tmp_path)
+    results = {"peers_20": result(wall_time=13.0)}
+    monkeypatch.setattr(benchmark, "run_benchmark", lambda names, repeat: results)
+    monkeypatch.setattr(sys, "argv", ["benchmark.py", "--scenarios", "peers_20"])
+    assert benchmark.main() == 0
+    assert "No baseline at benchmark_baseline.json" in capsys.readouterr().out
+    with open("benchmark_baseline.json", "w") as f:
+        json.dump({"peers_20": result()}, f)
+    assert benchmark.main() == 1
+    assert "REGRESSION peers_20: wall_time" in capsys.readouterr().out
@@ -0,0 +1,153 @@
+import random
+
+import pytest
+
+from BlockDAG import BlockDAG
+from config import CONFIG
+
+
+class FakeAccount:
+    def __init__(self, index: int):
+        self.index = index
+
+
+class FakeTransaction:
+    def __init__(self, to_id):
+        self.from_id, self.to_id, self.amount = None, to_id, 1.0
+
+
+class FakeBlock:
+    def __init__(self, prev_block, transactions: list):
+        self.prev_block, self.transactions = prev_block, transactions
+
+
+ACCOUNT = FakeAccount(0)
+TRANSACTIONS = [FakeTransaction(ACCOUNT) for _ in range(300)]
+
+
+def random_dag(rng: random.Random, num_blocks: int = 200):
+    root = FakeBlock(None, [])
+    dag = BlockDAG(root, {ACCOUNT: 0.0})
+    blocks = [root]
+    for _ in range(num_blocks):
+        parent = rng.choice(blocks[-10:] if rng.random() < 0.8 else blocks)
+        block = FakeBlock(parent, rng.sample(TRANSACTIONS, rng.randint(0, 4)))
+        dag.add_block(block)
+        blocks.append(block)
+    return dag, blocks
+
+
+def branch_of(block) -> list:
+    branch = []
+    while block is not None:
+        branch.append(block)
+        block = block.prev_block
+    return branch
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_dag_matches_naive_tree(seed):
+    rng = random.Random(seed)
+    dag, blocks = random_dag(rng)
+    # adding a block again changes nothing
+    for block in rng.sample(blocks[1:], 20):
+        dag.add_block(block)
+    for block in blocks:
+        assert block in dag
+        assert dag.children(block) == [child for child in blocks if child.prev_block is block]
+        assert dag.tree.height(block) == len(branch_of(block)) - 1
+    for _ in range(200):
+        block, transaction = rng.choice(blocks), rng.choice(TRANSACTIONS)
+        assert dag.transactions.included_upto(transaction, block) == any(
+            transaction in ancestor.transactions for ancestor in branch_of(block))
+
+
+def test_validity_is_recorded_once_per_block():
+    dag, blocks = random_dag(random.Random(0), 10)
+    assert dag.validity(blocks[1]) is None
+    dag.set_validity(blocks[1], False)
+    dag.set_validity(blocks[2], True)
+    assert dag.validity(blocks[1]) is False
+    assert dag.validity(blocks[2]) is True
+    assert dag.validity(blocks[3]) is None
+
+
+def test_peers_share_the_dag(simulation_module):
+    config = CONFIG(NUMBER_OF_PEERS=20, TARGET_NUM_BLOCKS=30, TXN_PER_BLOCK=10,
+                    AVG_BLOCK_MINING_TIME=200)
+    simulation_run = simulation_module.setup_simulation(config, seed=2)
+    simulation_module.run_simulation(simulation_run, show_progress=False)
+    dag = simulation_run.simulation.block_dag
+    all_blocks = {}
+    for peer in simulation_run.peers:
+        blocks = peer.block_chain._BlockChain__blocks
+        all_blocks.update(dict.fromkeys(blocks))
+        for block in blocks:
+            assert block in dag
+            assert dag.validity(block) is not False
+    for block in all_blocks:
+        assert set(dag.children(block)) == {
+            child for child in all_blocks if child.prev_block is block}
+
+
+def naive_balances(block, initial: dict) -> dict:
+    '''
+    baseline, the balances replayed from the genesis block
+    '''
+    balances = dict(initial)
+    for ancestor in reversed(branch_of(block)):
+        for transaction in ancestor.transactions:
+            if transaction.from_id:
+                balances[transaction.from_id] -= transaction.amount
+            balances[transaction.to_id] += transaction.amount
+    return balances
+
+
+class FakeTransfer:
+    def __init__(self, from_id, to_id, amount: float):
+        self.from_id, self.to_id, self.amount = from_id, to_id, amount
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_finality_prunes_only_unreachable_state(seed):
+    rng = random.Random(seed)
+    accounts, owners, depth = [FakeAccount(i) for i in range(4)], ["a", "b", "c"], rng.randint(1, 4)
+    root = FakeBlock(None, [])
+    initial = {account: 100.0 for account in accounts}
+    dag = BlockDAG(root, initial, depth)
+    tips = {owner: root for owner in owners}
+    for owner in owners:
+        dag.set_tip(owner, root)
+    blocks, transactions = [root], []
+    for _ in range(300):
+        parent = rng.choice([block for block in blocks[-8:] + list(tips.values())
+                              if dag.extends_finalized(block)])
+        block = FakeBlock(parent, [FakeTransfer(
+            rng.choice(accounts + [None]), rng.choice(accounts), rng.uniform(0, 5))
+            for _ in range(rng.randint(0, 3))])
+        dag.add_block(block)
+        blocks.append(block)
+        transactions.extend(block.transactions)
+        for owner in rng.sample(owners, rng.randint(0, 2)):
+            if dag.tree.height(block) >= dag.tree.height(tips[owner]):
+                tips[owner] = block
+                dag.set_tip(owner, block)
+
+        finalized = dag.finalized_block
+        min_tip_height = min(dag.tree.height(tip) for tip in tips.values())
+        assert dag.tree.height(finalized) <= max(0, min_tip_height - depth)
+        assert all(finalized in branch_of(tip) for tip in tips.values())
+        for other in rng.choices(blocks, k=20):
+            assert dag.extends_finalized(other) == (
+                dag.tree.height(finalized) == 0 or finalized in branch_of(other))
+        # the state of the blocks a peer can still build on is exact
+        for other in rng.choices(blocks, k=5):
+            if not dag.extends_finalized(other):
+                continue
+            expected = naive_balances(other, initial)
+            balances = dag.balances.at(other)
+            assert {account: balances.item(account.index) for account in accounts} == pytest.approx(expected)
+            transaction = rng.choice(transactions) if transactions else None
+            assert dag.transactions.included_upto(transaction, other) == any(
+                transaction in ancestor.transactions for ancestor in branch_of(other))
+    assert dag.tree.height(dag.finalized_block) > 0
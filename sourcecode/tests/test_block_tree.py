@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from BlockTree import BlockTree, TransactionIndex
+
+
+class FakeBlock:
+    def __init__(self, prev_block, transactions: list = ()):
+        self.prev_block, self.transactions = prev_block, list(transactions)
+
+
+def branch(block) -> list:
+    '''
+    baseline, the block and its ancestors by walking the parents
+    '''
+    blocks = []
+    while block is not None:
+        blocks.append(block)
+        block = block.prev_block
+    return blocks
+
+
+def random_tree(rng: random.Random, num_blocks: int) -> tuple[BlockTree, list]:
+    root = FakeBlock(None)
+    tree, blocks = BlockTree(root), [root]
+    for _ in range(num_blocks):
+        # mostly long chains, with forks
+        parent = blocks[-1] if rng.random() < 0.8 else rng.choice(blocks)
+        block = FakeBlock(parent)
+        tree.add_block(block)
+        blocks.append(block)
+    return tree, blocks
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_ancestors_match_walking_the_parents(seed):
+    rng = random.Random(seed)
+    tree, blocks = random_tree(rng, 600)
+    for block in rng.sample(blocks, 100):
+        ancestors = branch(block)[::-1]  # by height
+        assert tree.height(block) == len(ancestors) - 1
+        for height in range(-1, len(ancestors) + 1):
+            expected = ancestors[height] if 0 <= height < len(ancestors) else None
+            assert tree.ancestor(block, height) is expected
+        for other in rng.sample(blocks, 20):
+            assert tree.is_ancestor(other, block) == (other in ancestors)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_included_upto_matches_the_branch(seed):
+    rng = random.Random(seed)
+    transactions = [object() for _ in range(30)]
+    root = FakeBlock(None)
+    tree, blocks = BlockTree(root), [root]
+    index = TransactionIndex(tree)
+    for _ in range(300):
+        block = FakeBlock(rng.choice(blocks[-5:] if rng.random() < 0.8 else blocks),
+                          rng.sample(transactions, rng.randint(0, 3)))
+        tree.add_block(block)
+        index.add_block(block)
+        blocks.append(block)
+    for block in rng.sample(blocks, 60):
+        included = {transaction for ancestor in branch(block)
+                    for transaction in ancestor.transactions}
+        for transaction in transactions:
+            assert index.included_upto(transaction, block) == (transaction in included)
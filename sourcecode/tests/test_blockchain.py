@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from config import CONFIG
+
+
+@pytest.fixture(scope="module")
+def fork_run(simulation_module):
+    '''
+    peers of a run with many forks (blocks are mined faster than they
+    propagate)
+    '''
+    config = CONFIG(NUMBER_OF_PEERS=20, TARGET_NUM_BLOCKS=40, TXN_PER_BLOCK=10,
+                    AVG_BLOCK_MINING_TIME=200)
+    simulation_run = simulation_module.setup_simulation(config, seed=1)
+    simulation_module.run_simulation(simulation_run, show_progress=False)
+    return simulation_run.peers
+
+
+def blocks_of(peer) -> list:
+    return list(peer.block_chain._BlockChain__blocks)
+
+
+def chain_length(block) -> int:
+    length = 0
+    while block is not None:
+        length += 1
+        block = block.prev_block
+    return length
+
+
+def test_branches_match_naive_computation(fork_run):
+    assert sum(peer.block_chain.branches_info["num_forks"] for peer in fork_run) > 0
+    for peer in fork_run:
+        blocks = blocks_of(peer)
+        children = {block: [] for block in blocks}
+        for block in blocks:
+            if block.prev_block is not None:
+                children[block.prev_block].append(block)
+        leaves = [block for block in blocks if not children[block]]
+        forks = [block for block in blocks if len(children[block]) > 1]
+
+        info = peer.block_chain.branches_info
+        assert sorted((branch["leaf_block"], branch["length"]) for branch in info["branches"]) == sorted(
+            (repr(leaf), chain_length(leaf)) for leaf in leaves)
+        assert sorted((fork["fork_at"], fork["num_forks"]) for fork in info["forks"]) == sorted(
+            (repr(block), len(children[block])) for block in forks)
+        assert info["num_branches"] == len(leaves)
+        assert info["num_forks"] == len(forks)
+
+
+def test_parents_arrive_first(fork_run):
+    for peer in fork_run:
+        seen = {None}
+        for block in blocks_of(peer):
+            assert block.prev_block in seen
+            seen.add(block)
+
+
+def test_longest_chain_matches_walk_from_its_leaf(fork_run):
+    for peer in fork_run:
+        block_chain = peer.block_chain
+        leaf = block_chain._BlockChain__longest_chain_leaf
+        walk = []
+        while leaf.prev_block is not None:
+            walk.append(leaf)
+            leaf = leaf.prev_block
+        walk.reverse()
+        assert block_chain._BlockChain__longest_chain == walk
+        assert block_chain.longest_chain_length == len(walk) + 1
+        for miner in fork_run:
+            assert block_chain.longest_chain_blocks_by(miner) == sum(
+                block.miner is miner for block in walk)
+
+
+def test_finality_keeps_the_results(simulation_module, fork_run):
+    config = CONFIG(NUMBER_OF_PEERS=20, TARGET_NUM_BLOCKS=40, TXN_PER_BLOCK=10,
+                    AVG_BLOCK_MINING_TIME=200, FINALITY_DEPTH=6)
+    simulation_run = simulation_module.setup_simulation(config, seed=1)
+    simulation_module.run_simulation(simulation_run, show_progress=False)
+    assert simulation_run.simulation.block_dag.finalized_block.prev_block is not None
+
+    def exported(peers):
+        return json.dumps([peer.block_chain.__dict__ for peer in peers], default=str)
+    assert exported(simulation_run.peers) == exported(fork_run)
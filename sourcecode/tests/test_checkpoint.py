@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import checkpoint
+from config import CONFIG
+
+
+def small_config(**overrides) -> CONFIG:
+    return CONFIG(NUMBER_OF_PEERS=10, TARGET_NUM_BLOCKS=4, TXN_PER_BLOCK=20, **overrides)
+
+
+def run_to_end(simulation_module, simulation_run) -> str:
+    '''
+    run the rest of the simulation, its results as a string
+    '''
+    simulation_module.run_simulation(simulation_run, show_progress=False)
+    simulation, peers = simulation_run.simulation, simulation_run.peers
+    return json.dumps({
+        "clock": simulation.clock,
+        "ratios": simulation_module.calculate_ratios(peers),
+        "summary": simulation_module.calculate_summary(peers),
+        "peers": [peer.__dict__ for peer in peers],
+    }, sort_keys=True, default=repr)
+
+
+def test_resume_gives_the_same_results(simulation_module, tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    expected = run_to_end(simulation_module, simulation_module.setup_simulation(
+        small_config(), seed=5))
+    end_time = json.loads(expected)["clock"]
+
+    # the last checkpoint is taken after 80% of the run
+    config = small_config(CHECKPOINT_INTERVAL=0.4*end_time, CHECKPOINT_PATH=path)
+    with_checkpoints = run_to_end(
+        simulation_module, simulation_module.setup_simulation(config, seed=5))
+    assert with_checkpoints == expected
+
+    resumed = simulation_module.resume_simulation(path)
+    assert 0 < resumed.simulation.clock < end_time
+    assert run_to_end(simulation_module, resumed) == expected
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_checkpoint"
+    path.write_bytes(b"something else")
+    with pytest.raises(ValueError):
+        checkpoint.load(str(path))
@@ -0,0 +1,78 @@
+import heapq
+import random
+
+import pytest
+
+from EventQueue import EVENT_QUEUE_BACKENDS, CalendarEventQueue
+
+
+class FakeEvent:
+    def __init__(self, number: int, actionable_at: float):
+        self.number = number  # enqueue order
+        self.actionable_at = actionable_at
+
+
+class NaiveQueue:
+    '''
+    baseline, the earliest event and the first enqueued among equal times
+    '''
+
+    def __init__(self):
+        self.entries = []
+
+    def put(self, event):
+        heapq.heappush(self.entries, (event.actionable_at, event.number, event))
+
+    def get(self):
+        return heapq.heappop(self.entries)[2]
+
+    def qsize(self) -> int:
+        return len(self.entries)
+
+
+def run_operations(queue, seed: int, num_operations: int = 1500) -> list:
+    '''
+    random puts and gets (with ties, bursts and events in the past of the
+    last event returned), numbers of the events in the order returned
+    '''
+    rng = random.Random(seed)
+    now, order, number = 0.0, [], 0
+    for _ in range(num_operations):
+        if queue.qsize() and rng.random() < 0.45:
+            event = queue.get()
+            now = event.actionable_at
+            order.append(event.number)
+            continue
+        for _ in range(rng.choice([1, 1, 1, 40])):
+            kind = rng.random()
+            if kind < 0.2:
+                delay = 0.0
+            elif kind < 0.25:
+                delay = -rng.uniform(0, 10)
+            else:
+                delay = rng.expovariate(1/rng.choice([0.01, 1, 1000]))
+            queue.put(FakeEvent(number, now + delay))
+            number += 1
+    while queue.qsize():
+        order.append(queue.get().number)
+    return order
+
+
+@pytest.mark.parametrize("backend", sorted(EVENT_QUEUE_BACKENDS))
+@pytest.mark.parametrize("seed", range(10))
+def test_order_matches_naive_queue(backend, seed):
+    expected = run_operations(NaiveQueue(), seed)
+    assert run_operations(EVENT_QUEUE_BACKENDS[backend](), seed) == expected
+
+
+def test_calendar_queue_resizes():
+    queue = CalendarEventQueue()
+    events = [FakeEvent(i, i*0.37 % 101) for i in range(5000)]
+    for event in events:
+        queue.put(event)
+    assert queue.qsize() == len(events)
+    result = [queue.get() for _ in events]
+    assert result == sorted(events, key=lambda x: (x.actionable_at, x.number))
+    assert queue.empty()
+    with pytest.raises(IndexError):
+        queue.get()
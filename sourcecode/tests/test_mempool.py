@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from Balances import BranchBalances
+from BlockTree import BlockTree
+from Mempool import Mempool
+
+
+class FakeAccount:
+    def __init__(self, index: int):
+        self.index = index
+
+
+class FakeTransaction:
+    def __init__(self, from_id, to_id, amount: float):
+        self.from_id, self.to_id, self.amount = from_id, to_id, amount
+
+
+class FakeBlock:
+    def __init__(self, prev_block, transactions: list):
+        self.prev_block, self.transactions = prev_block, transactions
+
+
+def naive_template(pending: list, balances: dict) -> list:
+    '''
+    baseline, pending transactions in arrival order that the sender can pay
+    with the balances of the tip and of the transactions taken before
+    '''
+    running, template = dict(balances), []
+    for transaction in pending:
+        if running[transaction.from_id] < transaction.amount:
+            continue
+        running[transaction.from_id] -= transaction.amount
+        running[transaction.to_id] += transaction.amount
+        template.append(transaction)
+    return template
+
+
+def by_account(balances, accounts: list) -> dict:
+    '''
+    balances of the accounts from the array indexed by account index
+    '''
+    return {account: balances.item(account.index) for account in accounts}
+
+
+@pytest.mark.parametrize("compact_min", [2, Mempool.COMPACT_MIN])
+@pytest.mark.parametrize("seed", range(40))
+def test_template_matches_naive_selection(seed, compact_min, monkeypatch):
+    monkeypatch.setattr(Mempool, "COMPACT_MIN", compact_min)
+    rng = random.Random(seed)
+    accounts = [FakeAccount(i) for i in range(1, rng.randint(3, 9))]
+    root = FakeBlock(None, [])
+    tree = BlockTree(root)
+    balances = BranchBalances(tree, root, {account: rng.uniform(0, 50) for account in accounts})
+    blocks, tip = [root], root
+    mempool, pending = Mempool(balances, tip), []
+
+    def new_transaction(max_amount):
+        return FakeTransaction(rng.choice(accounts), rng.choice(accounts), rng.uniform(0, max_amount))
+
+    for _ in range(300):
+        operation = rng.random()
+        if operation < 0.5:
+            transaction = new_transaction(30)
+            mempool.add(transaction)
+            pending.append(transaction)
+        elif operation < 0.7 and pending:
+            transaction = rng.choice(pending)
+            pending.remove(transaction)
+            mempool.remove(transaction)
+        elif operation < 0.85:
+            # a block on any block, maybe including a pending transaction
+            transactions = [new_transaction(10) for _ in range(rng.randint(0, 3))]
+            if pending and rng.random() < 0.5:
+                transaction = rng.choice(pending)
+                pending.remove(transaction)
+                mempool.remove(transaction)
+                transactions.append(transaction)
+            block = FakeBlock(rng.choice(blocks), transactions)
+            tree.add_block(block)
+            balances.add_block(block)
+            blocks.append(block)
+        elif operation < 0.95:
+            tip = rng.choice(blocks)
+            mempool.set_tip(tip)
+        else:
+            assert mempool.template() == naive_template(pending, by_account(balances.at(tip), accounts))
+            balances.at(rng.choice(blocks))  # the view is moved by others too
+        assert len(mempool) == len(pending)
+    assert mempool.template() == naive_template(pending, by_account(balances.at(tip), accounts))
+    for transaction in pending:
+        assert transaction in mempool
+
+
+def test_removed_transactions_are_compacted(monkeypatch):
+    monkeypatch.setattr(Mempool, "COMPACT_MIN", 8)
+    root = FakeBlock(None, [])
+    sender, receiver = FakeAccount(0), FakeAccount(1)
+    balances = BranchBalances(BlockTree(root), root, {sender: 100.0, receiver: 100.0})
+    mempool = Mempool(balances, root)
+    transactions = [FakeTransaction(sender, receiver, 1.0) for _ in range(100)]
+    for transaction in transactions:
+        mempool.add(transaction)
+    for transaction in transactions[:90]:
+        mempool.remove(transaction)
+    # compacted once the template is recomputed
+    assert mempool.template() == transactions[90:]
+    assert len(mempool._Mempool__order) < 50
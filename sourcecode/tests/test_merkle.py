@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from Block import Block, GENESIS_BLOCK, MerkleTree, sha256
+from Transaction import Transaction
+
+
+def naive_root(transaction_ids: list):
+    '''
+    baseline, pairs of hashes level by level, an odd hash is paired with itself
+    '''
+    if not transaction_ids:
+        return None
+    level = [sha256(transaction_id) for transaction_id in transaction_ids]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [sha256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+
+@pytest.mark.parametrize("size", list(range(0, 18)) + [33, 100])
+def test_root_matches_naive_root(size):
+    transaction_ids = [f"txn{i}" for i in range(size)]
+    assert MerkleTree(transaction_ids).root == naive_root(transaction_ids)
+
+
+def test_append_matches_rebuilding():
+    tree, transaction_ids = MerkleTree([]), []
+    for i in range(70):
+        transaction_ids.append(f"txn{i}")
+        tree.append(transaction_ids[-1])
+        rebuilt = MerkleTree(transaction_ids)
+        assert tree.levels == rebuilt.levels
+        assert tree.root == naive_root(transaction_ids)
+
+
+def test_appending_a_transaction_changes_the_hash():
+    rng = random.Random(0)
+    transactions = [Transaction(1, 2, 1.0, 0, rng) for _ in range(3)]
+    block = Block(GENESIS_BLOCK, transactions[:2], None, 1, rng)
+    old_hash = block.block_hash()
+    assert block.block_hash() == old_hash
+    block.append_transaction(transactions[2])
+    assert block.merkle_root == naive_root([transaction.txn_id for transaction in transactions])
+    assert block.block_hash() != old_hash
+    assert block.block_hash() == sha256(block.header)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from metrics import LatencyHistogram
+
+
+def sample_values(seed: int, size: int = 20000) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=9, sigma=3, size=size).astype(np.int64)
+    # the edges of the buckets
+    powers = np.array([1 << bits for bits in range(45)], dtype=np.int64)
+    return np.concatenate([values, powers - 1, powers, powers + 1, np.arange(64)])
+
+
+def test_bucket_contains_the_value():
+    values = sample_values(0)
+    for value in values.tolist():
+        lower, upper = LatencyHistogram.bucket_range(
+            LatencyHistogram.bucket_of(value))
+        assert lower <= value < upper
+        assert upper - lower <= max(1, lower/LatencyHistogram.SUB_BUCKETS)
+    buckets = [LatencyHistogram.bucket_of(value) for value in sorted(values.tolist())]
+    assert buckets == sorted(buckets)
+
+
+def test_vectorized_buckets_match():
+    values = sample_values(1)
+    assert LatencyHistogram.buckets_of(values).tolist() == [
+        LatencyHistogram.bucket_of(value) for value in values.tolist()]
+
+
+@pytest.mark.parametrize("percent", [1, 50, 90, 99, 99.9])
+def test_percentile_within_bucket_precision(percent):
+    values = sample_values(2)
+    histogram = LatencyHistogram()
+    histogram.add(LatencyHistogram.buckets_of(values))
+    expected = np.percentile(values, percent, method="inverted_cdf")
+    assert abs(histogram.percentile(percent) - expected) <= max(
+        1, expected/LatencyHistogram.SUB_BUCKETS)
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from Block import Block, GENESIS_BLOCK
+from config import CONFIG
+from OrphanPool import OrphanPool
+from Transaction import Transaction
+
+
+class FakeBlock:
+    def __init__(self, prev_block):
+        self.prev_block = prev_block
+
+
+class NaiveOrphanPool:
+    '''
+    baseline, a list of (block, arrival time, arrival number)
+    '''
+
+    def __init__(self, max_size: int, max_age: float):
+        self.max_size, self.max_age = max_size, max_age
+        self.orphans, self.num_added = [], 0
+
+    def add(self, block, now: float) -> bool:
+        if any(orphan is block for orphan, _, _ in self.orphans):
+            return False
+        self.orphans.append((block, now, self.num_added))
+        self.num_added += 1
+        while len(self.orphans) > self.max_size:
+            self.orphans.pop(0)
+        while self.orphans and now - self.orphans[0][1] > self.max_age:
+            self.orphans.pop(0)
+        return True
+
+    def pop_children(self, parent) -> list:
+        children = [(number, block) for block, _, number in self.orphans
+                    if block.prev_block is parent]
+        self.orphans = [entry for entry in self.orphans if entry[0].prev_block is not parent]
+        return children
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_pool_matches_naive_pool(seed):
+    rng = random.Random(seed)
+    max_size, max_age = rng.randint(1, 10), rng.choice([5.0, 50.0, float("inf")])
+    pool, naive = OrphanPool(max_size, max_age), NaiveOrphanPool(max_size, max_age)
+    parents = [FakeBlock(None) for _ in range(5)]
+    blocks, now = [], 0.0
+    for _ in range(300):
+        now += rng.expovariate(1)
+        if rng.random() < 0.6:
+            # a new orphan or one received again
+            if blocks and rng.random() < 0.2:
+                block = rng.choice(blocks)
+            else:
+                block = FakeBlock(rng.choice(parents + blocks[-5:]))
+                blocks.append(block)
+            assert pool.add(block, now) == naive.add(block, now)
+        else:
+            parent = rng.choice(parents + blocks[-5:])
+            assert pool.pop_children(parent) == naive.pop_children(parent)
+        assert list(pool) == [block for block, _, _ in naive.orphans]
+        assert len(pool) == len(naive.orphans)
+
+
+@pytest.fixture
+def chains(simulation_module):
+    '''
+    block chains of a network that is not running, blocks are added by hand
+    '''
+    config = CONFIG(NUMBER_OF_PEERS=10, ORPHAN_POOL_SIZE=4)
+    return simulation_module.setup_simulation(config, seed=1).peers
+
+
+def test_orphans_are_connected_in_cascade(chains):
+    peers, rng = chains, random.Random(0)
+    chain = peers[0].block_chain
+    b1 = Block(GENESIS_BLOCK, [], peers[1], 1, rng)
+    b2 = Block(b1, [], peers[1], 2, rng)
+    b3 = Block(b2, [], peers[2], 3, rng)
+    b3_fork = Block(b2, [], peers[3], 3, rng)
+    b4 = Block(b3, [], peers[2], 4, rng)
+    for block in (b4, b3_fork, b3, b2):
+        chain.add_block(block)
+    assert chain.branches_info["num_branches"] == 1  # only the genesis block
+    chain.add_block(b1)
+    info = chain.branches_info
+    assert sorted((branch["leaf_block"], branch["length"]) for branch in info["branches"]) == sorted(
+        [(repr(b4), 5), (repr(b3_fork), 4)])
+    assert info["forks"] == [{"fork_at": repr(b2), "num_forks": 2}]
+
+
+def test_invalid_orphan_drops_its_descendants(chains):
+    peers, rng = chains, random.Random(0)
+    chain = peers[0].block_chain
+    b1 = Block(GENESIS_BLOCK, [], peers[1], 1, rng)
+    overspending = Transaction(peers[2], peers[3], 10**9, 2, rng)
+    b2 = Block(b1, [overspending], peers[1], 2, rng)
+    b3 = Block(b2, [], peers[1], 3, rng)
+    chain.add_block(b3)
+    chain.add_block(b2)
+    chain.add_block(b1)
+    assert [branch["leaf_block"] for branch in chain.branches_info["branches"]] == [repr(b1)]
+    assert b3 not in chain.known_blocks()
+
+
+def test_pool_is_bounded(chains):
+    peers, rng = chains, random.Random(0)
+    chain = peers[1].block_chain
+    blocks = [Block(GENESIS_BLOCK, [], peers[1], 1, rng)]
+    for number in range(6):
+        blocks.append(Block(blocks[-1], [], peers[1], 2 + number, rng))
+    for block in blocks[1:]:
+        chain.add_block(block)
+    # 6 orphans, the 2 oldest are evicted: only the first block connects
+    chain.add_block(blocks[0])
+    assert [branch["length"] for branch in chain.branches_info["branches"]] == [2]
@@ -0,0 +1,288 @@
+import os
+import sys
+import math
+import heapq
+import bisect
+import random
+import importlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from config import CONFIG
+from network import random_topology
+from Peer import RemotePeer
+from random_streams import RandomStreams
+
+
+@pytest.fixture(scope="module")
+def parallel_module(simulation_module):
+    return importlib.import_module("parallel")
+
+
+def random_events(rng: random.Random, num_processes: int, end: float) -> list:
+    '''
+    (time, process, kind) sorted by time, kind is a transaction broadcast
+    (HOOK_TXN) or a block event (HOOK_RESET)
+    '''
+    events = [(rng.uniform(0, end), rng.randrange(num_processes), rng.choices([0, 1], [20, 1])[0])
+              for _ in range(3000)]
+    return sorted(events)
+
+
+def naive_triggers(config: CONFIG, seed, events: list) -> list:
+    '''
+    baseline, SimulationRun hooks run after every event in time order
+    '''
+    workload = RandomStreams(seed).workload
+    free_txns, triggers = 0, []
+    for time, _, kind in events:
+        if kind == 1:
+            free_txns = 0
+            continue
+        free_txns += 1
+        if free_txns > config.BLOCK_TXNS_TRIGGER_THRESHOLD*5:
+            triggers.append((time, workload.choice(range(config.NUMBER_OF_PEERS))))
+            free_txns = 0
+    return triggers
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_global_hooks_match_time_ordered_events(parallel_module, seed):
+    rng = random.Random(seed)
+    config = CONFIG(NUMBER_OF_PEERS=10, TXN_PER_BLOCK=rng.randint(1, 8))
+    num_processes = rng.randint(1, 4)
+    events = random_events(rng, num_processes, 20000)
+    hooks = parallel_module.GlobalHooks(config, seed, num_processes)
+    # hook events of every process, in the order it runs them
+    logs = [[(time, kind) for time, source, kind in events if source == process]
+            for process in range(num_processes)]
+    reported = [0]*num_processes
+    triggers, until = [], 0
+    while until < math.inf:
+        until = rng.uniform(until, until + 2000) if until < 20000 else math.inf
+        # every process is past until, some ahead of the others
+        parts = []
+        for process, log in enumerate(logs):
+            position = max(reported[process], bisect.bisect_left(log, (until + rng.uniform(0, 500),)))
+            parts.append(log[reported[process]:position])
+            reported[process] = position
+        hooks.add(parts, 0)
+        triggers += hooks.replay(until)
+    assert triggers == naive_triggers(config, seed, events)
+    assert len(triggers) > 1
+
+
+def test_trigger_time(parallel_module, simulation_module):
+    miner = SimpleNamespace(block_chain=SimpleNamespace(generate_block=None))
+    event = simulation_module.block_trigger_event(miner, 100.0)
+    assert event.actionable_at == parallel_module.trigger_time(100.0)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_ladders_bound_the_ranks(parallel_module, seed):
+    rng = random.Random(seed)
+    groups = [sorted(rng.expovariate(1) for _ in range(rng.choice([0, 1, 5, 60, 3000])))
+              for _ in range(rng.randint(1, 6))]
+    ladder = parallel_module.thin_ladder(parallel_module.merge_ladders(
+        [parallel_module.sorted_ladder(times) for times in groups]))
+    times = sorted(time for group in groups for time in group)
+    for rank in {1, 2, 10, 64, 65, 500, len(times) + 1, max(1, len(times))}:
+        bound = parallel_module.rank_bound(ladder, rank)
+        if rank > len(times):
+            assert bound == math.inf
+            continue
+        assert bound <= times[rank - 1]
+        if rank <= parallel_module.EXACT_RANKS:
+            assert bound == times[rank - 1]
+        else:
+            assert bound >= times[int(rank/parallel_module.RANK_GROWTH**2) - 1]
+
+
+def test_mining_times_match_draws(parallel_module):
+    stream = RandomStreams(1).peer(0).mining
+    mining_times = parallel_module._MiningTimes(stream)
+    stream.expon(1)
+    for end in [5, 3000, 3010, 3100, 2000, 4000]:
+        values, counts, total = mining_times.ladder(mining_times.started + end)
+        upcoming = stream.upcoming_exponentials()
+        draws = sorted(np.concatenate([next(upcoming) for _ in range(end//64 + 2)])[:end])
+        for value, count in zip(values, counts):
+            # at most count of the times are below value
+            assert bisect.bisect_left(draws, value) <= count
+        assert values[0] == draws[0] and total >= end
+        for _ in range(50):
+            stream.expon(1)
+            mining_times.started += 1
+
+
+def min_cut_delay(partition: list[int], links: list) -> float:
+    return min((pij for i, j, pij in links if partition[i] != partition[j]), default=math.inf)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("num_peers, num_partitions", [(9, 4), (20, 3), (60, 4), (200, 8)])
+def test_partition_is_balanced_and_cuts_slow_links(parallel_module, seed, num_peers, num_partitions):
+    config = CONFIG(NUMBER_OF_PEERS=num_peers)
+    _, _, links = random_topology(num_peers, config, RandomStreams(seed).network)
+    partition = parallel_module.partition_peers(num_peers, num_partitions, links)
+    sizes = [partition.count(index) for index in range(num_partitions)]
+    assert len(partition) == num_peers and min(sizes) > 0
+    assert max(sizes) <= 2*(num_peers//num_partitions)
+    # baseline, contiguous ranges of peer indices
+    contiguous = [i*num_partitions//num_peers for i in range(num_peers)]
+    assert min_cut_delay(partition, links) >= min_cut_delay(contiguous, links)
+    shortest = min(links, key=lambda link: link[2])
+    assert partition[shortest[0]] == partition[shortest[1]]
+
+
+def naive_delay(partition: list[int], links: list, source: int, destination: int) -> float:
+    '''
+    baseline, Dijkstra from partition to partition over the links between them
+    '''
+    neighbours = {}
+    for i, j, pij in links:
+        a, b = partition[i], partition[j]
+        if a != b:
+            neighbours.setdefault(a, []).append((b, pij))
+            neighbours.setdefault(b, []).append((a, pij))
+    distances, queue = {source: 0}, [(0, source)]
+    while queue:
+        distance, node = heapq.heappop(queue)
+        if distance > distances[node]:
+            continue
+        for neighbour, pij in neighbours.get(node, []):
+            if distance + pij < distances.get(neighbour, math.inf):
+                distances[neighbour] = distance + pij
+                heapq.heappush(queue, (distance + pij, neighbour))
+    return distances.get(destination, math.inf)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_partition_delays_match_shortest_paths(parallel_module, seed):
+    rng = random.Random(seed)
+    num_peers, num_partitions = rng.randint(10, 40), rng.randint(2, 5)
+    config = CONFIG(NUMBER_OF_PEERS=num_peers)
+    _, _, links = random_topology(num_peers, config, RandomStreams(seed).network)
+    partition = [rng.randrange(num_partitions) for _ in range(num_peers)]
+    partition[:num_partitions] = range(num_partitions)
+    delays = parallel_module.partition_delays(partition, links)
+    for source in range(num_partitions):
+        for destination in range(num_partitions):
+            if source != destination:
+                expected = naive_delay(partition, links, source, destination)
+            else:
+                # round trip through another partition
+                expected = min(naive_delay(partition, links, source, other) + naive_delay(partition, links, other, source)
+                               for other in range(num_partitions) if other != source)
+            assert delays[source][destination] == pytest.approx(expected)
+
+
+def test_logical_process_builds_local_peers(parallel_module):
+    config = CONFIG(NUMBER_OF_PEERS=20)
+    partition = [i % 2 for i in range(20)]
+    process = parallel_module.LogicalProcess(config, 1, partition, 0)
+    for peer in process.peers:
+        assert isinstance(peer, RemotePeer) == (partition[peer.index] != 0)
+        # links with a peer of this partition only
+        assert all(partition[peer.index] == 0 or partition[neighbour.index] == 0
+                   for neighbour in peer.neighbours)
+    sequential = parallel_module.LogicalProcess(config, 1, [0]*20, 0)
+    assert [peer.id for peer in process.peers] == [peer.id for peer in sequential.peers]
+    for i in range(0, 20, 2):
+        assert ({neighbour.index for neighbour in process.peers[i].neighbours}
+                == {neighbour.index for neighbour in sequential.peers[i].neighbours})
+    assert 0 < process.lookaheads[1] < process.lookaheads[0] < math.inf
+
+
+def simulation_results(simulation_module, config: CONFIG, seed) -> dict:
+    '''
+    results of simulation.py for the seed
+    '''
+    simulation_run = simulation_module.setup_simulation(config, seed)
+    simulation_module.run_simulation(simulation_run, show_progress=False)
+    return {
+        "ratios": simulation_module.calculate_ratios(simulation_run.peers),
+        "summary": simulation_module.calculate_summary(simulation_run.peers),
+        "simulation_time": simulation_run.simulation.clock,
+    }
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+@pytest.mark.parametrize("num_partitions", [2, 3, 4])
+def test_parallel_matches_simulation(parallel_module, simulation_module, seed, num_partitions):
+    # stops after TOTAL_NUM_BLOCKS + 6 blocks
+    config = CONFIG(NUMBER_OF_PEERS=20, TARGET_NUM_BLOCKS=8, TXN_PER_BLOCK=10,
+                    AVG_BLOCK_MINING_TIME=200)
+    expected = simulation_results(simulation_module, config, seed)
+    results = parallel_module.run_parallel(config, seed, num_partitions)
+    for key in ("ratios", "summary", "simulation_time"):
+        assert results[key] == expected[key]
+    # blocks were triggered
+    assert any(summary["branches"][0]["length"] > 1 for summary in expected["summary"])
+
+
+@pytest.mark.parametrize("num_partitions", [2, 3])
+def test_processes_far_apart_match_simulation(parallel_module, simulation_module, num_partitions):
+    # few transactions, the next events of the processes are far apart
+    config = CONFIG(NUMBER_OF_PEERS=30, TARGET_NUM_BLOCKS=20, END_TIME=200000)
+    expected = simulation_results(simulation_module, config, 1)
+    results = parallel_module.run_parallel(config, 1, num_partitions)
+    for key in ("ratios", "summary", "simulation_time"):
+        assert results[key] == expected[key]
+
+
+def test_end_time_matches_simulation(parallel_module, simulation_module):
+    config = CONFIG(NUMBER_OF_PEERS=12, TARGET_NUM_BLOCKS=50, TXN_PER_BLOCK=3,
+                    AVG_BLOCK_MINING_TIME=2000, AVG_TXN_INTERVAL_TIME=1000, END_TIME=30000)
+    expected = simulation_results(simulation_module, config, 3)
+    results = parallel_module.run_parallel(config, 3, 3)
+    for key in ("ratios", "summary", "simulation_time"):
+        assert results[key] == expected[key]
+    assert expected["simulation_time"] <= config.END_TIME
+
+
+def test_run_sequential_is_simulation(parallel_module, simulation_module):
+    config = CONFIG(NUMBER_OF_PEERS=10, TARGET_NUM_BLOCKS=4, TXN_PER_BLOCK=5,
+                    AVG_BLOCK_MINING_TIME=500)
+    assert parallel_module.run_sequential(config, 4) == simulation_results(simulation_module, config, 4)
+
+
+def fail_in_process(parallel_module, index: int, exit: bool):
+    '''
+    LogicalProcess.run failing in process index, the others run normally
+    '''
+    run = parallel_module.LogicalProcess.run
+
+    def failing_run(self, exchange):
+        if self.index == index:
+            if exit:
+                os._exit(3)
+            raise ValueError("failure in the logical process")
+        return run(self, exchange)
+    return failing_run
+
+
+@pytest.mark.parametrize("exit", [False, True])
+def test_failing_process_does_not_hang(parallel_module, monkeypatch, exit):
+    # the workers are forked, they run the patched method
+    monkeypatch.setattr(parallel_module.LogicalProcess, "run", fail_in_process(parallel_module, 1, exit))
+    config = CONFIG(NUMBER_OF_PEERS=20, TARGET_NUM_BLOCKS=8, TXN_PER_BLOCK=10,
+                    AVG_BLOCK_MINING_TIME=200)
+    message = "exited with code 3" if exit else "ValueError: failure in the logical process"
+    with pytest.raises(RuntimeError, match=message):
+        parallel_module.run_parallel(config, 1, 3)
+
+
+def test_main_exit_status(parallel_module, monkeypatch, tmp_path, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["parallel.py", "2", "--end-time", "20000", "--peers", "10",
+                                      "--blocks", "4", "--seed", "3", "--verify"])
+    assert parallel_module.main() == 0
+    assert "results match" in capsys.readouterr().out
+    run_sequential = parallel_module.run_sequential
+    monkeypatch.setattr(parallel_module, "run_sequential",
+                        lambda config, seed: run_sequential(config, seed + 1))
+    assert parallel_module.main() == 1
+    assert "results differ" in capsys.readouterr().out
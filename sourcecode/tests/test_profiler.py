@@ -0,0 +1,46 @@
+import os
+
+import profiler
+from profiler import SUBSYSTEM_MODULES, subsystem_of
+
+SOURCE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# scripts and helpers, their time belongs to the caller (or to the rules
+# of SUBSYSTEM_FUNCTIONS)
+UNMAPPED_MODULES = {
+    "simulation.py", "config.py", "utils.py", "sweep.py", "benchmark.py",
+    "performance.py", "profiler.py", "queue_benchmark.py", "filter_json.py",
+}
+
+
+def test_every_module_has_a_subsystem():
+    modules = {name for name in os.listdir(SOURCE_DIRECTORY) if name.endswith(".py")}
+    assert modules - UNMAPPED_MODULES - set(SUBSYSTEM_MODULES) == set()
+    assert set(SUBSYSTEM_MODULES) <= modules
+
+
+def test_subsystem_of():
+    assert subsystem_of("/src/simulation.py", "export_data") == "export"
+    assert subsystem_of("/src/Link.py", "anything") == "links"
+    assert subsystem_of("/env/site-packages/networkx/classes/graph.py",
+                        "add_edge") == "visualisation"
+    assert subsystem_of("/src/simulation.py", "main") is None
+    assert subsystem_of("~", "<built-in method builtins.len>") is None
+
+
+def unknown():
+    return sum(range(2000))
+
+
+def test_cprofile_attributes_unknown_functions_to_callers():
+    # a function of Link.py calling a function of no subsystem
+    namespace = {"unknown": unknown}
+    exec(compile("def send():\n    for _ in range(200):\n        unknown()\n",
+                 os.path.join("src", "Link.py"), "exec"), namespace)
+    backend = profiler.CProfileProfiler()
+    backend.start()
+    namespace["send"]()
+    backend.stop()
+    times = backend.subsystem_times()
+    assert times["links"] > sum(times.values())/2
+    assert any(stack.endswith("Link.py:send;test_profiler.py:unknown")
+               for stack in backend.collapsed_stacks())
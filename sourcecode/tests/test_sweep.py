@@ -0,0 +1,63 @@
+import csv
+import json
+
+import pytest
+
+import sweep
+
+CONFIGS = [{"NUMBER_OF_PEERS": 10, "TARGET_NUM_BLOCKS": 2, "TXN_PER_BLOCK": 5, "Z0": 0.3},
+           {"NUMBER_OF_PEERS": 12, "TARGET_NUM_BLOCKS": 2, "TXN_PER_BLOCK": 5, "Z0": 0.7}]
+SEEDS = [1, 2]
+
+
+def deterministic(result: dict) -> dict:
+    '''
+    the result without the measured times
+    '''
+    result = dict(result)
+    result.pop("wall_time")
+    metrics = result.pop("metrics")
+    result["num_events"] = metrics["num_events"]
+    result["event_counts"] = {name: event_type["count"]
+                              for name, event_type in metrics["event_types"].items()}
+    return result
+
+
+@pytest.fixture(scope="module")
+def sweep_results(simulation_module, tmp_path_factory):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # the workers write their log files in the working directory
+        monkeypatch.chdir(tmp_path_factory.mktemp("sweep"))
+        return sweep.run_sweep(CONFIGS, SEEDS, max_workers=1)
+
+
+def test_run_sweep(sweep_results, simulation_module, monkeypatch, tmp_path):
+    assert [(result["config"], result["seed"]) for result in sweep_results] == [
+        (overrides, seed) for overrides in CONFIGS for seed in SEEDS]
+    monkeypatch.chdir(tmp_path)
+    for result in sweep_results:
+        assert deterministic(result) == deterministic(
+            sweep.run_one(result["config"], result["seed"]))
+    # the seed changes the run
+    assert deterministic(sweep_results[0]) != deterministic(sweep_results[1])
+
+
+def test_export_sweep(sweep_results, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    sweep.export_sweep(sweep_results, "sweep")
+    with open("sweep.csv", newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(sweep_results)
+    for row, result in zip(rows, sweep_results):
+        for name, value in result["config"].items():
+            assert row[name] == str(value)
+        assert row["seed"] == str(result["seed"])
+        assert float(row["simulation_time"]) == result["simulation_time"]
+        assert int(row["num_events"]) == result["metrics"]["num_events"]
+    with open("sweep.json") as f:
+        assert json.load(f) == json.loads(json.dumps(sweep_results))
+
+
+def test_expand_grid():
+    assert sweep.expand_grid({"NUMBER_OF_PEERS": [10, 20], "Z0": [0.3]}) == [
+        {"NUMBER_OF_PEERS": 10, "Z0": 0.3}, {"NUMBER_OF_PEERS": 20, "Z0": 0.3}]
@@ -0,0 +1,107 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+import numpy as np
+import pytest
+
+from config import CONFIG
+from DiscreteEventSim import Simulation, Event, EventType
+from workload import TransactionArrivals, INTERARRIVAL_DISTRIBUTIONS
+
+
+class FakePeer:
+    '''
+    peer recording the times of its transactions
+    '''
+
+    def __init__(self, index: int, arrivals: list):
+        self.index = index
+        self.__arrivals = arrivals
+
+    def generate_random_txn(self, time: float):
+        self.__arrivals.append((time, self.index))
+
+    def __str__(self):
+        return f"peer {self.index}"
+
+
+def run_arrivals(num_peers: int, num_transactions: int, seed: int = 1, **kwargs) -> list:
+    '''
+    (time, peer index) of the transactions created by TransactionArrivals
+    '''
+    simulation = Simulation(CONFIG(), seed)
+    arrivals = []
+    peers = [FakePeer(index, arrivals) for index in range(num_peers)]
+    TransactionArrivals(simulation, peers, num_transactions,
+                        mean_interarrival=10, **kwargs).start()
+    assert simulation.event_queue.qsize() <= 1
+    simulation.run()
+    return arrivals
+
+
+def prescheduled_arrivals(num_peers: int, num_transactions: int, seed: int = 1,
+                          distribution: str = "exponential", peer_rates: list[float] = None,
+                          local_peers: set[int] = None) -> list:
+    '''
+    the same arrivals with every TXN_CREATE event enqueued up front
+    '''
+    simulation = Simulation(CONFIG(), seed)
+    stream = simulation.random_streams.arrivals
+    interarrival = INTERARRIVAL_DISTRIBUTIONS[distribution]
+    cumulative_rates = list(accumulate(peer_rates or [1]*num_peers))
+    arrivals = []
+    peers = [FakePeer(index, arrivals) for index in range(num_peers)]
+    time = 0
+    for number in range(num_transactions):
+        if number > 0:
+            time += interarrival(stream, 10)
+        index = bisect_right(cumulative_rates,
+                             stream.random()*cumulative_rates[-1])
+        from_peer = peers[min(index, num_peers-1)]
+        if local_peers is None or from_peer.index in local_peers:
+            simulation.enqueue(Event(EventType.TXN_CREATE, time, time,
+                                     from_peer.generate_random_txn, (time,), "", from_peer))
+    assert simulation.event_queue.qsize() <= num_transactions
+    simulation.run()
+    return arrivals
+
+
+@pytest.mark.parametrize("distribution", ["exponential", "uniform", "constant"])
+def test_mean_interarrival(distribution):
+    arrivals = run_arrivals(5, 20000, distribution=distribution)
+    times = np.array([time for time, _ in arrivals])
+    assert len(times) == 20000 and times[0] == 0
+    intervals = np.diff(times)
+    assert (intervals >= 0).all()
+    assert abs(intervals.mean() - 10) < 0.2
+    if distribution == "constant":
+        assert (intervals == 10).all()
+    if distribution == "uniform":
+        assert intervals.max() <= 20
+
+
+def test_peer_rates():
+    rates = [1, 2, 3, 0, 4]
+    arrivals = run_arrivals(5, 20000, peer_rates=rates)
+    counts = np.bincount([index for _, index in arrivals], minlength=5)
+    assert counts[3] == 0
+    assert np.allclose(counts/len(arrivals), np.array(rates)/sum(rates), atol=0.01)
+    with pytest.raises(ValueError):
+        run_arrivals(5, 10, peer_rates=[1, 2])
+
+
+def test_local_peers():
+    arrivals = run_arrivals(4, 1000, peer_rates=[1, 1, 2, 4])
+    local = run_arrivals(4, 1000, peer_rates=[1, 1, 2, 4], local_peers={0, 2})
+    # the same arrivals as the full run, without the ones of the other peers
+    assert local == [arrival for arrival in arrivals if arrival[1] in {0, 2}]
+    assert run_arrivals(4, 1000, local_peers=set()) == []
+    assert run_arrivals(4, 0) == []
+
+
+@pytest.mark.parametrize("distribution", ["exponential", "uniform", "constant"])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_on_demand_matches_prescheduled(distribution, seed):
+    for kwargs in [{}, {"peer_rates": [3, 1, 0, 2]}, {"local_peers": {1, 3}}]:
+        assert run_arrivals(4, 500, seed, distribution=distribution, **kwargs) == \
+            prescheduled_arrivals(4, 500, seed, distribution, **kwargs)
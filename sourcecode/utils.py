@@ -3,25 +3,17 @@ import random
 import os
 
 
-def generate_random_id(length=4):
+def generate_random_id(length=4, rng: random.Random = random):
     # Define the characters to choose from
     characters = string.ascii_uppercase + \
         string.digits  # You can customize this as needed
 
     # Generate a random 4-character ID
-    random_id = ''.join(random.choice(characters) for _ in range(length))
+    random_id = ''.join(rng.choice(characters) for _ in range(length))
 
     return random_id
 
 
-def expon_distribution(mean: float):
-    '''
-    Generate a random number from exponential distribution with given mean
-    '''
-    sample = random.expovariate(1/mean)
-    return round(sample, 6)
-
-
 def create_directory(directory_path):
     """
     Create a directory if it does not exist.
@@ -61,3 +53,12 @@ def clear_dir(dir):
         os.system(f'rm -r {dir}/*')
     except OSError as e:
         print('unable to clear graph directory', e)
+
+
+def set_state(obj, state: dict):
+    """
+    __setstate__ for classes which override __dict__ (for exporting),
+    unpickling can't update the instance dictionary through it.
+    """
+    for key, value in state.items():
+        setattr(obj, key, value)
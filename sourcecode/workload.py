@@ -0,0 +1,88 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+from DiscreteEventSim import Simulation, Event, EventType
+from logger import LazyDescription
+from random_streams import RandomStream
+
+
+def exponential_interarrival(stream: RandomStream, mean: float) -> float:
+    return stream.expon(mean)
+
+
+def uniform_interarrival(stream: RandomStream, mean: float) -> float:
+    return stream.uniform(0, 2*mean)
+
+
+def constant_interarrival(stream: RandomStream, mean: float) -> float:
+    return mean
+
+
+INTERARRIVAL_DISTRIBUTIONS = {
+    "exponential": exponential_interarrival,
+    "uniform": uniform_interarrival,
+    "constant": constant_interarrival,
+}
+
+
+class TransactionArrivals:
+    '''
+    Arrival process of transactions.
+    Only the next TXN_CREATE event is in the event queue, running it
+    schedules the following one, so the queue does not grow with the number
+    of transactions of the run.
+    The peer of every arrival is chosen in proportion to peer_rates
+    (superposition of the arrival processes of the peers).
+    '''
+
+    def __init__(self, simulation: Simulation, peers: list, num_transactions: int,
+                 mean_interarrival: float, distribution: str = "exponential", peer_rates: list[float] = None,
+                 local_peers: set[int] = None):
+        self.simulation = simulation
+        self.peers = peers
+        self.num_transactions = num_transactions
+        self.num_created = 0
+        self.mean_interarrival = mean_interarrival
+        self.interarrival = INTERARRIVAL_DISTRIBUTIONS[distribution]
+        if peer_rates is None:
+            peer_rates = [1]*len(peers)
+        if len(peer_rates) != len(peers):
+            raise ValueError(
+                f"{len(peer_rates)} transaction rates for {len(peers)} peers")
+        self.cumulative_rates = list(accumulate(peer_rates))
+        self.stream = simulation.random_streams.arrivals
+        # indices of the peers simulated by this process (parallel.py),
+        # the arrivals of the other peers are drawn but not scheduled
+        self.local_peers = local_peers
+
+    def __choose_peer(self):
+        total_rate = self.cumulative_rates[-1]
+        index = bisect_right(self.cumulative_rates,
+                             self.stream.random()*total_rate)
+        return self.peers[min(index, len(self.peers)-1)]
+
+    def __schedule(self, time: float):
+        from_peer = self.__choose_peer()
+        while self.local_peers is not None and from_peer.index not in self.local_peers:
+            self.num_created += 1
+            if self.num_created >= self.num_transactions:
+                return
+            time += self.interarrival(self.stream, self.mean_interarrival)
+            from_peer = self.__choose_peer()
+        new_txn_event = Event(EventType.TXN_CREATE, time,
+                              time, self.arrive, (from_peer, time), LazyDescription("{} create_txn", from_peer), from_peer)
+        self.simulation.enqueue(new_txn_event)
+
+    def start(self, time: float = 0):
+        if self.num_transactions > 0:
+            self.__schedule(time)
+
+    def arrive(self, from_peer, time: float):
+        '''
+        Create the transaction and schedule the next arrival.
+        '''
+        self.num_created += 1
+        if self.num_created < self.num_transactions:
+            self.__schedule(
+                time + self.interarrival(self.stream, self.mean_interarrival))
+        from_peer.generate_random_txn(time)